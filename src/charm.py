@@ -5,91 +5,244 @@
 """Charmed PgBouncer connection pooler."""
 
 import functools
+import hashlib
 import json
 import logging
 import math
 import os
 import socket
+import time
+from collections.abc import Callable
 from configparser import ConfigParser
+from contextlib import contextmanager
 from signal import SIGHUP
-from typing import get_args
+from typing import TYPE_CHECKING, get_args
 
 import lightkube
 import psycopg2
 from charms.data_platform_libs.v0.data_interfaces import DataPeerData, DataPeerUnitData
 from charms.data_platform_libs.v0.data_models import TypedCharmBase
-from charms.grafana_k8s.v0.grafana_dashboard import GrafanaDashboardProvider
-from charms.loki_k8s.v0.loki_push_api import LogProxyConsumer
 from charms.pgbouncer_k8s.v0.pgb import generate_password
-from charms.postgresql_k8s.v0.postgresql import PERMISSIONS_GROUP_ADMIN
-from charms.postgresql_k8s.v0.postgresql_tls import PostgreSQLTLS
-from charms.prometheus_k8s.v0.prometheus_scrape import MetricsEndpointProvider
 from jinja2 import Template
 from ops import (
     ActiveStatus,
     BlockedStatus,
     ConfigChangedEvent,
+    EventBase,
     JujuVersion,
     MaintenanceStatus,
     PebbleReadyEvent,
     Relation,
     SecretRemoveEvent,
+    StoredState,
     WaitingStatus,
     main,
 )
 from ops.pebble import ChangeError, Layer, ServiceStatus
 from ops.pebble import ConnectionError as PebbleConnectionError
-from ops_tracing import Tracing
 from single_kernel_postgresql.compat.postgresql import (
     INVALID_DATABASE_NAME_BLOCKING_MESSAGE,
     INVALID_EXTRA_USER_ROLE_BLOCKING_MESSAGE,
 )
 
-from config import CharmConfig, ServiceType
+from charm_metrics import CharmMetrics
+from config import CharmConfig, ServiceType, parse_isolated_applications
 from constants import (
     APP_SCOPE,
     AUTH_FILE_DATABAG_KEY,
     CFG_FILE_DATABAG_KEY,
+    CHARM_METRICS_FILE,
+    CHARM_METRICS_PORT,
     CLIENT_RELATION_NAME,
     CONTAINER_UNAVAILABLE_MESSAGE,
+    DIRTY_AUTH_FILE,
+    DIRTY_CONFIG,
+    DIRTY_ENDPOINTS,
+    DIRTY_MONITORING,
+    DIRTY_READONLY_DBS,
+    DIRTY_STATUS,
     EXTENSIONS_BLOCKING_MESSAGE,
+    INSTANCE_ADDRESS_PREFIX,
+    ISOLATED_SERVICE_ID_OFFSET,
     K8S_SERVICE_CONNECT_TIMEOUT,
     METRICS_PORT,
     MONITORING_PASSWORD_KEY,
     PEER_RELATION_NAME,
+    PG,
     PG_GROUP,
     PG_USER,
     PGB,
     PGB_DIR,
     PGB_LOG_DIR,
+    READONLY_SERVICE_ID,
+    SATURATED_STATUS_PREFIX,
+    SATURATION_CHECKS,
     SECRET_DELETED_LABEL,
     SECRET_INTERNAL_LABEL,
     SECRET_KEY_OVERRIDES,
+    SERVICE_SETTINGS_DEFAULTS,
     TLS_CA_FILE,
     TLS_CERT_FILE,
     TLS_KEY_FILE,
+    TOO_MANY_ISOLATED_APPLICATIONS_MESSAGE,
+    TOPOLOGY_MODE_ANNOTATION,
     TRACING_RELATION_NAME,
     UNIT_SCOPE,
     WAITING_FOR_K8S_SERVICE_MESSAGE,
+    DirtyState,
     Scopes,
 )
+from instrumentation import (
+    K8S,
+    PEBBLE,
+    PROBES,
+    emit_hook_summary,
+    instrument_hook_tools,
+    reset_hook_summary,
+    trace_io,
+)
+from quotas import Quota, compute_quotas, usage_changed
 from relations.backend_database import BackendDatabaseRequires
+from relations.backend_shards import BackendShards, ShardBackend
 from relations.db import DbProvides
-from relations.peers import Peers
-from relations.pgbouncer_provider import PgBouncerProvider
-from upgrade import PgbouncerUpgrade, get_pgbouncer_k8s_dependencies_model
+from relations.peers import TLS_ENABLED_KEY, Peers
+from relations.pgbouncer_provider import POOL_POLICY_FIELDS, PgBouncerProvider
+
+if TYPE_CHECKING:
+    from charms.grafana_k8s.v0.grafana_dashboard import GrafanaDashboardProvider
+    from charms.loki_k8s.v0.loki_push_api import LogProxyConsumer
+    from charms.postgresql_k8s.v0.postgresql_tls import PostgreSQLTLS
+    from charms.prometheus_k8s.v0.prometheus_scrape import MetricsEndpointProvider
+    from ops_tracing import Tracing
+
+    from upgrade import PgbouncerUpgrade
 
 logger = logging.getLogger(__name__)
 
+# Hooks (and actions) observed by the charm libraries that are imported and constructed on
+# demand, along the hooks that unblock the events they defer, which are only re-emitted once the
+# library is constructed again. Entries ending with a dash are hook name prefixes.
+LAZY_LIBRARY_HOOKS = {
+    "loki_push": ("pgbouncer-pebble-ready", "logging-relation-"),
+    "grafana_dashboards": (
+        "config-changed",
+        "leader-elected",
+        "upgrade-charm",
+        "grafana-dashboard-relation-",
+    ),
+    "metrics_endpoint": ("pgbouncer-pebble-ready", "metrics-endpoint-relation-"),
+    "tls": (
+        "pgbouncer-pebble-ready",
+        "secret-expired",
+        "set-tls-private-key",
+        "certificates-relation-",
+    ),
+    "upgrade": (
+        "pgbouncer-pebble-ready",
+        "pre-upgrade-check",
+        "resume-upgrade",
+        "upgrade-charm",
+        "upgrade-relation-",
+    ),
+    "tracing": ("start", "upgrade-charm", "tracing-relation-"),
+}
+
+
+@contextmanager
+def log_duration(phase: str):
+    """Log how long the wrapped phase took."""
+    start = time.perf_counter()
+    yield
+    logger.info(f"{phase} took {time.perf_counter() - start:.3f}s")
+
+
+def get_pool_sizes(max_db_connections: int, instances: int) -> tuple[int, int, int]:
+    """Returns the default, min and reserve pool sizes of each pgbouncer instance.
+
+    The backend connections allowed to each instance are split in half for the default pool and in
+    a quarter for each of the min and reserve pools. Without a limit, fixed sizes are used.
+    """
+    if max_db_connections == 0:
+        return 20, 10, 10
+    effective_db_connections = max_db_connections / instances
+    return (
+        math.ceil(effective_db_connections / 2),
+        math.ceil(effective_db_connections / 4),
+        math.ceil(effective_db_connections / 4),
+    )
+
+
+def instance_address(service_id: int) -> str:
+    """Loopback address only the given pgbouncer instance listens on."""
+    return f"{INSTANCE_ADDRESS_PREFIX}{service_id + 1}"
+
+
+def service_port_name(port: int) -> str:
+    """Name of the K8s service port of an isolated application."""
+    return f"{PGB}-{port}"
+
+
+def render_pgb_ini(
+    template: Template, service: dict, services: list[dict], base_socket_dir: str, **settings
+) -> str:
+    """Renders the pgbouncer.ini of one of the pgbouncer instances sharing the listen port.
+
+    Args:
+        template: the pgbouncer.ini template.
+        service: the instance to render the config of.
+        services: all the instances, which are configured as peers of each other.
+        base_socket_dir: the unix socket directory of each instance, without the instance id.
+        settings: the rest of the template variables, shared by all the instances.
+    """
+    return template.render(
+        peer_id=service["id"],
+        instance_address=instance_address(service["id"]),
+        socket_dir=service["dir"],
+        base_socket_dir=base_socket_dir,
+        peers=[peer["id"] for peer in services],
+        log_file=f"{service['log_dir']}/pgbouncer.log",
+        pid_file=f"{service['dir']}/pgbouncer.pid",
+        **settings,
+    )
+
+
+def dispatched_hook() -> str | None:
+    """Name of the hook or action Juju dispatched, if any."""
+    dispatch_path = os.environ.get("JUJU_DISPATCH_PATH")
+    return os.path.basename(dispatch_path) if dispatch_path else None
+
 
 @functools.cache
 def get_pod(unit_name: str, model_name: str) -> lightkube.resources.core_v1.Pod:
     """Get the pod for the provided unit name."""
     lightkube_client = lightkube.Client()
-    return lightkube_client.get(
-        res=lightkube.resources.core_v1.Pod,
-        name=unit_name.replace("/", "-"),
-        namespace=model_name,
+    pod_name = unit_name.replace("/", "-")
+    with trace_io(K8S, "get", **{"k8s.resource": "Pod", "k8s.name": pod_name}):
+        return lightkube_client.get(
+            res=lightkube.resources.core_v1.Pod,
+            name=pod_name,
+            namespace=model_name,
+        )
+
+
+def backend_hosts(endpoint: str, read_only_endpoints: set[str]) -> tuple[str, str, str, str]:
+    """The primary host and port of a backend cluster, and the replica hosts and port.
+
+    The primary stands for the replicas if there are none.
+    """
+    host, port = endpoint.split(":")
+    if not read_only_endpoints:
+        return host, port, host, port
+    r_hosts = ",".join(sorted(r_host.split(":")[0] for r_host in read_only_endpoints))
+    r_port = next(iter(read_only_endpoints)).split(":")[1]
+    return host, port, r_hosts, r_port
+
+
+def is_pod_ready(pod: lightkube.resources.core_v1.Pod) -> bool:
+    """Whether the pod passes its readiness checks, so that services route to it."""
+    return any(
+        condition.type == "Ready" and condition.status == "True"
+        for condition in (pod.status and pod.status.conditions) or []
     )
 
 
@@ -98,11 +251,12 @@ def get_node(unit_name: str, model_name: str) -> lightkube.resources.core_v1.Nod
     """Return the node for the provided unit name."""
     node_name = get_pod(unit_name, model_name).spec.nodeName
     lightkube_client = lightkube.Client()
-    return lightkube_client.get(
-        res=lightkube.resources.core_v1.Node,
-        name=node_name,
-        namespace=model_name,
-    )
+    with trace_io(K8S, "get", **{"k8s.resource": "Node", "k8s.name": node_name}):
+        return lightkube_client.get(
+            res=lightkube.resources.core_v1.Node,
+            name=node_name,
+            namespace=model_name,
+        )
 
 
 class PgBouncerK8sCharm(TypedCharmBase):
@@ -110,8 +264,26 @@ class PgBouncerK8sCharm(TypedCharmBase):
 
     config_type = CharmConfig
 
+    _stored = StoredState()
+
     def __init__(self, *args):
         super().__init__(*args)
+        self._dispatch_started = time.perf_counter()
+        reset_hook_summary()
+        instrument_hook_tools(self.framework.model._backend)
+
+        # Workload state to reconcile at the end of the dispatch. Kept in stored state only if
+        # the workload could not be reached, so that the next dispatch retries.
+        self._stored.set_default(
+            dirty=[],
+            config_hash="",
+            tls_hash="",
+            load_message="",
+            waiting_checks=0,
+        )
+        self._dirty: set[DirtyState] = set()
+        self._monitoring_enabled: bool | None = None
+        self._pool_load: dict | None = None
 
         self._namespace = self.model.name
         self.peer_relation_app = DataPeerData(
@@ -131,23 +303,78 @@ class PgBouncerK8sCharm(TypedCharmBase):
         self.framework.observe(self.on.pgbouncer_pebble_ready, self._on_pgbouncer_pebble_ready)
         self.framework.observe(self.on.update_status, self._on_update_status)
         self.framework.observe(self.on.secret_remove, self._on_secret_remove)
+        self.framework.observe(self.framework.on.pre_commit, self._on_pre_commit)
 
+        self.charm_metrics = CharmMetrics(self)
         self.peers = Peers(self)
         self.backend = BackendDatabaseRequires(self)
+        self.backend_shards = BackendShards(self)
         self.client_relation = PgBouncerProvider(self)
         self.legacy_db_relation = DbProvides(self, admin=False)
         self.legacy_db_admin_relation = DbProvides(self, admin=True)
 
         self.k8s_service_name = f"{self.app.name}-service"
-        unit_name = self.unit.name.replace("/", "-")
+        self.k8s_readonly_service_name = f"{self.app.name}-readonly-service"
+
+        self._cores = max(min(os.cpu_count(), 4), 2)
+        self._services = [
+            {
+                "name": f"{PGB}_{service_id}",
+                "id": service_id,
+                "dir": f"{PGB_DIR}/instance_{service_id}",
+                "ini_path": f"{PGB_DIR}/instance_{service_id}/pgbouncer.ini",
+                "log_dir": f"{PGB_LOG_DIR}/instance_{service_id}",
+            }
+            for service_id in range(self._cores)
+        ]
+        self._metrics_service = "metrics_server"
+        self._charm_metrics_service = "charm_metrics_server"
+        self._construct_dispatch_libraries()
+
+        self.INSUFFICIENT_PERMISSIONS_MESSAGE = (
+            f"Insufficient permissions, try: `juju trust {self.app.name} --scope=cluster`"
+        )
+
+    def _construct_dispatch_libraries(self) -> None:
+        """Construct the on-demand charm libraries that observe the dispatched event.
+
+        The libraries are otherwise constructed on first use. Outside of a Juju dispatch (e.g. in
+        unit tests) every library is constructed.
+        """
+        for library in LAZY_LIBRARY_HOOKS:
+            if self._dispatched_for(library):
+                getattr(self, library)
+
+    @staticmethod
+    def _dispatched_for(library: str) -> bool:
+        """Whether the dispatched hook is one of the library, always outside of a dispatch."""
+        if (hook := dispatched_hook()) is None:
+            return True
+        return any(
+            hook == name or (name.endswith("-") and hook.startswith(name))
+            for name in LAZY_LIBRARY_HOOKS[library]
+        )
+
+    @functools.cached_property
+    def lightkube_client(self) -> lightkube.Client:
+        """Kubernetes API client."""
+        return lightkube.Client()
 
-        self.tls = PostgreSQLTLS(
+    @functools.cached_property
+    def tls(self) -> "PostgreSQLTLS":
+        """TLS certificates relation manager."""
+        from charms.postgresql_k8s.v0.postgresql_tls import PostgreSQLTLS
+
+        unit_name = self.unit.name.replace("/", "-")
+        return PostgreSQLTLS(
             self,
             PEER_RELATION_NAME,
             [
                 self.unit_pod_hostname,
                 self.k8s_service_name,
                 f"{self.k8s_service_name}.{self.model.name}.svc.cluster.local",
+                self.k8s_readonly_service_name,
+                f"{self.k8s_readonly_service_name}.{self.model.name}.svc.cluster.local",
                 unit_name,
                 f"{unit_name}.{self.app.name}-endpoints.{self.model.name}.svc.cluster.local",
                 self.app.name,
@@ -159,51 +386,72 @@ class PgBouncerK8sCharm(TypedCharmBase):
             ],
         )
 
-        self._cores = max(min(os.cpu_count(), 4), 2)
-        self._services = [
-            {
-                "name": f"{PGB}_{service_id}",
-                "id": service_id,
-                "dir": f"{PGB_DIR}/instance_{service_id}",
-                "ini_path": f"{PGB_DIR}/instance_{service_id}/pgbouncer.ini",
-                "log_dir": f"{PGB_LOG_DIR}/instance_{service_id}",
-            }
-            for service_id in range(self._cores)
-        ]
-        self._metrics_service = "metrics_server"
-        self.grafana_dashboards = GrafanaDashboardProvider(self)
-        self.metrics_endpoint = MetricsEndpointProvider(
-            self,
-            jobs=[{"static_configs": [{"targets": [f"*:{METRICS_PORT}"]}]}],
-        )
-        self.loki_push = LogProxyConsumer(
+    @functools.cached_property
+    def grafana_dashboards(self) -> "GrafanaDashboardProvider":
+        """Grafana dashboard relation provider."""
+        from charms.grafana_k8s.v0.grafana_dashboard import GrafanaDashboardProvider
+
+        return GrafanaDashboardProvider(self)
+
+    @functools.cached_property
+    def metrics_endpoint(self) -> "MetricsEndpointProvider":
+        """Prometheus scrape relation provider."""
+        from charms.prometheus_k8s.v0.prometheus_scrape import MetricsEndpointProvider
+
+        return MetricsEndpointProvider(self, jobs=self._scrape_jobs())
+
+    def _scrape_jobs(self) -> list[dict]:
+        """Prometheus scrape jobs, of the charm metrics only if the workload can serve them."""
+        jobs = [{"static_configs": [{"targets": [f"*:{METRICS_PORT}"]}]}]
+        if self.charm_metrics.server_available:
+            jobs.append({
+                "job_name": "charm",
+                "metrics_path": f"/{CHARM_METRICS_FILE}",
+                "static_configs": [{"targets": [f"*:{CHARM_METRICS_PORT}"]}],
+            })
+        return jobs
+
+    @functools.cached_property
+    def loki_push(self) -> "LogProxyConsumer":
+        """Loki log forwarding relation consumer."""
+        from charms.loki_k8s.v0.loki_push_api import LogProxyConsumer
+
+        return LogProxyConsumer(
             self,
             log_files=[f"{service['log_dir']}/pgbouncer.log" for service in self._services],
             relation_name="logging",
             container_name="pgbouncer",
         )
 
-        self.upgrade = PgbouncerUpgrade(
+    @functools.cached_property
+    def upgrade(self) -> "PgbouncerUpgrade":
+        """In-place upgrades manager."""
+        from upgrade import PgbouncerUpgrade, get_pgbouncer_k8s_dependencies_model
+
+        return PgbouncerUpgrade(
             self,
             model=get_pgbouncer_k8s_dependencies_model(),
             relation_name="upgrade",
             substrate="k8s",
         )
-        self.tracing = Tracing(self, tracing_relation_name=TRACING_RELATION_NAME)
 
-        self.lightkube_client = lightkube.Client()
-        self.INSUFFICIENT_PERMISSIONS_MESSAGE = (
-            f"Insufficient permissions, try: `juju trust {self.app.name} --scope=cluster`"
-        )
+    @functools.cached_property
+    def tracing(self) -> "Tracing":
+        """Tracing relation manager."""
+        from ops_tracing import Tracing
 
-    def get_service(self) -> lightkube.resources.core_v1.Service | None:
-        """Get the managed k8s service."""
+        return Tracing(self, tracing_relation_name=TRACING_RELATION_NAME)
+
+    def get_service(self, name: str | None = None) -> lightkube.resources.core_v1.Service | None:
+        """Get a managed k8s service, the main one if no name is given."""
+        name = name or self.k8s_service_name
         try:
-            service = self.lightkube_client.get(
-                res=lightkube.resources.core_v1.Service,
-                name=self.k8s_service_name,
-                namespace=self.model.name,
-            )
+            with trace_io(K8S, "get", **{"k8s.resource": "Service", "k8s.name": name}):
+                service = self.lightkube_client.get(
+                    res=lightkube.resources.core_v1.Service,
+                    name=name,
+                    namespace=self.model.name,
+                )
         except lightkube.core.exceptions.ApiError as e:
             if e.status.code == 404:
                 return None
@@ -211,12 +459,85 @@ class PgBouncerK8sCharm(TypedCharmBase):
 
         return service
 
+    def mark_dirty(self, *states: DirtyState, monitoring_enabled: bool | None = None) -> None:
+        """Mark workload state to be reconciled once, at the end of the current dispatch.
+
+        Args:
+            states: the workload state to reconcile.
+            monitoring_enabled: the desired state of the monitoring service. If not set, the
+                monitoring service is enabled when the backend is ready.
+        """
+        self._dirty.update(states)
+        if monitoring_enabled is not None:
+            self._dirty.add(DIRTY_MONITORING)
+            self._monitoring_enabled = monitoring_enabled
+
+    def _on_pre_commit(self, _) -> None:
+        self.reconcile()
+        hook = dispatched_hook()
+        emit_hook_summary(hook or "unknown", self._dispatch_started)
+        self.charm_metrics.write(hook, self._dispatch_started)
+
+    def defer(self, event: EventBase) -> None:
+        """Defer the event to a later hook, counting it in the charm metrics."""
+        self.charm_metrics.record_deferral()
+        event.defer()
+
+    def reconcile(self) -> None:
+        """Apply the workload state marked dirty by the handlers that ran in this dispatch.
+
+        Handlers only mark what needs to change, so the auth file, config and monitoring layer
+        are written at most once per dispatch, regardless of how many events ran.
+        """
+        dirty = self._dirty | set(self._stored.dirty)
+        self._dirty = set()
+        if not dirty:
+            return
+
+        logger.debug(f"Reconciling {sorted(dirty)}")
+        if DIRTY_READONLY_DBS in dirty and self._collect_readonly_dbs():
+            dirty.add(DIRTY_CONFIG)
+        try:
+            config_rendered = self._reconcile_workload(dirty)
+        except PebbleConnectionError:
+            logger.warning("Workload not reachable, reconciling again in the next hook")
+            self._stored.dirty = sorted(dirty)
+            return
+        self._stored.dirty = []
+        self._monitoring_enabled = None
+        if config_rendered:
+            # Only ack the config once the workload runs it, so the leader doesn't onboard
+            # relations that this unit can't serve yet
+            self.peers.ack_config_rendered()
+
+        if DIRTY_ENDPOINTS in dirty:
+            self.update_client_connection_info()
+        if DIRTY_STATUS in dirty:
+            self.update_status()
+
+    def _reconcile_workload(self, dirty: set[DirtyState]) -> bool:
+        """Write the dirty workload files and layers, returning whether the config was rendered."""
+        config_rendered = False
+        if DIRTY_AUTH_FILE in dirty:
+            self.render_auth_file()
+        if DIRTY_CONFIG in dirty:
+            config_rendered = self.render_pgb_config()
+        if DIRTY_MONITORING in dirty:
+            if self._monitoring_enabled is None:
+                self._monitoring_enabled = self.backend.ready
+            self.toggle_monitoring_layer(self._monitoring_enabled)
+        return config_rendered
+
     # =======================
     #  Charm Lifecycle Hooks
     # =======================
 
     def reconcile_k8s_service(self, port_changed: bool = False) -> bool:
-        """Create or delete a nodeport service for external node connectivity."""
+        """Create or delete a nodeport service for external node connectivity.
+
+        The dedicated read-only listener gets a service of its own, of the same type, which is
+        deleted when the listener is disabled.
+        """
         expose_external = self.config.expose_external
         try:
             desired_service_type = ServiceType(expose_external)
@@ -230,6 +551,20 @@ class PgBouncerK8sCharm(TypedCharmBase):
         if not port_changed and service_exists and service.spec.type == desired_service_type.name:
             return True
 
+        ports = [
+            lightkube.models.core_v1.ServicePort(
+                name="pgbouncer",
+                port=self.config.listen_port,
+                targetPort=self.config.listen_port,
+            ),
+        ]
+        ports.extend(
+            lightkube.models.core_v1.ServicePort(
+                name=service_port_name(group["port"]), port=group["port"], targetPort=group["port"]
+            )
+            for group in self.isolated_groups()
+        )
+
         pod0 = get_pod(self.unit.name, self.model.name)
 
         annotations = (
@@ -237,31 +572,41 @@ class PgBouncerK8sCharm(TypedCharmBase):
             if desired_service_type == ServiceType("loadbalancer")
             else {}
         )
-
-        desired_service = lightkube.resources.core_v1.Service(
-            metadata=lightkube.models.meta_v1.ObjectMeta(
-                name=self.k8s_service_name,
-                namespace=self.model.name,
-                ownerReferences=pod0.metadata.ownerReferences,  # the stateful set
-                labels={"app.kubernetes.io/name": self.app.name},
-                annotations=annotations,
-            ),
-            spec=lightkube.models.core_v1.ServiceSpec(
-                ports=[
-                    lightkube.models.core_v1.ServicePort(
-                        name="pgbouncer",
-                        port=self.config.listen_port,
-                        targetPort=self.config.listen_port,
-                    ),
-                ],
-                type=desired_service_type.name,
-                selector={"app.kubernetes.io/name": self.app.name},
-            ),
-        )
+        external_traffic_policy = None
+        if self.config.topology_aware_routing:
+            # Zone hints for the traffic from within the cluster
+            annotations = {TOPOLOGY_MODE_ANNOTATION: "Auto", **annotations}
+            if desired_service_type != ServiceType.ClusterIP:
+                # Nodes only forward external traffic to their own units, and load balancers
+                # health check the nodes through the health check node port K8s allocates
+                external_traffic_policy = "Local"
+
+        def desired_service(name: str, ports: list) -> lightkube.resources.core_v1.Service:
+            return lightkube.resources.core_v1.Service(
+                metadata=lightkube.models.meta_v1.ObjectMeta(
+                    name=name,
+                    namespace=self.model.name,
+                    ownerReferences=pod0.metadata.ownerReferences,  # the stateful set
+                    labels={"app.kubernetes.io/name": self.app.name},
+                    annotations=annotations,
+                ),
+                spec=lightkube.models.core_v1.ServiceSpec(
+                    ports=ports,
+                    type=desired_service_type.name,
+                    selector={"app.kubernetes.io/name": self.app.name},
+                    externalTrafficPolicy=external_traffic_policy,
+                ),
+            )
 
         logger.info(f"Creating desired service {desired_service_type=}")
         try:
-            self.lightkube_client.apply(desired_service, field_manager=self.app.name)
+            self._reconcile_k8s_readonly_service(desired_service)
+            with trace_io(
+                K8S, "apply", **{"k8s.resource": "Service", "k8s.name": self.k8s_service_name}
+            ):
+                self.lightkube_client.apply(
+                    desired_service(self.k8s_service_name, ports), field_manager=self.app.name
+                )
         except lightkube.ApiError as e:
             if e.status.code == 403:
                 self.on_deployed_without_trust()
@@ -276,6 +621,30 @@ class PgBouncerK8sCharm(TypedCharmBase):
 
         return True
 
+    def _reconcile_k8s_readonly_service(
+        self, desired_service: Callable[[str, list], lightkube.resources.core_v1.Service]
+    ) -> None:
+        """Apply the service of the dedicated read-only listener, or delete it if disabled."""
+        name = self.k8s_readonly_service_name
+        if not (readonly := self.readonly_service()):
+            try:
+                with trace_io(K8S, "delete", **{"k8s.resource": "Service", "k8s.name": name}):
+                    self.lightkube_client.delete(
+                        lightkube.resources.core_v1.Service, name=name, namespace=self.model.name
+                    )
+            except lightkube.ApiError as e:
+                if e.status.code != 404:
+                    raise
+            return
+
+        port = lightkube.models.core_v1.ServicePort(
+            name=service_port_name(readonly["port"]),
+            port=readonly["port"],
+            targetPort=readonly["port"],
+        )
+        with trace_io(K8S, "apply", **{"k8s.resource": "Service", "k8s.name": name}):
+            self.lightkube_client.apply(desired_service(name, [port]), field_manager=self.app.name)
+
     @property
     def version(self) -> str:
         """Returns the version Pgbouncer."""
@@ -296,7 +665,7 @@ class PgBouncerK8sCharm(TypedCharmBase):
         """Helper method to initialise the configuration file and directories."""
         # Initialise filesystem - _push_file()'s make_dirs option sets the permissions for those
         # dirs to root, so we build them ourselves to control permissions.
-        for service in self._services:
+        for service in self._pgb_services:
             if not container.exists(service["dir"]):
                 container.make_dir(
                     service["dir"],
@@ -315,10 +684,13 @@ class PgBouncerK8sCharm(TypedCharmBase):
         # Render the logrotate config
         with open("templates/logrotate.j2") as file:
             template = Template(file.read())
-        container.push(
-            "/etc/logrotate.d/pgbouncer",
-            template.render(service_ids=range(self._cores)),
+        logrotate = template.render(
+            service_names=[service["name"] for service in self._pgb_services]
         )
+        with trace_io(
+            PEBBLE, "push", **{"file.path": "/etc/logrotate.d/pgbouncer", "bytes": len(logrotate)}
+        ):
+            container.push("/etc/logrotate.d/pgbouncer", logrotate)
         return True
 
     @property
@@ -331,6 +703,9 @@ class PgBouncerK8sCharm(TypedCharmBase):
     def _on_pgbouncer_pebble_ready(self, event: PebbleReadyEvent) -> None:
         """Define and start pgbouncer workload.
 
+        The auth file, TLS files and config files are staged before the pebble layer is added, so
+        that the services start serving with the current config on the first attempt.
+
         Deferrals:
             - If checking pgb running raises an error, implying that the pgbouncer services are not
               yet accessible in the container.
@@ -338,28 +713,41 @@ class PgBouncerK8sCharm(TypedCharmBase):
         """
         container = event.workload
 
-        if not self.peers.relation or not self._init_config(container):
-            event.defer()
-            return
+        with log_duration("pebble-ready: init filesystem"):
+            if not self.peers.relation or not self._init_config(container):
+                self.defer(event)
+                return
         self.peers.unit_databag["userlist_nonce"] = generate_password()
 
-        self.render_auth_file()
-
-        # in case of pod restart
-        if all(self.tls.get_tls_files()):
-            self.push_tls_files_to_workload(False)
-
-        pebble_layer = self._pgbouncer_layer()
-        container.add_layer(PGB, pebble_layer, combine=True)
-        # Initial start will fail because transient files are not rendered yet
-        self.render_pgb_config()
-        container.replan()
-
-        self.update_status()
-
-        self.unit.set_workload_version(self.version)
-
-        self.peers.unit_databag["container_initialised"] = "True"
+        with log_duration("pebble-ready: stage files"):
+            self.render_auth_file()
+            # in case of pod restart
+            if all(self.get_tls_files()):
+                self.push_tls_files_to_workload(False)
+            # The container may have been recreated, so the files have to be pushed again
+            self._stored.config_hash = ""
+            config_staged = self.configuration_check()
+            if config_staged:
+                self._push_pgb_config(self._render_pgb_config_files())
+
+        with log_duration("pebble-ready: start services"):
+            if self.charm_metrics.check_server(container):
+                self.metrics_endpoint.update_scrape_job_spec(self._scrape_jobs())
+            layer = self._pgbouncer_layer(charm_metrics_server=self.charm_metrics.server_available)
+            container.add_layer(PGB, layer, combine=True)
+            with trace_io(PEBBLE, "replan"):
+                container.replan()
+
+        with log_duration("pebble-ready: update status"):
+            self.update_status()
+            self.unit.set_workload_version(self.version)
+
+        self.peers.update_unit_databag({"container_initialised": "True"})
+        if config_staged:
+            self.peers.ack_config_rendered()
+        else:
+            # The next peer change has to render the config
+            self.peers.reset_config_inputs()
 
     @property
     def is_container_ready(self) -> bool:
@@ -378,27 +766,48 @@ class PgBouncerK8sCharm(TypedCharmBase):
         """
         if not self.is_container_ready:
             logger.debug("_on_config_changed deferred: container not ready")
-            event.defer()
+            self.defer(event)
             return
 
         if not self.configuration_check():
             return
 
-        old_port = self.peers.app_databag.get("current_port")
-        port_changed = old_port != str(self.config.listen_port)
+        app_databag = self.peers.app_databag or {}
+        changed_ports = {
+            key: value
+            for key, value in self._service_settings().items()
+            if app_databag.get(key, SERVICE_SETTINGS_DEFAULTS[key]) != value
+        }
+        port_changed = "current_port" in changed_ports
 
-        if self.unit.is_leader() and not self.reconcile_k8s_service(port_changed=port_changed):
+        if self.unit.is_leader() and not self.reconcile_k8s_service(
+            port_changed=bool(changed_ports)
+        ):
             return
 
         if self.is_container_ready:
             try:
+                self._reconcile_dedicated_services()
                 self.render_pgb_config(restart=port_changed)
+                if "current_readonly_port" in changed_ports and not port_changed:
+                    self._restart_readonly_service(
+                        app_databag.get("current_readonly_port", "0") != "0"
+                    )
+                if "current_isolated_ports" in changed_ports and not port_changed:
+                    self._restart_isolated_services(
+                        json.loads(
+                            app_databag.get(
+                                "current_isolated_ports",
+                                SERVICE_SETTINGS_DEFAULTS["current_isolated_ports"],
+                            )
+                        )
+                    )
             except PebbleConnectionError:
-                event.defer()
+                self.defer(event)
 
-        if self.unit.is_leader() and port_changed:
+        if self.unit.is_leader() and changed_ports:
             # Only update the config once the services have been restarted
-            self.peers.app_databag["current_port"] = str(self.config.listen_port)
+            self.peers.app_databag.update(changed_ports)
 
         self.update_status()
         if self.unit.is_leader() and self.backend.postgres and self.check_service_connectivity():
@@ -421,7 +830,7 @@ class PgBouncerK8sCharm(TypedCharmBase):
         logger.debug(f"Removing secret with label {event.secret.label} revision {event.revision}")
         event.remove_revision()
 
-    def _pgbouncer_layer(self) -> Layer:
+    def _pgbouncer_layer(self, charm_metrics_server: bool = False) -> Layer:
         """Returns a default pebble config layer for the pgbouncer container.
 
         Since PgBouncer is single-threaded, we auto-generate multiple pgbouncer services to make
@@ -433,6 +842,10 @@ class PgBouncerK8sCharm(TypedCharmBase):
         When viewing logs (including exporting them to COS), use the pebble service logs, rather
         than viewing individual logfiles.
 
+        Args:
+            charm_metrics_server: whether to serve the charm metrics file, which needs python in
+                the workload image.
+
         Returns:
             A pebble configuration layer for as many charm services as there are available CPU
             cores
@@ -444,28 +857,124 @@ class PgBouncerK8sCharm(TypedCharmBase):
                 "backoff-delay": "24h",
                 "backoff-factor": 1,
                 "override": "replace",
-                "after": [service["name"] for service in self._services],
+                "after": [service["name"] for service in self._pgb_services],
             },
             self._metrics_service: self._generate_monitoring_service(self.backend.postgres),
         }
-        for service in self._services:
-            pebble_services[service["name"]] = {
-                "summary": f"pgbouncer service {service['id']}",
-                "user": PG_USER,
-                "group": PG_GROUP,
-                # -R flag reuses sockets on restart
-                "command": f"pgbouncer {service['ini_path']}",
-                "startup": "enabled",
-                "override": "replace",
-            }
+        for service in self._pgb_services:
+            pebble_services[service["name"]] = self._pgbouncer_service(service)
+        if charm_metrics_server:
+            pebble_services[self._charm_metrics_service] = CharmMetrics.server_service()
         return Layer({
             "summary": "pgbouncer layer",
             "description": "pebble config layer for pgbouncer",
             "services": pebble_services,
         })
 
+    @staticmethod
+    def _pgbouncer_service(service: dict, enabled: bool = True) -> dict:
+        """Pebble service running one pgbouncer instance."""
+        summary = f"pgbouncer service {service['id']}"
+        if application := service.get("application"):
+            summary = f"pgbouncer service isolating {application}"
+        elif service["id"] == READONLY_SERVICE_ID:
+            summary = "pgbouncer read-only service"
+        return {
+            "summary": summary,
+            "user": PG_USER,
+            "group": PG_GROUP,
+            # -R flag reuses sockets on restart
+            "command": f"pgbouncer {service['ini_path']}",
+            "startup": "enabled" if enabled else "disabled",
+            "override": "replace",
+        }
+
+    def _reconcile_dedicated_services(self) -> None:
+        """Start the newly configured dedicated services, and stop the obsolete ones.
+
+        Dedicated services are those of the isolated applications and of the read-only listener.
+        The config of a new service is pushed before it's started; the config of the other
+        services is rendered and reloaded afterwards, as usual.
+        """
+        container = self.unit.get_container(PGB)
+        groups = {group["name"]: group for group in self.dedicated_services()}
+        plan = container.get_plan().services
+        enabled = {
+            name
+            for name, service in plan.items()
+            if (name.startswith(f"{PGB}_isolated_") or name == f"{PGB}_readonly")
+            and service.startup == "enabled"
+        }
+        if enabled == set(groups):
+            return
+
+        logger.info(f"Dedicated pgbouncer services changing from {enabled} to {set(groups)}")
+        self._init_config(container)
+        rendered = self._render_pgb_config_files()
+        for name in set(groups) - enabled:
+            self.push_file(groups[name]["ini_path"], rendered[groups[name]["ini_path"]], 0o400)
+
+        services = {name: self._pgbouncer_service(group) for name, group in groups.items()}
+        for name in enabled - set(groups):
+            services[name] = {
+                **plan[name].to_dict(),
+                "override": "replace",
+                "startup": "disabled",
+            }
+        container.add_layer(PGB, Layer({"services": services}), combine=True)
+        if obsolete := enabled - set(groups):
+            with trace_io(PEBBLE, "stop", services=sorted(obsolete)):
+                container.stop(*obsolete)
+        with trace_io(PEBBLE, "replan"):
+            container.replan()
+
+    def _service_settings(self) -> dict[str, str]:
+        """The K8s service settings, under the app databag keys they're last applied to."""
+        return {
+            "current_port": str(self.config.listen_port),
+            "current_isolated_ports": json.dumps({
+                group["application"]: group["port"] for group in self.isolated_groups()
+            }),
+            "current_readonly_port": str(self.config.readonly_listen_port),
+            "current_topology_aware_routing": str(self.config.topology_aware_routing),
+        }
+
+    def _restart_readonly_service(self, was_enabled: bool) -> None:
+        """Restart the read-only service, as pgbouncer only binds its listen port on start.
+
+        Args:
+            was_enabled: whether the service was running before, as a newly enabled one was
+                just started on the new port.
+        """
+        if not was_enabled or not (readonly := self.readonly_service()):
+            return
+        with trace_io(PEBBLE, "restart", service=readonly["name"]):
+            self.unit.get_container(PGB).restart(readonly["name"])
+        self.charm_metrics.record_restart()
+
+    def _restart_isolated_services(self, previous_ports: dict[str, int]) -> None:
+        """Restart the isolated services whose port moved, as pgbouncer only binds it on start.
+
+        Removing or reordering isolated applications shifts the port and instance id of the
+        later ones.
+
+        Args:
+            previous_ports: the port of each isolated application before the config change. The
+                services of new applications were just started on their port.
+        """
+        container = self.unit.get_container(PGB)
+        for group in self.isolated_groups():
+            previous = previous_ports.get(group["application"])
+            if previous is None or previous == group["port"]:
+                continue
+            with trace_io(PEBBLE, "restart", service=group["name"]):
+                container.restart(group["name"])
+            self.charm_metrics.record_restart()
+
     def _get_readonly_dbs(self, databases: dict) -> dict[str, str]:
         readonly_dbs = {}
+        if self.config.autodb_mode:
+            return readonly_dbs
         if self.backend.relation and "*" in databases:
             read_only_endpoints = self.backend.get_read_only_endpoints()
             sorted_rhosts = [r_host.split(":")[0] for r_host in read_only_endpoints]
@@ -476,8 +985,14 @@ class PgBouncerK8sCharm(TypedCharmBase):
                     r_port = r_host.split(":")[1]
                     break
 
+                # The relation databases have aliases of their own
+                relation_dbs = {
+                    database["name"] for database in self.get_relation_databases().values()
+                }
                 backend_databases = json.loads(self.peers.app_databag.get("readonly_dbs", "[]"))
                 for name in backend_databases:
+                    if name in relation_dbs:
+                        continue
                     readonly_dbs[f"{name}_readonly"] = {
                         "host": r_hosts,
                         "dbname": name,
@@ -487,24 +1002,42 @@ class PgBouncerK8sCharm(TypedCharmBase):
                     }
         return readonly_dbs
 
-    def _collect_readonly_dbs(self) -> None:
-        if self.unit.is_leader() and self.backend.postgres:
-            existing_dbs = [db["name"] for db in self.get_relation_databases().values()]
-            existing_dbs += ["postgres", "pgbouncer"]
-            try:
-                with (
-                    self.backend.postgres._connect_to_database(PGB) as conn,
-                    conn.cursor() as cursor,
-                ):
-                    cursor.execute("SELECT datname FROM pg_database WHERE datistemplate = false;")
-                    results = cursor.fetchall()
-                conn.close()
-            except psycopg2.Error:
-                logger.warning("PostgreSQL connection failed")
-                return
-            readonly_dbs = [db[0] for db in results if db and db[0] not in existing_dbs]
-            readonly_dbs.sort()
-            self.peers.app_databag["readonly_dbs"] = json.dumps(readonly_dbs)
+    def _collect_readonly_dbs(self) -> bool:
+        """Refresh the backend databases given read-only aliases along the wildcard database.
+
+        Marked dirty by the events that can create databases, and polled on update-status for
+        those created by clients through the wildcard. The backend is only queried while there
+        is a wildcard database, and the peer databag only written when the databases changed.
+
+        Returns:
+            Whether the databases changed.
+        """
+        if not self.unit.is_leader():
+            return False
+        if self.config.autodb_mode:
+            # The databases are served through the wildcard, with no need to enumerate them
+            if "readonly_dbs" in self.peers.app_databag:
+                del self.peers.app_databag["readonly_dbs"]
+                return True
+            return False
+        if "*" not in self.get_relation_databases() or not self.backend.postgres:
+            return False
+        try:
+            with (
+                self.backend.postgres._connect_to_database(PGB) as conn,
+                conn.cursor() as cursor,
+            ):
+                cursor.execute("SELECT datname FROM pg_database WHERE datistemplate = false;")
+                results = cursor.fetchall()
+            conn.close()
+        except psycopg2.Error:
+            logger.warning("PostgreSQL connection failed")
+            return False
+        readonly_dbs = json.dumps(sorted(db[0] for db in results if db and db[0] not in (PG, PGB)))
+        if readonly_dbs == self.peers.app_databag.get("readonly_dbs"):
+            return False
+        self.peers.app_databag["readonly_dbs"] = readonly_dbs
+        return True
 
     def _on_update_status(self, _) -> None:
         """Update Status hook.
@@ -512,9 +1045,13 @@ class PgBouncerK8sCharm(TypedCharmBase):
         Sets BlockedStatus if we have no backend database; if we can't connect to a backend, this
         charm serves no purpose.
         """
-        self.update_status()
+        self.update_status(refresh_load=True)
 
-        self._collect_readonly_dbs()
+        self.rebalance_user_quotas()
+
+        self.complete_pending_onboarding()
+
+        self.mark_dirty(DIRTY_READONLY_DBS)
 
         # Update relation connection information. This is necessary because we don't receive any
         # information when the leader is removed, but we still need to have up-to-date connection
@@ -527,8 +1064,11 @@ class PgBouncerK8sCharm(TypedCharmBase):
         try:
             _ = self.config
             return True
-        except ValueError:
-            self.unit.status = BlockedStatus("Configuration Error. Please check the logs")
+        except ValueError as e:
+            message = "Please check the logs"
+            if TOO_MANY_ISOLATED_APPLICATIONS_MESSAGE in str(e):
+                message = TOO_MANY_ISOLATED_APPLICATIONS_MESSAGE
+            self.unit.status = BlockedStatus(f"Configuration Error. {message}")
             logger.exception("Invalid configuration")
             return False
 
@@ -541,38 +1081,56 @@ class PgBouncerK8sCharm(TypedCharmBase):
                     return address.address
 
     def get_node_hosts(self) -> set[str]:
-        """Return the node ports of nodes where units of this app are scheduled."""
+        """Return the node ports of nodes where units of this app are scheduled.
+
+        With topology-aware routing, nodes only forward to their own units, so the nodes of
+        the units that aren't ready are left out.
+        """
         peer_relation = self.model.get_relation(PEER_RELATION_NAME)
         if not peer_relation:
             return set()
 
         hosts = set()
         for unit in peer_relation.units | {self.model.unit}:
+            if self.config.topology_aware_routing and not is_pod_ready(
+                get_pod(unit.name, self.model.name)
+            ):
+                continue
             node = get_node(unit.name, self.model.name)
             hosts.add(self._get_node_address(node))
         return hosts
 
-    def get_hosts_ports(self, port_type: str) -> str:
-        """Gets the host and port for the endpoint depending of type of service."""
+    def get_hosts_ports(self, port_type: str, port: int | None = None) -> str:
+        """Gets the host and port for the endpoint depending of type of service.
+
+        Args:
+            port_type: "rw" or "ro". "ro" is the dedicated read-only listener, if enabled.
+            port: the port of an isolated application, the listen port if not set.
+        """
         if port_type not in ["rw", "ro"]:
             raise ValueError("Invalid port type")
 
-        service = self.get_service()
+        service_name, port_name = self.k8s_service_name, "pgbouncer"
+        if port is not None:
+            port_name = service_port_name(port)
+        elif port_type == "ro" and (readonly := self.readonly_service()):
+            service_name, port = self.k8s_readonly_service_name, readonly["port"]
+            port_name = service_port_name(port)
+        port = port or self.config.listen_port
+
+        service = self.get_service(service_name)
         if not service:
             return ""
 
-        port = self.config.listen_port
-
         if service.spec.type == "ClusterIP":
-            return f"{self.k8s_service_name}.{self.model.name}.svc.cluster.local:{self.config.listen_port}"
+            return f"{service_name}.{self.model.name}.svc.cluster.local:{port}"
         elif service.spec.type == "NodePort":
             hosts = self.get_node_hosts()
 
-            for p in service.spec.ports:
-                if p.name == "pgbouncer":
-                    node_port = p.nodePort
+            node_port = next((p.nodePort for p in service.spec.ports if p.name == port_name), None)
 
-            return ",".join(sorted({f"{host}:{node_port}" for host in hosts}))
+            # The port of a newly isolated application may not be allocated yet
+            return ",".join(sorted({f"{host}:{node_port}" for host in hosts})) if node_port else ""
         elif (
             service.spec.type == "LoadBalancer"
             and service.status.loadBalancer.ingress
@@ -584,6 +1142,36 @@ class PgBouncerK8sCharm(TypedCharmBase):
                 return f"{hostname}:{port}"
         return ""
 
+    def get_pod_endpoints(self, port_type: str, port: int | None = None) -> str:
+        """Gets the host and port of the pod of every unit, for clients to balance between.
+
+        Args:
+            port_type: "rw" or "ro". "ro" is the dedicated read-only listener, if enabled.
+            port: the port of an isolated application, the listen port if not set.
+
+        Returns:
+            The endpoints through the headless service, ordered by unit, or none if they're not
+            to be published.
+        """
+        if (
+            not self.config.publish_pod_endpoints
+            or self.config.expose_external != ServiceType.ClusterIP
+            or not self.peers.relation
+        ):
+            return ""
+        if port is None and port_type == "ro" and (readonly := self.readonly_service()):
+            port = readonly["port"]
+        port = port or self.config.listen_port
+
+        units = sorted(
+            self.peers.relation.units | {self.unit}, key=lambda unit: int(unit.name.split("/")[1])
+        )
+        return ",".join(
+            f"{unit.name.replace('/', '-')}.{self.app.name}-endpoints.{self.model.name}"
+            f".svc.cluster.local:{port}"
+            for unit in units
+        )
+
     @property
     def read_write_endpoints(self) -> str:
         """The read write endpoints."""
@@ -618,7 +1206,11 @@ class PgBouncerK8sCharm(TypedCharmBase):
                     host, port = endpoint.split(":")
 
                     try:
-                        socket_connect_code = s.connect_ex((host, int(port)))
+                        with trace_io(
+                            PROBES, "connect", **{"server.address": host, "server.port": port}
+                        ) as span:
+                            socket_connect_code = s.connect_ex((host, int(port)))
+                            span.set_attribute("result", socket_connect_code)
                     except socket.gaierror:
                         # Sometimes, it may take LB hostname record to propagate
                         logger.info(f"Unable to resolve {endpoint=}")
@@ -630,8 +1222,14 @@ class PgBouncerK8sCharm(TypedCharmBase):
 
         return True
 
-    def update_status(self):
-        """Health check to update pgbouncer status based on charm state."""
+    def update_status(self, refresh_load: bool = False):
+        """Health check to update pgbouncer status based on charm state.
+
+        Args:
+            refresh_load: whether to query the instances for their load, rather than report the
+                load last seen. Only update-status refreshes it, so that it is checked at a steady
+                interval.
+        """
         if self.unit.status.message in [
             EXTENSIONS_BLOCKING_MESSAGE,
             INVALID_DATABASE_NAME_BLOCKING_MESSAGE,
@@ -658,12 +1256,255 @@ class PgBouncerK8sCharm(TypedCharmBase):
 
         try:
             if self.check_pgb_running():
-                self.unit.status = ActiveStatus()
+                if refresh_load:
+                    self._refresh_load()
+                self.unit.status = self._active_status()
         except PebbleConnectionError:
             not_running = "pgbouncer not running"
             logger.error(not_running)
             self.unit.status = WaitingStatus(not_running)
 
+    def _query_instance(self, service: dict, password: str) -> tuple[list[dict], list[dict]]:
+        """Pools and databases listed by the admin console of a pgbouncer instance.
+
+        Args:
+            service: the service of the instance.
+            password: the password of the stats user.
+
+        Raises:
+            psycopg2.Error: if the instance could not be queried.
+        """
+        host = instance_address(service["id"])
+        with trace_io(PROBES, "show_pools", **{"server.address": host}):
+            connection = psycopg2.connect(
+                host=host,
+                port=service.get("port", self.config.listen_port),
+                dbname=PGB,
+                user=self.backend.stats_user,
+                password=password,
+                connect_timeout=1,
+            )
+            # The admin console does not support transactions
+            connection.autocommit = True
+            results = []
+            with connection.cursor() as cursor:
+                for query in ("SHOW POOLS;", "SHOW DATABASES;"):
+                    cursor.execute(query)
+                    columns = [column.name for column in cursor.description]
+                    results.append([dict(zip(columns, row, strict=True)) for row in cursor])
+            connection.close()
+        return results[0], results[1]
+
+    def get_pool_load(self) -> dict | None:
+        """Load of the pools, summed across the pgbouncer instances.
+
+        Runs SHOW POOLS and SHOW DATABASES on the admin console of each instance, the shared
+        ones as well as the isolated and read-only ones, reached on its own address and port.
+
+        Returns:
+            The clients, the server connections and the waiting clients, along with the most
+            server connections each user holds on an instance and the database closest to its
+            max_db_connections on an instance, as (name, connections, limit), or None if any
+            instance could not be queried.
+        """
+        if not (password := self.get_secret(APP_SCOPE, MONITORING_PASSWORD_KEY)):
+            return None
+        load = {"clients": 0, "servers": 0, "waiting": 0, "users": {}, "busiest": None}
+        for service in self._pgb_services:
+            try:
+                pools, databases = self._query_instance(service, password)
+            except psycopg2.Error as e:
+                logger.debug(f"Failed to query the load of instance {service['id']}: {e}")
+                return None
+            users = {}
+            for pool in pools:
+                if pool["database"] == PGB:
+                    continue
+                servers = pool["sv_active"] + pool["sv_idle"] + pool["sv_used"]
+                load["clients"] += pool["cl_active"] + pool["cl_waiting"]
+                load["servers"] += servers
+                load["waiting"] += pool["cl_waiting"]
+                users[pool["user"]] = users.get(pool["user"], 0) + servers
+            for user, servers in users.items():
+                load["users"][user] = max(load["users"].get(user, 0), servers)
+            for database in databases:
+                limit = database["max_connections"]
+                if database["name"] == PGB or not limit:
+                    continue
+                busiest = (database["name"], database["current_connections"], limit)
+                if load["busiest"] is None or (
+                    busiest[1] / limit > load["busiest"][1] / load["busiest"][2]
+                ):
+                    load["busiest"] = busiest
+        return load
+
+    def _refresh_load(self) -> None:
+        """Query the load of the instances and count the consecutive checks with waiting clients."""
+        self._pool_load = load = self.get_pool_load()
+        if load is None:
+            self._stored.load_message = ""
+            self._stored.waiting_checks = 0
+            return
+
+        message = (
+            f"clients {load['clients']}, servers {load['servers']}, waiting {load['waiting']}"
+        )
+        # max_db_connections limits each database on each instance, not their sum
+        if load["busiest"]:
+            database, connections, limit = load["busiest"]
+            message += f", busiest {database} {connections}/{limit}"
+        self._stored.load_message = message
+        self._stored.waiting_checks = self._stored.waiting_checks + 1 if load["waiting"] else 0
+
+    @property
+    def pool_sizes(self) -> tuple[int, int, int]:
+        """The default, min and reserve pool sizes of the pgbouncer instances."""
+        return get_pool_sizes(self.config.max_db_connections, self._cores)
+
+    def isolated_groups(self) -> list[dict]:
+        """Dedicated pgbouncer service of each isolated client application."""
+        try:
+            config = self.config
+        except ValueError:
+            return []
+        groups = []
+        applications = parse_isolated_applications(config.isolated_applications)
+        for index, (application, budget) in enumerate(applications.items()):
+            max_db_connections = config.max_db_connections if budget is None else budget
+            groups.append({
+                "name": f"{PGB}_isolated_{application}",
+                "id": ISOLATED_SERVICE_ID_OFFSET + index,
+                "application": application,
+                "port": config.listen_port + 1 + index,
+                "max_db_connections": max_db_connections,
+                "pool_sizes": get_pool_sizes(max_db_connections, 1),
+                "dir": f"{PGB_DIR}/isolated_{application}",
+                "ini_path": f"{PGB_DIR}/isolated_{application}/pgbouncer.ini",
+                "log_dir": f"{PGB_LOG_DIR}/isolated_{application}",
+            })
+        return groups
+
+    def isolated_group(self, application: str) -> dict | None:
+        """Dedicated pgbouncer service of the client application, if it's isolated."""
+        return next(
+            (group for group in self.isolated_groups() if group["application"] == application),
+            None,
+        )
+
+    def readonly_service(self) -> dict | None:
+        """Dedicated pgbouncer service of the read-only databases, if enabled."""
+        try:
+            config = self.config
+        except ValueError:
+            return None
+        if not config.readonly_listen_port:
+            return None
+        max_db_connections = (
+            config.max_db_connections
+            if config.readonly_max_db_connections is None
+            else config.readonly_max_db_connections
+        )
+        return {
+            "name": f"{PGB}_readonly",
+            "id": READONLY_SERVICE_ID,
+            "port": config.readonly_listen_port,
+            "max_db_connections": max_db_connections,
+            "pool_sizes": get_pool_sizes(max_db_connections, 1),
+            "dir": f"{PGB_DIR}/readonly",
+            "ini_path": f"{PGB_DIR}/readonly/pgbouncer.ini",
+            "log_dir": f"{PGB_LOG_DIR}/readonly",
+        }
+
+    def dedicated_services(self) -> list[dict]:
+        """The pgbouncer services of the isolated applications, then the read-only one."""
+        services = self.isolated_groups()
+        if readonly := self.readonly_service():
+            services.append(readonly)
+        return services
+
+    @property
+    def _pgb_services(self) -> list[dict]:
+        """Every pgbouncer service: the shared ones, then the dedicated ones."""
+        return self._services + self.dedicated_services()
+
+    def _isolated_relation_ids(self) -> dict[str, str]:
+        """Isolated application of each client relation served by a dedicated service."""
+        isolated = {group["application"] for group in self.isolated_groups()}
+        if not isolated:
+            return {}
+        return {
+            str(relation.id): relation.app.name
+            for relation in self.model.relations[CLIENT_RELATION_NAME]
+            if relation.app and relation.app.name in isolated
+        }
+
+    def _quota_users(self) -> dict[str, tuple[int, list[str]]]:
+        """Budget and users of the client relations sharing the server connections of each database.
+
+        Relations sharing a database share its pools, so the first pool policy requested for the
+        database sets its max_db_connections, as in the rendered config.
+        """
+        isolated = self._isolated_relation_ids()
+        budget = self.config.max_db_connections
+        pools = {}
+        users = {}
+        for rel_id, database in self.get_relation_databases().items():
+            if not rel_id.isdigit() or database.get("legacy") or rel_id in isolated:
+                continue
+            name = database["name"]
+            pools[name] = pools.get(name) or self.client_relation.get_pool_policy(
+                rel_id, database.get("pool", {})
+            )
+            users.setdefault(name, []).append(f"relation_id_{rel_id}")
+        return {
+            name: (pools[name].get("max_db_connections", budget), database_users)
+            for name, database_users in users.items()
+        }
+
+    def get_user_quotas(self) -> dict[str, Quota]:
+        """Share of the server connections of each client relation user, on each instance."""
+        if not self.configuration_check():
+            return {}
+        usage = json.loads(self.peers.app_databag.get("user_usage", "{}"))
+        quotas = {}
+        for budget, users in self._quota_users().values():
+            quotas.update(compute_quotas(users, budget, usage))
+        return quotas
+
+    def rebalance_user_quotas(self) -> None:
+        """Share the connections each client relation user was seen holding, to rebalance quotas.
+
+        The leader's own usage stands for the units', as the K8s service spreads the clients of
+        every application evenly between the units. The usage is only shared again when it moved
+        significantly, as every change re-renders the config of every unit.
+        """
+        if (
+            not self.unit.is_leader()
+            or self._pool_load is None
+            or not self.peers.relation
+            or not self.config.max_db_connections
+        ):
+            return
+        previous = json.loads(self.peers.app_databag.get("user_usage", "{}"))
+        usage = {
+            user: self._pool_load["users"].get(user, 0)
+            for _, users in self._quota_users().values()
+            for user in users
+        }
+        if not usage_changed(previous, usage):
+            return
+
+        logger.info(f"Rebalancing the connection quotas for the usage {usage}")
+        self.peers.app_databag["user_usage"] = json.dumps(usage, sort_keys=True)
+        self.mark_dirty(DIRTY_CONFIG)
+
+    def _active_status(self) -> ActiveStatus:
+        """Active status carrying the load last seen, flagged once clients keep waiting."""
+        message = self._stored.load_message
+        if message and self._stored.waiting_checks >= SATURATION_CHECKS:
+            return ActiveStatus(f"{SATURATED_STATUS_PREFIX}: {message}")
+        return ActiveStatus(message)
+
     def _generate_monitoring_service(self, enabled: bool = True) -> dict[str, str]:
         if enabled and (stats_password := self.get_secret(APP_SCOPE, MONITORING_PASSWORD_KEY)):
             command = (
@@ -692,7 +1533,8 @@ class PgBouncerK8sCharm(TypedCharmBase):
         pgb_container = self.unit.get_container(PGB)
         pgb_container.add_layer(PGB, pebble_layer, combine=True)
         if enabled:
-            pgb_container.replan()
+            with trace_io(PEBBLE, "replan"):
+                pgb_container.replan()
         else:
             pgb_container.stop(self._metrics_service)
         self.check_pgb_running()
@@ -708,7 +1550,7 @@ class PgBouncerK8sCharm(TypedCharmBase):
 
         pebble_services = pgb_container.get_services()
 
-        services = [service["name"] for service in self._services]
+        services = [service["name"] for service in self._pgb_services]
         if self.backend.ready:
             services.append(self._metrics_service)
 
@@ -724,7 +1566,8 @@ class PgBouncerK8sCharm(TypedCharmBase):
                 logger.warning(pgb_not_running)
                 if service == self._metrics_service:
                     try:
-                        pgb_container.restart(service)
+                        with trace_io(PEBBLE, "restart", service=service):
+                            pgb_container.restart(service)
                     except ChangeError as e:
                         logger.debug(f"Failed to start metrics service with error: {e}")
                 return False
@@ -803,9 +1646,32 @@ class PgBouncerK8sCharm(TypedCharmBase):
         secret_key = self._translate_field_to_secret_key(key)
         self.peer_relation_data(scope).delete_relation_data(peers.id, [secret_key])
 
+    def get_tls_files(self) -> tuple[str | None, str | None, str | None]:
+        """The TLS key, CA and certificate files of the unit.
+
+        Whether the unit has them is flagged in its peer databag, so that hooks other than the
+        TLS ones neither construct the TLS library nor read its secrets while TLS is disabled.
+        """
+        unit_databag = self.peers.unit_databag
+        if (
+            unit_databag is not None
+            and unit_databag.get(TLS_ENABLED_KEY) == "False"
+            and not self._dispatched_for("tls")
+        ):
+            return None, None, None
+        tls_files = self.tls.get_tls_files()
+        if unit_databag is not None:
+            self.peers.update_unit_databag({TLS_ENABLED_KEY: str(all(tls_files))})
+        return tls_files
+
     def push_tls_files_to_workload(self, update_config: bool = True) -> bool:
-        """Uploads TLS files to the workload container."""
-        key, ca, cert = self.tls.get_tls_files()
+        """Uploads TLS files to the workload container.
+
+        The ini files only hold the paths of the TLS files, so the hash of their content is part
+        of the config hash, for renewed certificates to reload pgbouncer.
+        """
+        key, ca, cert = self.get_tls_files()
+        self._stored.tls_hash = hashlib.sha256(json.dumps([key, ca, cert]).encode()).hexdigest()
         if key is not None:
             self.push_file(
                 f"{PGB_DIR}/{TLS_KEY_FILE}",
@@ -849,14 +1715,15 @@ class PgBouncerK8sCharm(TypedCharmBase):
             )
             return
 
-        pgb_container.push(
-            path,
-            file_contents,
-            user=PG_USER,
-            group=PG_USER,
-            permissions=perms,
-            make_dirs=True,
-        )
+        with trace_io(PEBBLE, "push", **{"file.path": path, "bytes": len(file_contents)}):
+            pgb_container.push(
+                path,
+                file_contents,
+                user=PG_USER,
+                group=PG_USER,
+                permissions=perms,
+                make_dirs=True,
+            )
 
     def delete_file(self, path):
         """Deletes the file at `path`."""
@@ -870,14 +1737,67 @@ class PgBouncerK8sCharm(TypedCharmBase):
 
         pgb_container.remove_path(path)
 
-    def set_relation_databases(self, databases: dict[int, dict[str, str | bool]]) -> None:
-        """Updates the relation databases."""
-        self.peers.app_databag["pgb_dbs_config"] = json.dumps(databases)
+    def set_relation_databases(self, databases: dict[str, dict[str, str | bool]]) -> None:
+        """Replaces the relation databases.
+
+        The wildcard database isn't stored, but derived from the entries flagged with wildcard.
+        """
+        stored = {*(self.peers.relation_databases or {}), *self.peers.stored_relation_ids}
+        self._store_relation_databases({**dict.fromkeys(stored), **databases})
+
+    def update_relation_databases(self, changes: dict[str, dict[str, str | bool] | None]) -> None:
+        """Updates the relation databases of the given relations only, None to remove them."""
+        if (
+            self.peers.relation_databases is not None
+            and not self.peers.relation_databases_versioned
+        ):
+            # The entries stored by earlier revisions don't flag the relations needing the wildcard
+            self.generate_relation_databases()
+        self._store_relation_databases(changes)
+
+    def _store_relation_databases(self, changes: dict[str, dict[str, str | bool] | None]) -> None:
+        """Write the changed entries, mirrored for earlier revisions while an upgrade runs."""
+        changes = {
+            relation_id: entry for relation_id, entry in changes.items() if relation_id != "*"
+        }
+        upgrading = self.upgrade_in_progress
+        self.peers.update_relation_databases(changes, keep_legacy=upgrading)
+        if upgrading:
+            self.peers.mirror_legacy_databases(
+                self._with_wildcard(self.peers.versioned_relation_databases)
+            )
+
+    def drop_legacy_relation_databases(self) -> None:
+        """Stop keeping the relation databases of earlier revisions, once the upgrade finished."""
+        if self.unit.is_leader() and self.peers.has_legacy_databases:
+            self.update_relation_databases({})
+
+    @property
+    def upgrade_in_progress(self) -> bool:
+        """Whether units of different revisions may be running, as tracked by the upgrade lib.
+
+        The unit states are read from the upgrade relation as the lib writes them, without
+        constructing it outside of its hooks.
+        """
+        if not (relation := self.model.get_relation("upgrade")):
+            return False
+        states = {relation.data[unit].get("state") for unit in {self.unit, *relation.units}}
+        return states != {"idle"}
+
+    @staticmethod
+    def _with_wildcard(databases: dict[str, dict]) -> dict[str, dict]:
+        """Add the wildcard database to the entries, if some relation needs it."""
+        if wildcard := [database for database in databases.values() if database.get("wildcard")]:
+            # Through the database of the latest relation needing it
+            databases["*"] = {"name": "*", "auth_dbname": wildcard[-1]["name"], "legacy": False}
+        return databases
 
     def get_relation_databases(self) -> dict[str, dict[str, str | bool]]:
         """Get relation databases."""
-        if "pgb_dbs_config" in self.peers.app_databag:
-            return json.loads(self.peers.app_databag["pgb_dbs_config"])
+        if (databases := self.peers.relation_databases) is not None:
+            if self.peers.relation_databases_versioned:
+                return self._with_wildcard(databases)
+            return databases
         # Nothing set in the config peer data trying to regenerate based on old data in case of update.
         elif not self.unit.is_leader() and (
             cfg := self.get_secret(APP_SCOPE, CFG_FILE_DATABAG_KEY)
@@ -907,7 +1827,6 @@ class PgBouncerK8sCharm(TypedCharmBase):
             return {}
 
         databases = {}
-        add_wildcard = False
         for relation in self.model.relations.get("db", []):
             database = self.legacy_db_relation.get_databags(relation)[0].get("database")
             if database:
@@ -922,93 +1841,116 @@ class PgBouncerK8sCharm(TypedCharmBase):
                 databases[str(relation.id)] = {
                     "name": database,
                     "legacy": True,
+                    "wildcard": True,
                 }
-                add_wildcard = True
 
         for rel_id, data in self.client_relation.database_provides.fetch_relation_data(
-            fields=["database", "extra-user-roles"]
+            fields=["database", "extra-user-roles", *POOL_POLICY_FIELDS]
         ).items():
             database = data.get("database")
             extra_user_roles = data.get("extra-user-roles")
             extra_user_roles = self.client_relation.sanitize_extra_roles(extra_user_roles)
-            if database:
-                databases[str(rel_id)] = {
-                    "name": database,
-                    "legacy": False,
-                }
-            if (
-                PERMISSIONS_GROUP_ADMIN in extra_user_roles
-                or "superuser" in extra_user_roles
-                or "createdb" in extra_user_roles
-                or "charmed_databases_owner" in extra_user_roles
-                or "charmed_dba" in extra_user_roles
-                or "charmed_dml" in extra_user_roles
-                or "charmed_read" in extra_user_roles
-                or "charmed_stats" in extra_user_roles
-            ):
-                add_wildcard = True
-
-        if add_wildcard:
-            databases["*"] = {"name": "*", "auth_dbname": database, "legacy": False}
+            if not database:
+                continue
+            databases[str(rel_id)] = self.client_relation.database_entry(database, data)
+            if self.client_relation.requires_wildcard(extra_user_roles):
+                databases[str(rel_id)]["wildcard"] = True
 
         self.set_relation_databases(databases)
-        return databases
+        return self.get_relation_databases()
+
+    def backend_for(self, database: str) -> BackendDatabaseRequires | ShardBackend | None:
+        """Backend cluster serving the database, None if its shard isn't ready."""
+        routing = self.backend_shards.routing()
+        return routing.get(database, self.backend)
+
+    def _get_relation_config(
+        self, databases: dict[str, dict] | None = None
+    ) -> [dict[str, dict[str, str | bool]]]:
+        """Generate pgb config for databases and admin users.
 
-    def _get_relation_config(self) -> [dict[str, dict[str, str | bool]]]:
-        """Generate pgb config for databases and admin users."""
-        if not self.backend.relation or not (databases := self.get_relation_databases()):
+        Args:
+            databases: the relation databases to configure, all of them if not set.
+        """
+        databases = self.get_relation_databases() if databases is None else databases
+        autodb = self.config.autodb_mode
+        if not self.backend.relation or not (databases or autodb):
             return {}
 
         # In postgres, "endpoints" will only ever have one value. Other databases using the library
         # can have more, but that's not planned for the postgres charm.
         if not (postgres_endpoint := self.backend.postgres_databag.get("endpoints")):
             return {}
-        host, port = postgres_endpoint.split(":")
-
-        read_only_endpoints = self.backend.get_read_only_endpoints()
-        sorted_rhosts = [r_host.split(":")[0] for r_host in read_only_endpoints]
-        sorted_rhosts.sort()
-        r_hosts = ",".join(sorted_rhosts)
-        if r_hosts:
-            for r_host in read_only_endpoints:
-                r_port = r_host.split(":")[1]
-                break
-        else:
-            r_hosts = host
-            r_port = port
+        primary = (
+            *backend_hosts(postgres_endpoint, self.backend.get_read_only_endpoints()),
+            self.backend.auth_user,
+        )
+        host, port = primary[:2]
+        # Databases routed to a shard that isn't ready are left out, not served by the primary
+        routing = {
+            database: (
+                *backend_hosts(shard.endpoint, shard.get_read_only_endpoints()),
+                shard.auth_user,
+            )
+            if shard
+            else None
+            for database, shard in self.backend_shards.routing().items()
+        }
 
         pgb_dbs = {}
+        pools = {}
 
-        for database in databases.values():
+        for rel_id, database in databases.items():
             name = database["name"]
-            if name == "*":
+            if name == "*" or not (cluster := routing.get(name, primary)):
                 continue
-            pgb_dbs[name] = {
-                "host": host,
-                "dbname": name,
-                "port": port,
-                "auth_user": self.backend.auth_user,
-            }
+            db_host, db_port, r_hosts, r_port, auth_user = cluster
+            # Relations sharing a database share its pools, so the first pool policy requested
+            # for the database applies to all of them. The requests are validated on render, for
+            # the global max_db_connections they must fit in can change after them.
+            pool = pools.get(name) or self.client_relation.get_pool_policy(
+                rel_id, database.get("pool", {})
+            )
+            pools[name] = pool
+            # In autodb mode, the wildcard serves the databases with no settings of their own
+            if not autodb or pool or cluster is not primary:
+                pgb_dbs[name] = {
+                    "host": db_host,
+                    "dbname": name,
+                    "port": db_port,
+                    "auth_user": auth_user,
+                    "pool": pool,
+                }
             ro_db = {
                 "host": r_hosts,
                 "dbname": name,
                 "port": r_port,
-                "auth_user": self.backend.auth_user,
+                "auth_user": auth_user,
+                "pool": pool,
             }
             if len(f"{name}_readonly") < 64:
                 pgb_dbs[f"{name}_readonly"] = ro_db
             if database["legacy"] and len(f"{name}_standby") < 64:
                 pgb_dbs[f"{name}_standby"] = ro_db
-        if "*" in databases:
+        if "*" in databases or autodb:
             pgb_dbs["*"] = {
                 "host": host,
                 "port": port,
                 "auth_user": self.backend.auth_user,
-                "auth_dbname": databases["*"]["auth_dbname"],
+                "auth_dbname": databases["*"]["auth_dbname"] if "*" in databases else PGB,
             }
         return pgb_dbs
 
-    def render_pgb_config(self, restart=False) -> None:
+    def _get_readonly_wildcard(self, databases: dict) -> dict[str, dict]:
+        """The wildcard database of the read-only service in autodb mode, on the replicas."""
+        if not self.config.autodb_mode or "*" not in databases:
+            return {}
+        _, _, r_hosts, r_port = backend_hosts(
+            self.backend.postgres_databag["endpoints"], self.backend.get_read_only_endpoints()
+        )
+        return {"*": {**databases["*"], "host": r_hosts, "port": r_port}}
+
+    def render_pgb_config(self, restart=False) -> bool:
         """Generate pgbouncer.ini from juju config and deploy it to the container.
 
         Every time the config is rendered, `peers.update_cfg` is called. This updates the config in
@@ -1018,84 +1960,170 @@ class PgBouncerK8sCharm(TypedCharmBase):
         databags, so this information would have to be propagated to peers anyway. Therefore, it's
         most convenient to have a single source of truth for the whole config.
 
+        The rendered files are only pushed, and the services only reloaded, when their content
+        differs from the last render or some service isn't running.
+
         Args:
             restart: Whether to restart the service when reloading.
-        """
-        perm = 0o400
 
+        Returns:
+            Whether the workload got the current config, False when it couldn't be rendered.
+        """
         pgb_container = self.unit.get_container(PGB)
         if not self.configuration_check() or not pgb_container.can_connect():
-            return
+            return False
 
-        userlist = self.get_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY)
-        if not userlist:
-            userlist = ""
-        auth_type = "md5" if f'"{self.backend.stats_user}" "md5' in userlist else "scram-sha-256"
+        rendered = self._render_pgb_config_files()
+        config_hash = self._pgb_config_hash(rendered)
 
-        max_db_connections = self.config.max_db_connections
-        if max_db_connections == 0:
-            default_pool_size = 20
-            min_pool_size = 10
-            reserve_pool_size = 10
-        else:
-            effective_db_connections = max_db_connections / self._cores
-            default_pool_size = math.ceil(effective_db_connections / 2)
-            min_pool_size = math.ceil(effective_db_connections / 4)
-            reserve_pool_size = math.ceil(effective_db_connections / 4)
-        service_ids = [service["id"] for service in self._services]
-        with open("templates/pgb_config.j2") as file:
-            template = Template(file.read())
-            databases = self._get_relation_config()
-            readonly_dbs = self._get_readonly_dbs(databases)
-            enable_tls = all(self.tls.get_tls_files())
-            for service in self._services:
-                self.push_file(
-                    service["ini_path"],
-                    template.render(
-                        databases=databases,
-                        readonly_databases=readonly_dbs,
-                        peer_id=service["id"],
-                        socket_dir=service["dir"],
-                        peers=service_ids,
-                        log_file=f"{service['log_dir']}/pgbouncer.log",
-                        pid_file=f"{service['dir']}/pgbouncer.pid",
-                        listen_port=self.config.listen_port,
-                        pool_mode=self.config.pool_mode,
-                        max_db_connections=max_db_connections,
-                        max_prepared_statements=self.config.max_prepared_statements,
-                        default_pool_size=default_pool_size,
-                        min_pool_size=min_pool_size,
-                        reserve_pool_size=reserve_pool_size,
-                        admin_user=self.backend.admin_user,
-                        stats_user=self.backend.stats_user,
-                        auth_type=auth_type,
-                        auth_query=self.backend.auth_query,
-                        auth_file=self.auth_file,
-                        enable_tls=enable_tls,
-                        key_file=f"{PGB_DIR}/{TLS_KEY_FILE}",
-                        ca_file=f"{PGB_DIR}/{TLS_CA_FILE}",
-                        cert_file=f"{PGB_DIR}/{TLS_CERT_FILE}",
-                    ),
-                    perm,
-                )
-        logger.info("pushed new pgbouncer.ini config files to pgbouncer container")
-
-        pgb_container = self.unit.get_container(PGB)
         pebble_services = pgb_container.get_services()
+        services_active = bool(pebble_services) and all(
+            service["name"] in pebble_services
+            and pebble_services[service["name"]].current == ServiceStatus.ACTIVE
+            for service in self._pgb_services
+        )
+        if not restart and services_active and config_hash == self._stored.config_hash:
+            logger.debug("pgbouncer.ini config files unchanged, skipping push and reload")
+            return True
+
+        self._push_pgb_config(rendered)
+
         if not pebble_services:
-            return
+            # The services start with the pushed files on pebble-ready
+            return True
 
         logger.info(f"{'restarting' if restart else 'reloading'} pgbouncer application")
-        for service in self._services:
+        for service in self._pgb_services:
             if service["name"] not in pebble_services:
                 # pebble_ready event hasn't fired so pgbouncer has not been added to pebble config
                 raise PebbleConnectionError
             if restart or pebble_services[service["name"]].current != ServiceStatus.ACTIVE:
-                pgb_container.restart(service["name"])
+                with trace_io(PEBBLE, "restart", service=service["name"]):
+                    pgb_container.restart(service["name"])
+                self.charm_metrics.record_restart()
             else:
-                pgb_container.send_signal(SIGHUP, service["name"])
+                with trace_io(PEBBLE, "send_signal", service=service["name"], signal="SIGHUP"):
+                    pgb_container.send_signal(SIGHUP, service["name"])
+                self.charm_metrics.record_reload()
+        self.charm_metrics.record_config_applied()
 
         self.check_pgb_running()
+        return True
+
+    def _render_pgb_config_files(self) -> dict[str, str]:
+        """Render the pgbouncer.ini of every pgbouncer service, keyed by its path."""
+        userlist = self.get_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY)
+        if not userlist:
+            userlist = ""
+        auth_type = "md5" if f'"{self.backend.stats_user}" "md5' in userlist else "scram-sha-256"
+
+        max_db_connections = self.config.max_db_connections
+        default_pool_size, min_pool_size, reserve_pool_size = self.pool_sizes
+        with open("templates/pgb_config.j2") as file:
+            template = Template(file.read())
+        databases = self._get_relation_config()
+        readonly_dbs = self._get_readonly_dbs(databases)
+        settings = {
+            "pool_mode": self.config.pool_mode,
+            "max_prepared_statements": self.config.max_prepared_statements,
+            "admin_user": self.backend.admin_user,
+            "stats_user": self.backend.stats_user,
+            "auth_type": auth_type,
+            "auth_query": self.backend.auth_query,
+            "auth_file": self.auth_file,
+            "enable_tls": all(self.get_tls_files()),
+            "key_file": f"{PGB_DIR}/{TLS_KEY_FILE}",
+            "ca_file": f"{PGB_DIR}/{TLS_CA_FILE}",
+            "cert_file": f"{PGB_DIR}/{TLS_CERT_FILE}",
+            "autodb_mode": self.config.autodb_mode,
+            "autodb_idle_timeout": self.config.autodb_idle_timeout,
+        }
+        user_quotas = self.get_user_quotas()
+        rendered = {
+            service["ini_path"]: render_pgb_ini(
+                template,
+                service,
+                self._services,
+                base_socket_dir=f"{PGB_DIR}/instance_",
+                databases=databases,
+                readonly_databases=readonly_dbs,
+                listen_port=self.config.listen_port,
+                max_db_connections=max_db_connections,
+                user_quotas=user_quotas,
+                default_pool_size=default_pool_size,
+                min_pool_size=min_pool_size,
+                reserve_pool_size=reserve_pool_size,
+                **settings,
+            )
+            for service in self._services
+        }
+
+        isolated_relations = self._isolated_relation_ids()
+        for group in self.isolated_groups():
+            # A single instance serves the application, with no peers to forward cancellations to
+            group_databases = self._get_relation_config({
+                relation_id: database
+                for relation_id, database in self.get_relation_databases().items()
+                if isolated_relations.get(relation_id) == group["application"]
+                or relation_id == "*"
+            })
+            default_pool_size, min_pool_size, reserve_pool_size = group["pool_sizes"]
+            rendered[group["ini_path"]] = render_pgb_ini(
+                template,
+                group,
+                [],
+                base_socket_dir=f"{PGB_DIR}/instance_",
+                databases=group_databases,
+                readonly_databases=self._get_readonly_dbs(group_databases),
+                listen_port=group["port"],
+                max_db_connections=group["max_db_connections"],
+                user_quotas={},
+                default_pool_size=default_pool_size,
+                min_pool_size=min_pool_size,
+                reserve_pool_size=reserve_pool_size,
+                **settings,
+            )
+
+        if readonly := self.readonly_service():
+            # Only the read-only databases, with no wildcard for the others to fall back to on
+            # the primary
+            default_pool_size, min_pool_size, reserve_pool_size = readonly["pool_sizes"]
+            rendered[readonly["ini_path"]] = render_pgb_ini(
+                template,
+                readonly,
+                [],
+                base_socket_dir=f"{PGB_DIR}/instance_",
+                databases={
+                    **{
+                        name: database
+                        for name, database in databases.items()
+                        if name.endswith(("_readonly", "_standby"))
+                    },
+                    **self._get_readonly_wildcard(databases),
+                },
+                readonly_databases=readonly_dbs,
+                listen_port=readonly["port"],
+                max_db_connections=readonly["max_db_connections"],
+                user_quotas={},
+                default_pool_size=default_pool_size,
+                min_pool_size=min_pool_size,
+                reserve_pool_size=reserve_pool_size,
+                **settings,
+            )
+        return rendered
+
+    def _pgb_config_hash(self, rendered: dict[str, str]) -> str:
+        """Hash of the rendered pgbouncer.ini files and TLS files, to detect config changes."""
+        return hashlib.sha256(
+            json.dumps([rendered, self._stored.tls_hash], sort_keys=True).encode()
+        ).hexdigest()
+
+    def _push_pgb_config(self, rendered: dict[str, str]) -> None:
+        """Push the rendered pgbouncer.ini files, without reloading the services."""
+        for ini_path, content in rendered.items():
+            self.push_file(ini_path, content, 0o400)
+        logger.info("pushed new pgbouncer.ini config files to pgbouncer container")
+        self._stored.config_hash = self._pgb_config_hash(rendered)
 
     def render_auth_file(self) -> None:
         """Renders the given auth_file to the correct location."""
@@ -1107,6 +2135,38 @@ class PgBouncerK8sCharm(TypedCharmBase):
     #  Relation Utilities
     # =====================
 
+    def complete_pending_onboarding(self) -> None:
+        """Onboard in one pass every client relation recorded while units were out of sync.
+
+        Followers ack the relation databases config they have rendered, so once every unit acked
+        the current version, all the pending relations can be served by any unit. Relations that
+        can't be onboarded yet, e.g. whose shard isn't ready, stay pending for the next attempt.
+        """
+        if not self.unit.is_leader() or not (pending := self.peers.pending_onboarding):
+            return
+
+        if not self.peers.units_synced():
+            logger.debug(f"Waiting for all units to sync config to onboard {pending}")
+            return
+
+        if not self.backend.check_backend():
+            return
+
+        handlers = {
+            CLIENT_RELATION_NAME: self.client_relation,
+            self.legacy_db_relation.relation_name: self.legacy_db_relation,
+            self.legacy_db_admin_relation.relation_name: self.legacy_db_admin_relation,
+        }
+        relations = {(relation.name, relation.id): relation for relation in self.client_relations}
+        logger.info(f"Onboarding pending relations {pending}")
+        done = []
+        for relation_name, relation_id in pending:
+            # Relations removed in the meantime are dropped, failed ones are kept for a retry
+            relation = relations.get((relation_name, relation_id))
+            if relation is None or handlers[relation_name].onboard_relation(relation):
+                done.append((relation_name, relation_id))
+        self.peers.remove_pending_onboarding(done)
+
     def update_client_connection_info(self):
         """Update connection info in client relations.
 
@@ -1118,14 +2178,19 @@ class PgBouncerK8sCharm(TypedCharmBase):
 
         port = self.config.listen_port
 
-        for relation in self.model.relations.get("db", []):
-            self.legacy_db_relation.update_connection_info(relation, port)
-
-        for relation in self.model.relations.get("db-admin", []):
-            self.legacy_db_admin_relation.update_connection_info(relation, port)
+        # The endpoints are read from the K8s service once for all the relations
+        legacy_relations = [
+            (self.legacy_db_relation, relation) for relation in self.model.relations.get("db", [])
+        ] + [
+            (self.legacy_db_admin_relation, relation)
+            for relation in self.model.relations.get("db-admin", [])
+        ]
+        if legacy_relations:
+            endpoints = (self.read_write_endpoints, self.read_only_endpoints)
+            for legacy_relation, relation in legacy_relations:
+                legacy_relation.update_connection_info(relation, port, endpoints)
 
-        for relation in self.model.relations.get(CLIENT_RELATION_NAME, []):
-            self.client_relation.update_connection_info(relation)
+        self.client_relation.update_connection_info()
 
     @property
     def unit_pod_hostname(self, name="") -> str:
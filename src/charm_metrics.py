@@ -0,0 +1,323 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Metrics about the charm itself, served to Prometheus from the workload container.
+
+At the end of every hook, the charm renders its counters in the Prometheus text format to a file
+in the workload container, which a small HTTP server there exposes as a second scrape target,
+next to pgbouncer_exporter. The server needs python in the workload image, so neither the file
+nor the scrape target exist without it.
+
+The file is only pushed when its content changed. As the hook counters change on every hook,
+they alone are pushed at most once every HOOK_METRICS_INTERVAL seconds.
+"""
+
+import hashlib
+import logging
+import time
+
+from ops import CharmBase, Container, Object, StoredState
+from ops.pebble import ConnectionError as PebbleConnectionError
+from ops.pebble import PathError, ProtocolError
+
+from constants import (
+    CHARM_METRICS_DIR,
+    CHARM_METRICS_FILE,
+    CHARM_METRICS_PORT,
+    CLIENT_RELATION_NAME,
+    DB_ADMIN_RELATION_NAME,
+    DB_RELATION_NAME,
+    PG_GROUP,
+    PG_USER,
+    PGB,
+)
+
+logger = logging.getLogger(__name__)
+
+PYTHON = "/usr/bin/python3"
+HOOK_METRICS_INTERVAL = 60
+
+
+class CharmMetrics(Object):
+    """Counts the charm activity across hooks, and writes it for Prometheus to scrape."""
+
+    _stored = StoredState()
+
+    def __init__(self, charm: CharmBase):
+        super().__init__(charm, "charm-metrics")
+
+        self.charm = charm
+        self._stored.set_default(
+            hook_runs={},
+            hook_seconds={},
+            last_hook_seconds={},
+            reloads=0,
+            restarts=0,
+            deferrals=0,
+            endpoints_changed_at=0.0,
+            endpoints_change_pending=False,
+            config_applied_at=0.0,
+            config_apply_latency=0.0,
+            relation_info=[],
+            relation_info_version="",
+            server_available=False,
+            pushed_hash="",
+            pushed_at=0.0,
+        )
+
+    @property
+    def server_available(self) -> bool:
+        """Whether the workload container can serve the metrics file, as last checked."""
+        return self._stored.server_available
+
+    def check_server(self, container: Container) -> bool:
+        """Check whether the workload image has python to serve the metrics file.
+
+        The file is pushed again at the end of the hook, as the container may have been
+        recreated.
+
+        Returns:
+            whether the availability of the server changed.
+        """
+        available = container.exists(PYTHON)
+        changed = available != self._stored.server_available
+        self._stored.server_available = available
+        self._stored.pushed_hash = ""
+        return changed
+
+    def record_reload(self) -> None:
+        """Count a pgbouncer instance reloaded with SIGHUP."""
+        self._stored.reloads += 1
+
+    def record_restart(self) -> None:
+        """Count a pgbouncer instance restarted."""
+        self._stored.restarts += 1
+
+    def record_deferral(self) -> None:
+        """Count an event deferred to a later hook."""
+        self._stored.deferrals += 1
+
+    def record_endpoints_change(self) -> None:
+        """Note when the unit learnt that the backend endpoints changed.
+
+        The first change since the config was last applied is kept, so that the latency covers
+        the whole wait of that change.
+        """
+        if not self._stored.endpoints_change_pending:
+            self._stored.endpoints_changed_at = time.time()
+            self._stored.endpoints_change_pending = True
+
+    def record_config_applied(self) -> None:
+        """Note that the instances reloaded a new config, closing any pending endpoints change."""
+        self._stored.config_applied_at = time.time()
+        if self._stored.endpoints_change_pending:
+            self._stored.config_apply_latency = (
+                self._stored.config_applied_at - self._stored.endpoints_changed_at
+            )
+            self._stored.endpoints_change_pending = False
+
+    def record_hook(self, hook: str, duration: float) -> None:
+        """Count the hook and the seconds spent handling it."""
+        self._stored.hook_runs[hook] = self._stored.hook_runs.get(hook, 0) + 1
+        self._stored.hook_seconds[hook] = self._stored.hook_seconds.get(hook, 0.0) + duration
+        self._stored.last_hook_seconds[hook] = duration
+
+    def update_relation_info(self) -> None:
+        """Map the user of each client relation to the relation and its remote application.
+
+        pgbouncer_exporter labels pool metrics by user, and stats by database. The mapping lets
+        them be joined with the consuming application. It is updated from the relation databases
+        config only when the config changes, and the remote applications are only looked up when
+        there are new relations, as looking them up runs a hook tool per relation.
+        """
+        if not self.charm.peers.relation:
+            return
+        version = self.charm.peers.config_version
+        if version == self._stored.relation_info_version:
+            return
+
+        databases = self.charm.get_relation_databases()
+        known = {info["relation_id"]: dict(info) for info in self._stored.relation_info}
+        relations = {}
+        if any(relation_id not in known for relation_id in databases if relation_id != "*"):
+            relations = {
+                str(relation.id): relation
+                for endpoint in (CLIENT_RELATION_NAME, DB_RELATION_NAME, DB_ADMIN_RELATION_NAME)
+                for relation in self.model.relations[endpoint]
+            }
+        relation_info = []
+        for relation_id, database in databases.items():
+            if relation := relations.get(relation_id):
+                if not relation.app:
+                    continue
+                endpoint, application = relation.name, relation.app.name
+            elif not relations and (info := known.get(relation_id)):
+                endpoint, application = info["endpoint"], info["application"]
+            else:
+                continue
+            if database["legacy"]:
+                user = f"{self.charm.app.name}_user_{relation_id}_{self.model.name}"
+            else:
+                user = f"relation_id_{relation_id}"
+            relation_info.append({
+                "relation_id": relation_id,
+                "endpoint": endpoint,
+                "application": application,
+                "database": database["name"],
+                "user": user.replace("-", "_"),
+            })
+        self._stored.relation_info = relation_info
+        self._stored.relation_info_version = version
+
+    def render(self) -> str:
+        """The metrics, in the Prometheus text exposition format."""
+        return self._render_hooks() + self._render_state()
+
+    def _render_hooks(self) -> str:
+        """The hook counters, which change on every hook."""
+        return self._format([
+            (
+                "pgbouncer_charm_hook_runs_total",
+                "counter",
+                "Hooks handled by the charm.",
+                dict(self._stored.hook_runs),
+            ),
+            (
+                "pgbouncer_charm_hook_duration_seconds_total",
+                "counter",
+                "Seconds spent handling hooks.",
+                dict(self._stored.hook_seconds),
+            ),
+            (
+                "pgbouncer_charm_last_hook_duration_seconds",
+                "gauge",
+                "Seconds spent handling the last run of each hook.",
+                dict(self._stored.last_hook_seconds),
+            ),
+        ])
+
+    def _render_state(self) -> str:
+        """The relations and workload metrics, which only change with the charm state."""
+        metrics = [
+            (
+                "pgbouncer_charm_reloads_total",
+                "counter",
+                "pgbouncer instances reloaded with SIGHUP.",
+                self._stored.reloads,
+            ),
+            (
+                "pgbouncer_charm_restarts_total",
+                "counter",
+                "pgbouncer instances restarted.",
+                self._stored.restarts,
+            ),
+            (
+                "pgbouncer_charm_deferrals_total",
+                "counter",
+                "Events deferred to a later hook.",
+                self._stored.deferrals,
+            ),
+            (
+                "pgbouncer_charm_endpoints_changed_timestamp_seconds",
+                "gauge",
+                "When the unit last learnt of a backend endpoints change.",
+                self._stored.endpoints_changed_at,
+            ),
+            (
+                "pgbouncer_charm_config_applied_timestamp_seconds",
+                "gauge",
+                "When the pgbouncer instances last reloaded a new config.",
+                self._stored.config_applied_at,
+            ),
+            (
+                "pgbouncer_charm_config_apply_latency_seconds",
+                "gauge",
+                "Seconds from the last backend endpoints change until the unit applied it.",
+                self._stored.config_apply_latency,
+            ),
+        ]
+        lines = [
+            "# HELP pgbouncer_charm_relation_info Client relation and application of each user.",
+            "# TYPE pgbouncer_charm_relation_info gauge",
+        ]
+        lines.extend(
+            "pgbouncer_charm_relation_info{"
+            + ",".join(f'{label}="{value}"' for label, value in sorted(info.items()))
+            + "} 1"
+            for info in self._stored.relation_info
+        )
+        return "\n".join(lines) + "\n" + self._format(metrics)
+
+    @staticmethod
+    def _format(metrics: list[tuple[str, str, str, dict | int | float]]) -> str:
+        """Format the metrics, labelled by hook when their value is a dict."""
+        lines = []
+        for name, metric_type, description, value in metrics:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if isinstance(value, dict):
+                lines.extend(
+                    f'{name}{{hook="{hook}"}} {hook_value}'
+                    for hook, hook_value in sorted(value.items())
+                )
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, hook: str | None, started: float) -> None:
+        """Count the current hook and push the metrics file to the workload container.
+
+        The file is only pushed when the state metrics changed, or when the hook counters were
+        last pushed more than HOOK_METRICS_INTERVAL seconds ago.
+
+        Args:
+            hook: the dispatched hook, not counted if None.
+            started: `time.perf_counter()` when the charm started handling the hook.
+        """
+        if hook:
+            self.record_hook(hook, time.perf_counter() - started)
+        self.update_relation_info()
+        if not self._stored.server_available:
+            return
+
+        state = self._render_state()
+        state_hash = hashlib.sha256(state.encode()).hexdigest()
+        now = time.time()
+        if (
+            state_hash == self._stored.pushed_hash
+            and now - self._stored.pushed_at < HOOK_METRICS_INTERVAL
+        ):
+            return
+
+        container = self.charm.unit.get_container(PGB)
+        if not container.can_connect():
+            return
+        try:
+            container.push(
+                f"{CHARM_METRICS_DIR}/{CHARM_METRICS_FILE}",
+                self._render_hooks() + state,
+                user=PG_USER,
+                group=PG_GROUP,
+                permissions=0o644,
+                make_dirs=True,
+            )
+        except (PebbleConnectionError, PathError, ProtocolError) as e:
+            logger.debug(f"Failed to write the charm metrics: {e}")
+            return
+        self._stored.pushed_hash = state_hash
+        self._stored.pushed_at = now
+
+    @staticmethod
+    def server_service() -> dict:
+        """Pebble service serving the metrics file over HTTP."""
+        return {
+            "override": "replace",
+            "summary": "charm metrics server",
+            "user": PG_USER,
+            "group": PG_GROUP,
+            "command": (
+                f"{PYTHON} -m http.server --bind 0.0.0.0 --directory {CHARM_METRICS_DIR} "
+                f"{CHARM_METRICS_PORT}"
+            ),
+            "startup": "enabled",
+        }
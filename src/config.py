@@ -6,13 +6,84 @@
 
 import enum
 import logging
+import re
 from typing import Literal
 
 from charms.data_platform_libs.v0.data_models import BaseConfigModel
-from pydantic import PositiveInt, conint
+from pydantic import PositiveInt, conint, validator
+
+from constants import (
+    CHARM_METRICS_PORT,
+    MAX_ISOLATED_APPLICATIONS,
+    METRICS_PORT,
+    TOO_MANY_ISOLATED_APPLICATIONS_MESSAGE,
+)
 
 logger = logging.getLogger(__name__)
 
+PoolMode = Literal["session", "transaction", "statement"]
+
+APPLICATION_NAME = re.compile(r"^[a-z][a-z0-9]*(-[a-z0-9]*[a-z][a-z0-9]*)*$")
+DATABASE_NAME = re.compile(r"^[A-Za-z0-9_-]{1,63}$")
+
+
+def parse_isolated_applications(value: str) -> dict[str, int | None]:
+    """Parse the isolated-applications config option.
+
+    Args:
+        value: comma separated application names, each optionally followed by
+            `=<max_db_connections>`.
+
+    Returns:
+        The max_db_connections of each application, None to use the global one.
+
+    Raises:
+        ValueError: if the value is malformed, or lists more than MAX_ISOLATED_APPLICATIONS.
+    """
+    applications = {}
+    for entry in value.split(","):
+        if not (entry := entry.strip()):
+            continue
+        name, _, budget = entry.partition("=")
+        name = name.strip()
+        if not APPLICATION_NAME.match(name):
+            raise ValueError(f"Invalid application name {name}")
+        if name in applications:
+            raise ValueError(f"Application {name} is listed more than once")
+        if budget.strip() and (not budget.strip().isdigit()):
+            raise ValueError(f"Invalid max_db_connections {budget} for application {name}")
+        applications[name] = int(budget) if budget.strip() else None
+    if len(applications) > MAX_ISOLATED_APPLICATIONS:
+        raise ValueError(TOO_MANY_ISOLATED_APPLICATIONS_MESSAGE)
+    return applications
+
+
+def parse_database_routing(value: str) -> dict[str, str]:
+    """Parse the database-routing config option.
+
+    Args:
+        value: comma separated `<database>=<application>` entries.
+
+    Returns:
+        The backend-shards application serving each database.
+
+    Raises:
+        ValueError: if the value is malformed.
+    """
+    routes = {}
+    for entry in value.split(","):
+        if not (entry := entry.strip()):
+            continue
+        database, _, application = (part.strip() for part in entry.partition("="))
+        if not DATABASE_NAME.match(database):
+            raise ValueError(f"Invalid database name {database}")
+        if not APPLICATION_NAME.match(application):
+            raise ValueError(f"Invalid application name {application} for database {database}")
+        if database in routes:
+            raise ValueError(f"Database {database} is routed more than once")
+        routes[database] = application
+    return routes
+
 
 class ServiceType(enum.Enum):
     """Supported K8s service types."""
@@ -26,8 +97,49 @@ class CharmConfig(BaseConfigModel):
     """Manager for the structured configuration."""
 
     listen_port: PositiveInt
-    pool_mode: Literal["session", "transaction", "statement"]
+    pool_mode: PoolMode
     max_db_connections: conint(ge=0)
     max_prepared_statements: conint(ge=0, le=1000)
     expose_external: ServiceType
     loadbalancer_extra_annotations: str
+    isolated_applications: str
+    readonly_listen_port: conint(ge=0, le=65535)
+    readonly_max_db_connections: conint(ge=0) | None
+    publish_pod_endpoints: bool
+    topology_aware_routing: bool
+    database_routing: str
+    autodb_mode: bool
+    autodb_idle_timeout: conint(ge=0)
+
+    @validator("isolated_applications")
+    @classmethod
+    def isolated_applications_values(cls, value: str) -> str:
+        """Check the format of the isolated applications."""
+        parse_isolated_applications(value)
+        return value
+
+    @validator("database_routing")
+    @classmethod
+    def database_routing_values(cls, value: str) -> str:
+        """Check the format of the database routes."""
+        parse_database_routing(value)
+        return value
+
+    @validator("readonly_listen_port")
+    @classmethod
+    def readonly_listen_port_values(cls, value: int, values: dict) -> int:
+        """Check that the read-only port isn't bound by another listener or exporter.
+
+        The main listener and the isolated applications take consecutive ports, and the
+        pgbouncer and charm metrics are served on fixed ports.
+        """
+        if not value or "listen_port" not in values or "isolated_applications" not in values:
+            return value
+        listen_port = values["listen_port"]
+        isolated = len(parse_isolated_applications(values["isolated_applications"]))
+        if listen_port <= value <= listen_port + isolated or value in (
+            METRICS_PORT,
+            CHARM_METRICS_PORT,
+        ):
+            raise ValueError(f"Read-only port {value} is already taken by another listener")
+        return value
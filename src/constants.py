@@ -17,6 +17,7 @@ BACKEND_RELATION_NAME = "backend-database"
 DB_RELATION_NAME = "db"
 DB_ADMIN_RELATION_NAME = "db-admin"
 CLIENT_RELATION_NAME = "database"
+SHARD_RELATION_NAME = "backend-shards"
 
 TLS_KEY_FILE = "key.pem"
 TLS_CA_FILE = "ca.pem"
@@ -33,6 +34,31 @@ WAITING_FOR_K8S_SERVICE_MESSAGE = "Waiting for K8s service connectivity"
 
 K8S_SERVICE_CONNECT_TIMEOUT = 3
 
+# Each pgbouncer instance also listens on its own loopback address, next to the listen port it
+# shares with the other instances, so that the charm can reach the admin console of each one.
+INSTANCE_ADDRESS_PREFIX = "127.0.1."
+# Consecutive update-status checks with waiting clients, before a unit reports being saturated
+SATURATION_CHECKS = 2
+# Instance ids of the services of isolated applications start after those of the shared ones,
+# for their loopback addresses and peer ids not to collide
+ISOLATED_SERVICE_ID_OFFSET = 64
+# Values of the K8s service settings in the app databag before they're first applied
+SERVICE_SETTINGS_DEFAULTS = {
+    "current_port": None,
+    "current_isolated_ports": "{}",
+    "current_readonly_port": "0",
+    "current_topology_aware_routing": "False",
+}
+TOPOLOGY_MODE_ANNOTATION = "service.kubernetes.io/topology-mode"
+# Instance id of the dedicated read-only service, after those of the isolated applications
+READONLY_SERVICE_ID = 253
+# Isolated applications whose instance ids fit between the offset and the read-only service id
+MAX_ISOLATED_APPLICATIONS = READONLY_SERVICE_ID - ISOLATED_SERVICE_ID_OFFSET
+TOO_MANY_ISOLATED_APPLICATIONS_MESSAGE = (
+    f"At most {MAX_ISOLATED_APPLICATIONS} applications can be isolated"
+)
+SATURATED_STATUS_PREFIX = "Saturated"
+
 # Labels are not confidential
 SECRET_LABEL = "secret"  # noqa: S105
 ADMIN_PASSWORD_KEY = "admin_password"  # noqa: S105
@@ -52,3 +78,25 @@ SECRET_KEY_OVERRIDES = {
 }
 
 TRACING_RELATION_NAME = "tracing"
+
+# Workload state marked dirty by the event handlers and applied once per dispatch
+DIRTY_AUTH_FILE = "auth_file"
+DIRTY_CONFIG = "config"
+DIRTY_MONITORING = "monitoring"
+DIRTY_ENDPOINTS = "endpoints"
+DIRTY_STATUS = "status"
+DIRTY_READONLY_DBS = "readonly_dbs"
+
+DirtyState = Literal[
+    DIRTY_AUTH_FILE,
+    DIRTY_CONFIG,
+    DIRTY_MONITORING,
+    DIRTY_ENDPOINTS,
+    DIRTY_STATUS,
+    DIRTY_READONLY_DBS,
+]
+
+# Metrics about the charm itself, written to the workload container and served over HTTP
+CHARM_METRICS_PORT = 9128
+CHARM_METRICS_DIR = f"{PGB_DIR}/charm_metrics"
+CHARM_METRICS_FILE = "metrics.txt"
@@ -0,0 +1,146 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Tracing spans around the charm I/O, and a per-hook summary of the time spent in each kind.
+
+ops already traces each hook tool call and Pebble API request. The spans here add the calls
+ops cannot see (backend database connections, K8s API calls and connectivity probes), and the
+charm level context of workload calls, such as the number of bytes pushed.
+"""
+
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import opentelemetry.trace
+from ops.model import _ModelBackend
+
+logger = logging.getLogger(__name__)
+
+tracer = opentelemetry.trace.get_tracer("pgbouncer-k8s")
+
+POSTGRESQL = "postgresql"
+K8S = "k8s"
+PEBBLE = "pebble"
+HOOK_TOOLS = "hook_tools"
+PROBES = "probes"
+CATEGORIES = (POSTGRESQL, K8S, PEBBLE, HOOK_TOOLS, PROBES)
+
+_durations: dict[str, float] = defaultdict(float)
+_calls: dict[str, int] = defaultdict(int)
+
+
+def _record(category: str, duration: float) -> None:
+    _durations[category] += duration
+    _calls[category] += 1
+
+
+@contextmanager
+def trace_io(category: str, operation: str, **attributes):
+    """Trace an I/O call in a child span, and add its duration to the hook summary.
+
+    Args:
+        category: one of CATEGORIES.
+        operation: the call made, e.g. `connect` or `push`.
+        attributes: span attributes describing the call. None values are left out. Never pass
+            sensitive data, such as passwords or file contents.
+
+    Yields:
+        the span, to set attributes known only once the call returns.
+    """
+    start = time.perf_counter()
+    with tracer.start_as_current_span(f"{category}.{operation}") as span:
+        span.set_attribute("io.category", category)
+        for key, value in attributes.items():
+            if value is not None:
+                span.set_attribute(key, value)
+        try:
+            yield span
+        finally:
+            duration = time.perf_counter() - start
+            span.set_attribute("duration_ms", duration * 1000)
+            _record(category, duration)
+
+
+def trace_connections(postgres):
+    """Trace the backend database connections opened through a PostgreSQL charm lib object."""
+    connect = postgres._connect_to_database
+
+    def traced_connect(database: str | None = None, database_host: str | None = None):
+        with trace_io(
+            POSTGRESQL,
+            "connect",
+            **{
+                "db.name": database or postgres.database,
+                "server.address": database_host or postgres.primary_host,
+            },
+        ):
+            return connect(database, database_host)
+
+    postgres._connect_to_database = traced_connect
+    return postgres
+
+
+def instrument_hook_tools(backend) -> None:
+    """Add the time spent in hook tools to the hook summary.
+
+    ops traces every hook tool call in its own span already, so the calls are only timed. ops
+    has no public hook for that, so the private `_wrap_hookcmd` it runs every hook tool in is
+    wrapped, which is why ops is pinned to the versions known to have it. Testing backends that
+    do not run hook tools are left as is.
+    """
+    wrap_hookcmd = getattr(backend, "_wrap_hookcmd", None)
+    if wrap_hookcmd is None:
+        if isinstance(backend, _ModelBackend):
+            logger.warning("Hook tools are not timed: ops no longer wraps them in _wrap_hookcmd")
+        return
+
+    @contextmanager
+    def timed_hookcmd(cmd: str, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with wrap_hookcmd(cmd, *args, **kwargs):
+                yield
+        finally:
+            _record(HOOK_TOOLS, time.perf_counter() - start)
+
+    backend._wrap_hookcmd = timed_hookcmd
+
+
+def reset_hook_summary() -> None:
+    """Forget the I/O of previous hooks, when several run in the same process."""
+    _durations.clear()
+    _calls.clear()
+
+
+def emit_hook_summary(hook: str, started: float) -> dict[str, dict[str, float]]:
+    """Record the time spent in each kind of I/O since the hook started, in a span and the log.
+
+    Args:
+        hook: the dispatched hook.
+        started: `time.perf_counter()` when the charm started handling the hook.
+
+    Returns:
+        the number of calls and the milliseconds spent, by category.
+    """
+    total_ms = (time.perf_counter() - started) * 1000
+    summary = {
+        category: {"calls": _calls[category], "duration_ms": _durations[category] * 1000}
+        for category in CATEGORIES
+    }
+    with tracer.start_as_current_span("hook.summary") as span:
+        span.set_attribute("hook", hook)
+        span.set_attribute("duration_ms", total_ms)
+        for category, values in summary.items():
+            span.set_attribute(f"{category}.calls", values["calls"])
+            span.set_attribute(f"{category}.duration_ms", values["duration_ms"])
+    logger.debug(
+        f"{hook} took {total_ms:.0f}ms: "
+        + ", ".join(
+            f"{category} {values['duration_ms']:.0f}ms in {values['calls']} calls"
+            for category, values in summary.items()
+            if values["calls"]
+        )
+    )
+    return summary
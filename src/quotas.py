@@ -0,0 +1,85 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Fair share of the server connections between the users of the client relations.
+
+max_db_connections limits the server connections of each database on each pgbouncer instance, so
+it's split between the users of the same database. Every user gets a guaranteed share of the
+budget, and a burst share on top of it. Half of what's left after the guaranteed shares is split
+evenly, as headroom for users to grow into, and the other half by the observed demand above the
+guaranteed shares. The burst share is rendered as the user's max_user_connections, so that the
+users can't take more than the budget together, and every user can always get its guaranteed
+share.
+
+With more users than connections in the budget, the guaranteed shares of one connection can't
+cover every user: the first users in name order get them, and the others none. Every user can
+still burst to one connection, max_db_connections keeping the total within the budget.
+"""
+
+import logging
+from typing import TypedDict
+
+logger = logging.getLogger(__name__)
+
+# Relative and absolute change in a user's observed connections for the usage to be republished
+USAGE_TOLERANCE = 0.2
+USAGE_MIN_CHANGE = 2
+
+
+class Quota(TypedDict):
+    """Server connections a user can take on a pgbouncer instance."""
+
+    guaranteed: int
+    burst: int
+
+
+def compute_quotas(users: list[str], budget: int, usage: dict[str, int]) -> dict[str, Quota]:
+    """Split the connection budget of a database on a pgbouncer instance between its users.
+
+    Args:
+        users: the users of the database, sharing the budget.
+        budget: max_db_connections of the database, 0 for unlimited.
+        usage: the server connections each user was last seen holding on an instance.
+
+    Returns:
+        The quota of each user, none if the budget is unlimited.
+    """
+    if not budget or not users:
+        return {}
+
+    users = sorted(users)
+    if len(users) > budget:
+        logger.warning(
+            f"{len(users)} users share {budget} connections, "
+            f"{len(users) - budget} of them get no guaranteed connection"
+        )
+        return {
+            user: Quota(guaranteed=int(index < budget), burst=1)
+            for index, user in enumerate(users)
+        }
+
+    guaranteed = max(budget // (2 * len(users)), 1)
+    spare = max(budget - guaranteed * len(users), 0)
+    headroom = spare // 2 // len(users)
+    spare -= headroom * len(users)
+
+    demand = {user: max(usage.get(user, 0) - guaranteed, 0) for user in users}
+    total_demand = sum(demand.values())
+    quotas = {}
+    for user in users:
+        extra = spare * demand[user] // total_demand if total_demand else spare // len(users)
+        quotas[user] = Quota(
+            guaranteed=guaranteed, burst=min(guaranteed + headroom + extra, budget)
+        )
+    return quotas
+
+
+def usage_changed(previous: dict[str, int], current: dict[str, int]) -> bool:
+    """Whether the observed usage moved enough to rebalance the quotas."""
+    if previous.keys() != current.keys():
+        return True
+    return any(
+        abs(current[user] - previous[user])
+        >= max(USAGE_MIN_CHANGE, previous[user] * USAGE_TOLERANCE)
+        for user in current
+    )
@@ -70,15 +70,119 @@ from constants import (
     APP_SCOPE,
     AUTH_FILE_DATABAG_KEY,
     BACKEND_RELATION_NAME,
+    DIRTY_AUTH_FILE,
+    DIRTY_CONFIG,
+    DIRTY_ENDPOINTS,
+    DIRTY_READONLY_DBS,
+    DIRTY_STATUS,
     MONITORING_PASSWORD_KEY,
     PG,
     PGB,
 )
+from instrumentation import trace_connections
 
 logger = logging.getLogger(__name__)
 
 
-class BackendDatabaseRequires(Object):
+def connect_backend(
+    endpoint: str, user: str, password: str, version: str | None, database: str
+) -> PostgreSQLv0 | PostgreSQLv1:
+    """PostgreSQL representation of a backend cluster, for the version it runs."""
+    postgresql_class = PostgreSQLv0 if version and version.split(".")[0] == "14" else PostgreSQLv1
+    return trace_connections(
+        postgresql_class(
+            primary_host=endpoint.split(":")[0],
+            current_host=endpoint.split(":")[0],
+            user=user,
+            password=password,
+            database=database,
+        )
+    )
+
+
+class BackendCluster:
+    """Auth function and pg_hba helpers of a backend PostgreSQL cluster.
+
+    Subclasses provide the `charm`, `postgres`, `auth_user`, `auth_schema` and `backend_version`
+    of the cluster. `auth_schema` is the schema of the auth function, which the global auth_query
+    of pgbouncer calls on every cluster.
+    """
+
+    def initialise_auth_function(self, dbs: list[str]):
+        """Runs an SQL script to initialise the auth function.
+
+        This function must run in every database for authentication to work correctly, and assumes
+        self.postgres is set up correctly.
+
+        Args:
+            dbs: a list of database names to connect to.
+
+        Raises:
+            psycopg2.Error if self.postgres isn't usable.
+        """
+        logger.info("initialising auth function")
+        with open("src/relations/sql/pgbouncer-install.sql") as f:
+            install_script = f.read()
+
+        for dbname in dbs:
+            with self.postgres._connect_to_database(dbname) as conn, conn.cursor() as cursor:
+                cursor.execute("RESET ROLE;")
+                cursor.execute(
+                    install_script.replace("auth_schema", self.auth_schema).replace(
+                        "auth_user", self.auth_user
+                    )
+                )
+            conn.close()
+        logger.info("auth function initialised")
+
+    def remove_auth_function(self, dbs: list[str]):
+        """Runs an SQL script to remove auth function.
+
+        pgbouncer-uninstall doesn't actually uninstall anything - it actually removes permissions
+        for the auth user.
+
+        Args:
+            dbs: a list of database names to connect to.
+
+        Raises:
+            psycopg2.Error if self.postgres isn't usable.
+        """
+        logger.info("removing auth function from backend relation")
+        with open("src/relations/sql/pgbouncer-uninstall.sql") as f:
+            uninstall_script = f.read()
+        for dbname in dbs:
+            if isinstance(self.postgres, PostgreSQLv0) or len(dbname) < 50:
+                with self.postgres._connect_to_database(dbname) as conn, conn.cursor() as cursor:
+                    cursor.execute("RESET ROLE;")
+                    cursor.execute(
+                        uninstall_script.replace("auth_schema", self.auth_schema).replace(
+                            "auth_user", self.auth_user
+                        )
+                    )
+                conn.close()
+            elif (
+                self.charm._has_blocked_status
+                and self.charm.unit.status.message == "invalid database name"
+            ):
+                self.charm.unit.status = ActiveStatus()
+        logger.info("auth function removed")
+
+    def sync_hba(self, user: str) -> None:
+        """Wait for user to appear in pg_hba table."""
+        # Check for version supporting hardening
+        if self.backend_version and self.backend_version < "14.16":
+            return
+
+        try:
+            for attempt in Retrying(stop=stop_after_delay(90), wait=wait_fixed(15)):
+                with attempt:
+                    if not self.postgres.is_user_in_hba(user):
+                        raise Exception("pg_hba not ready")
+        except RetryError:
+            logger.warning("database requested: Unable to check pg_hba rule update")
+
+
+class BackendDatabaseRequires(BackendCluster, Object):
     """Defines functionality for the 'requires' side of the 'backend-database' relation.
 
     The data created in this relation allows the pgbouncer charm to connect to the postgres charm.
@@ -139,21 +243,7 @@ class BackendDatabaseRequires(Object):
         if None in [endpoint, user, password]:
             return None
 
-        if version.split(".")[0] == "14":
-            return PostgreSQLv0(
-                primary_host=endpoint.split(":")[0],
-                current_host=endpoint.split(":")[0],
-                user=user,
-                password=password,
-                database=database,
-            )
-        return PostgreSQLv1(
-            primary_host=endpoint.split(":")[0],
-            current_host=endpoint.split(":")[0],
-            user=user,
-            password=password,
-            database=database,
-        )
+        return connect_backend(endpoint, user, password, version, database)
 
     @property
     def backend_version(self) -> str:
@@ -174,6 +264,11 @@ class BackendDatabaseRequires(Object):
             return None
         return f"pgbouncer_auth_{username}".replace("-", "_")
 
+    @property
+    def auth_schema(self) -> str | None:
+        """Schema of the auth function, named after the auth user."""
+        return self.auth_user
+
     @cached_property
     def stats_user(self) -> str:
         """Username for stats."""
@@ -194,7 +289,7 @@ class BackendDatabaseRequires(Object):
         if not self.relation:
             return ""
         # auth user is internally generated
-        return f"SELECT username, password FROM {self.auth_user}.get_auth($1)"  # noqa: S608
+        return f"SELECT username, password FROM {self.auth_schema}.get_auth($1)"  # noqa: S608
 
     @property
     def postgres_databag(self) -> dict | None:
@@ -308,16 +403,13 @@ class BackendDatabaseRequires(Object):
         try:
             if not self.charm.get_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY):
                 logger.debug("_on_database_created deferred: waiting for leader to initialise")
-                event.defer()
+                self.charm.defer(event)
                 return
         except ModelError:
-            event.defer()
+            self.charm.defer(event)
             logger.error("deferring database-created hook - cannot access secrets")
             return
-        self.charm.render_auth_file()
-        self.charm.render_pgb_config()
-        self.charm.toggle_monitoring_layer(True)
-        self.charm.update_status()
+        self.charm.mark_dirty(DIRTY_AUTH_FILE, DIRTY_CONFIG, DIRTY_STATUS, monitoring_enabled=True)
         return
 
     def _on_database_created(self, event: DatabaseCreatedEvent) -> None:
@@ -335,16 +427,16 @@ class BackendDatabaseRequires(Object):
         try:
             if not self.charm.check_pgb_running():
                 logger.debug("_on_database_created deferred: PGB not running")
-                event.defer()
+                self.charm.defer(event)
                 return
         except PebbleConnectionError:
             # on_pebble_ready hasn't been fired yet, so wait
             logger.debug("_on_database_created deferred: pebble ready not fired")
-            event.defer()
+            self.charm.defer(event)
             return
 
         if self.postgres is None or self.relation.data[self.charm.app].get("database") is None:
-            event.defer()
+            self.charm.defer(event)
             logger.error("deferring database-created hook - postgres database not ready")
             return
 
@@ -356,14 +448,14 @@ class BackendDatabaseRequires(Object):
                 self.stats_user, MONITORING_PASSWORD_KEY
             )
         ):
-            event.defer()
+            self.charm.defer(event)
             logger.error("deferring database-created hook - cannot hash password")
             return
         # Add the admin console user.
         if not (
             hashed_admin_password := self.generate_system_user(self.admin_user, ADMIN_PASSWORD_KEY)
         ):
-            event.defer()
+            self.charm.defer(event)
             logger.error("deferring database-created hook - cannot admin hash password")
             return
         # create authentication user on postgres database, so we can authenticate other users
@@ -372,7 +464,7 @@ class BackendDatabaseRequires(Object):
         try:
             self.initialise_auth_function(self.collect_databases())
         except Exception as e:
-            event.defer()
+            self.charm.defer(event)
             logger.error(
                 f"deferring database-created hook - Unable to initialise auth function: {e}"
             )
@@ -383,17 +475,24 @@ class BackendDatabaseRequires(Object):
             f'"{self.stats_user}" "{hashed_monitoring_password}"\n'
             f'"{self.admin_user}" "{hashed_admin_password}"'
         )
+        # Keep the auth users of the shards initialised already
+        for line in self.charm.backend_shards.auth_lines(
+            self.charm.get_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY) or ""
+        ):
+            auth_file += f"\n{line}"
         self.charm.set_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY, auth_file)
-        self.charm.render_auth_file()
-
-        self.charm.render_pgb_config()
-        self.charm.toggle_monitoring_layer(True)
-
-        self.charm.update_status()
+        self.charm.mark_dirty(
+            DIRTY_AUTH_FILE,
+            DIRTY_CONFIG,
+            DIRTY_STATUS,
+            DIRTY_READONLY_DBS,
+            monitoring_enabled=True,
+        )
 
     def _on_endpoints_changed(self, _):
-        self.charm.render_pgb_config()
-        self.charm.update_client_connection_info()
+        self.charm.charm_metrics.record_endpoints_change()
+        # A new primary may come with the databases of a restored backup
+        self.charm.mark_dirty(DIRTY_CONFIG, DIRTY_ENDPOINTS, DIRTY_READONLY_DBS)
 
     def _on_relation_changed(self, _):
         try:
@@ -405,8 +504,7 @@ class BackendDatabaseRequires(Object):
             logger.debug("_on_reltion_changed early exit: pebble ready not fired")
             return
 
-        self.charm.render_pgb_config()
-        self.charm.update_client_connection_info()
+        self.charm.mark_dirty(DIRTY_CONFIG, DIRTY_ENDPOINTS)
 
     def _on_relation_departed(self, event: RelationDepartedEvent):
         """Runs pgbouncer-uninstall.sql and removes auth user.
@@ -416,8 +514,8 @@ class BackendDatabaseRequires(Object):
         users we create.
         """
         if self.charm.peers.relation:
-            self.charm.render_pgb_config()
-        self.charm.update_client_connection_info()
+            self.charm.mark_dirty(DIRTY_CONFIG)
+        self.charm.mark_dirty(DIRTY_ENDPOINTS)
 
         if event.departing_unit == self.charm.unit:
             # This should only occur when the relation is being removed, not on scale-down
@@ -479,57 +577,6 @@ class BackendDatabaseRequires(Object):
             "waiting for backend database relation to initialise"
         )
 
-    def initialise_auth_function(self, dbs: list[str]):
-        """Runs an SQL script to initialise the auth function.
-
-        This function must run in every database for authentication to work correctly, and assumes
-        self.postgres is set up correctly.
-
-        Args:
-            dbs: a list of database names to connect to.
-
-        Raises:
-            psycopg2.Error if self.postgres isn't usable.
-        """
-        logger.info("initialising auth function")
-        with open("src/relations/sql/pgbouncer-install.sql") as f:
-            install_script = f.read()
-
-        for dbname in dbs:
-            with self.postgres._connect_to_database(dbname) as conn, conn.cursor() as cursor:
-                cursor.execute("RESET ROLE;")
-                cursor.execute(install_script.replace("auth_user", self.auth_user))
-            conn.close()
-        logger.info("auth function initialised")
-
-    def remove_auth_function(self, dbs: list[str]):
-        """Runs an SQL script to remove auth function.
-
-        pgbouncer-uninstall doesn't actually uninstall anything - it actually removes permissions
-        for the auth user.
-
-        Args:
-            dbs: a list of database names to connect to.
-
-        Raises:
-            psycopg2.Error if self.postgres isn't usable.
-        """
-        logger.info("removing auth function from backend relation")
-        with open("src/relations/sql/pgbouncer-uninstall.sql") as f:
-            uninstall_script = f.read()
-        for dbname in dbs:
-            if isinstance(self.postgres, PostgreSQLv0) or len(dbname) < 50:
-                with self.postgres._connect_to_database(dbname) as conn, conn.cursor() as cursor:
-                    cursor.execute("RESET ROLE;")
-                    cursor.execute(uninstall_script.replace("auth_user", self.auth_user))
-                conn.close()
-            elif (
-                self.charm._has_blocked_status
-                and self.charm.unit.status.message == "invalid database name"
-            ):
-                self.charm.unit.status = ActiveStatus()
-        logger.info("auth function removed")
-
     def get_read_only_endpoints(self) -> set[str]:
         """Get read-only-endpoints from backend relation."""
         read_only_endpoints = self.postgres_databag.get("read-only-endpoints", None)
@@ -550,17 +597,3 @@ class BackendDatabaseRequires(Object):
             self.charm.unit.status = WaitingStatus(wait_str)
             return False
         return True
-
-    def sync_hba(self, user: str) -> None:
-        """Wait for user to appear in pg_hba table."""
-        # Check for version supporting hardening
-        if self.backend_version and self.backend_version < "14.16":
-            return
-
-        try:
-            for attempt in Retrying(stop=stop_after_delay(90), wait=wait_fixed(15)):
-                with attempt:
-                    if not self.postgres.is_user_in_hba(user):
-                        raise Exception("pg_hba not ready")
-        except RetryError:
-            logger.warning("database requested: Unable to check pg_hba rule update")
@@ -0,0 +1,268 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Pgbouncer backend-shards relation hooks & helpers.
+
+Besides the backend-database cluster, pgbouncer can route client databases to more PostgreSQL
+clusters related through backend-shards. The database-routing config option maps database names
+to the applications of those clusters; every other database is served by backend-database.
+
+Each shard gets an auth user of its own, with the auth function installed in the databases routed
+to it, and its line in the auth file shared by the pgbouncer instances. backend-database keeps
+owning the pgbouncer system users and the wildcard and read-only database discovery.
+"""
+
+import logging
+
+from charms.data_platform_libs.v0.data_interfaces import DatabaseCreatedEvent, DatabaseRequires
+from charms.pgbouncer_k8s.v0.pgb import generate_password, get_md5_password
+from charms.postgresql_k8s.v0.postgresql import PostgreSQL as PostgreSQLv0
+from ops import (
+    Application,
+    CharmBase,
+    Object,
+    Relation,
+    RelationDepartedEvent,
+    RelationEvent,
+)
+from single_kernel_postgresql.compat.postgresql import PostgreSQLBase as PostgreSQLv1
+
+from config import parse_database_routing
+from constants import (
+    APP_SCOPE,
+    AUTH_FILE_DATABAG_KEY,
+    DIRTY_AUTH_FILE,
+    DIRTY_CONFIG,
+    DIRTY_ENDPOINTS,
+    PG,
+    PGB,
+    SHARD_RELATION_NAME,
+)
+from relations.backend_database import BackendCluster, connect_backend
+
+logger = logging.getLogger(__name__)
+
+
+class ShardBackend(BackendCluster):
+    """A backend PostgreSQL cluster related through backend-shards."""
+
+    def __init__(self, charm: CharmBase, database: DatabaseRequires, relation: Relation):
+        self.charm = charm
+        self.database = database
+        self.relation = relation
+
+    @property
+    def application(self) -> str:
+        """Name of the PostgreSQL application."""
+        return self.relation.app.name
+
+    @property
+    def postgres_databag(self) -> dict:
+        """The databag of the PostgreSQL application."""
+        for key, databag in self.relation.data.items():
+            if isinstance(key, Application) and key != self.charm.app:
+                return databag
+        return {}
+
+    @property
+    def endpoint(self) -> str | None:
+        """Host and port of the primary."""
+        return self.postgres_databag.get("endpoints")
+
+    @property
+    def backend_version(self) -> str:
+        """PostgreSQL version of the cluster."""
+        return self.database.fetch_relation_field(self.relation.id, "version") or ""
+
+    @property
+    def auth_user(self) -> str | None:
+        """Username of the auth user of the shard.
+
+        The relation id tells it apart from the auth users of the clusters that gave pgbouncer
+        the same relation username.
+        """
+        if not (username := self.database.fetch_relation_field(self.relation.id, "username")):
+            return None
+        return f"pgbouncer_auth_{username}_shard_{self.relation.id}".replace("-", "_")
+
+    @property
+    def auth_schema(self) -> str | None:
+        """Schema of the auth function, the one of the main backend.
+
+        The auth_query of pgbouncer is global, so the auth function has the same schema on every
+        cluster.
+        """
+        return self.charm.backend.auth_schema
+
+    @property
+    def postgres(self) -> PostgreSQLv0 | PostgreSQLv1 | None:
+        """PostgreSQL representation of the cluster, None if the relation isn't initialised."""
+        user = self.database.fetch_relation_field(self.relation.id, "username")
+        password = self.database.fetch_relation_field(self.relation.id, "password")
+        if None in [self.endpoint, user, password]:
+            return None
+        return connect_backend(
+            self.endpoint, user, password, self.backend_version, self.database.database
+        )
+
+    def get_read_only_endpoints(self) -> set[str]:
+        """Hosts and ports of the replicas."""
+        if not (read_only_endpoints := self.postgres_databag.get("read-only-endpoints")):
+            return set()
+        return set(read_only_endpoints.split(","))
+
+    @property
+    def ready(self) -> bool:
+        """Whether pgbouncer can authenticate the clients of the shard."""
+        return bool(
+            self.endpoint
+            and (auth_user := self.auth_user)
+            and f'"{auth_user}" '
+            in (self.charm.get_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY) or "")
+        )
+
+
+class BackendShards(Object):
+    """Defines functionality for the 'requires' side of the 'backend-shards' relation.
+
+    Hook events observed:
+        - database-created
+        - database-endpoints-changed
+        - database-read-only-endpoints-changed
+        - relation-departed
+        - relation-broken
+    """
+
+    def __init__(self, charm: CharmBase):
+        super().__init__(charm, SHARD_RELATION_NAME)
+
+        self.charm = charm
+        self.database = DatabaseRequires(
+            self.charm,
+            relation_name=SHARD_RELATION_NAME,
+            database_name=PGB,
+            extra_user_roles="SUPERUSER",
+        )
+
+        self.framework.observe(self.database.on.database_created, self._on_database_created)
+        self.framework.observe(self.database.on.endpoints_changed, self._on_endpoints_changed)
+        self.framework.observe(
+            self.database.on.read_only_endpoints_changed, self._on_endpoints_changed
+        )
+        self.framework.observe(
+            charm.on[SHARD_RELATION_NAME].relation_departed, self._on_relation_departed
+        )
+        self.framework.observe(
+            charm.on[SHARD_RELATION_NAME].relation_broken, self._on_relation_broken
+        )
+
+    @property
+    def shards(self) -> dict[str, ShardBackend]:
+        """The related shards, by PostgreSQL application name."""
+        return {
+            relation.app.name: ShardBackend(self.charm, self.database, relation)
+            for relation in self.model.relations[SHARD_RELATION_NAME]
+            if relation.app
+        }
+
+    def routing(self) -> dict[str, ShardBackend | None]:
+        """The shard of each database routed away from backend-database.
+
+        Databases routed to a shard that isn't related or ready map to None, for them not to
+        be served by the wrong cluster in the meantime.
+        """
+        try:
+            routes = parse_database_routing(self.charm.config.database_routing)
+        except ValueError:
+            return {}
+        if not routes:
+            return {}
+        shards = {name: shard for name, shard in self.shards.items() if shard.ready}
+        return {database: shards.get(application) for database, application in routes.items()}
+
+    def routed_databases(self, shard: ShardBackend) -> list[str]:
+        """The client databases routed to the shard."""
+        try:
+            routes = parse_database_routing(self.charm.config.database_routing)
+        except ValueError:
+            return []
+        databases = {database["name"] for database in self.charm.get_relation_databases().values()}
+        return sorted(
+            database
+            for database, application in routes.items()
+            if application == shard.application and database in databases
+        )
+
+    def auth_lines(self, auth_file: str) -> list[str]:
+        """The lines of the auth users of the related shards in the auth file."""
+        auth_users = {shard.auth_user for shard in self.shards.values()} - {None}
+        return [
+            line for line in auth_file.split("\n") if line.split(" ")[0].strip('"') in auth_users
+        ]
+
+    def _on_database_created(self, event: DatabaseCreatedEvent) -> None:
+        """Create the auth user of the shard, and add it to the auth file."""
+        if not self.charm.unit.is_leader():
+            return
+
+        shard = ShardBackend(self.charm, self.database, event.relation)
+        auth_file = self.charm.get_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY)
+        if not auth_file or not shard.postgres or not shard.auth_user or not shard.auth_schema:
+            logger.debug("Deferring shard database-created: backend-database not initialised")
+            self.charm.defer(event)
+            return
+
+        password = generate_password()
+        hashed_password = get_md5_password(shard.auth_user, password)
+        try:
+            shard.postgres.create_user(shard.auth_user, hashed_password, admin=True)
+            shard.initialise_auth_function([PGB, PG, *self.routed_databases(shard)])
+        except Exception as e:
+            logger.error(f"Deferring shard database-created: unable to create auth user: {e}")
+            self.charm.defer(event)
+            return
+
+        lines = [
+            line for line in auth_file.split("\n") if not line.startswith(f'"{shard.auth_user}" ')
+        ]
+        lines.append(f'"{shard.auth_user}" "{hashed_password}"')
+        self.charm.set_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY, "\n".join(lines))
+        logger.info(f"Shard {shard.application} initialised")
+        self.charm.mark_dirty(DIRTY_AUTH_FILE, DIRTY_CONFIG, DIRTY_ENDPOINTS)
+
+    def _on_endpoints_changed(self, _) -> None:
+        self.charm.mark_dirty(DIRTY_CONFIG, DIRTY_ENDPOINTS)
+
+    def _on_relation_departed(self, event: RelationDepartedEvent) -> None:
+        """Remove the auth user of the shard once the last PostgreSQL unit departs.
+
+        The credentials of the relation are gone by relation-broken.
+        """
+        if (
+            not self.charm.unit.is_leader()
+            or event.departing_unit is None
+            or event.departing_unit.app == self.charm.app
+            or event.relation.units
+        ):
+            return
+
+        shard = ShardBackend(self.charm, self.database, event.relation)
+        if not shard.postgres or not shard.auth_user or not shard.auth_schema:
+            return
+        try:
+            shard.remove_auth_function([PGB, PG, *self.routed_databases(shard)])
+            shard.postgres.delete_user(shard.auth_user)
+        except Exception as e:
+            logger.warning(f"Unable to remove the auth user of shard {shard.application}: {e}")
+
+    def _on_relation_broken(self, event: RelationEvent) -> None:
+        """Stop routing to the shard, and drop its auth user from the auth file."""
+        self.charm.mark_dirty(DIRTY_CONFIG, DIRTY_ENDPOINTS)
+        if not self.charm.unit.is_leader():
+            return
+        auth_file = self.charm.get_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY) or ""
+        suffix = f'_shard_{event.relation.id}" '
+        lines = [line for line in auth_file.split("\n") if suffix not in line]
+        if auth_file and len(lines) != len(auth_file.split("\n")):
+            self.charm.set_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY, "\n".join(lines))
+            self.charm.mark_dirty(DIRTY_AUTH_FILE)
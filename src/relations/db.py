@@ -57,7 +57,6 @@ Some example relation data is below. All values are examples, generated in a run
 
 import logging
 from collections.abc import Iterable
-from hashlib import shake_128
 
 from charms.pgbouncer_k8s.v0 import pgb
 from charms.postgresql_k8s.v0.postgresql import (
@@ -84,7 +83,7 @@ from ops.model import (
 )
 from single_kernel_postgresql.compat.postgresql import PostgreSQLBase as PostgreSQLv1
 
-from constants import EXTENSIONS_BLOCKING_MESSAGE
+from constants import DIRTY_CONFIG, DIRTY_READONLY_DBS, EXTENSIONS_BLOCKING_MESSAGE
 
 logger = logging.getLogger(__name__)
 
@@ -202,20 +201,19 @@ class DbProvides(Object):
 
         If the backend relation is fully initialised and available, we generate the proposed
         database and create a user on the postgres charm, and add preliminary data to the databag.
+        When some units haven't yet rendered the config with the new database, the relation is
+        recorded as pending and the leader onboards it once every unit acked the config.
 
         Deferrals:
             - If backend is unavailable
-            - If pgbouncer has not started
             - If database hasn't been added to the databag by the client charm
-            - If password hasn't been added to the databag by this charm, implying that a user
-              has not been created.
         """
         if not self.charm.unit.is_leader():
             return
 
         if not self.charm.backend.check_backend():
             # We can't relate an app to the backend database without a backend postgres relation
-            join_event.defer()
+            self.charm.defer(join_event)
             return
 
         logger.info(f"Setting up {self.relation_name} relation")
@@ -229,38 +227,48 @@ class DbProvides(Object):
             return
 
         database = remote_app_databag.get("database")
-        user = self._generate_username(join_event.relation)
-
-        databag = self.get_databags(join_event.relation)[0]
-        password = databag.get("password", pgb.generate_password())
-
-        if None in [database, password]:
+        if database is None:
             # If database isn't available, defer
-            join_event.defer()
+            self.charm.defer(join_event)
             return
 
-        dbs = self.charm.generate_relation_databases()
-        dbs[str(join_event.relation.id)] = {"name": database, "legacy": True}
+        entry = {"name": database, "legacy": True}
         if self.admin:
-            dbs["*"] = {"name": "*", "auth_dbname": database, "legacy": False}
-        self.charm.set_relation_databases(dbs)
-
-        pgb_dbs_hash = shake_128(
-            self.charm.peers.app_databag["pgb_dbs_config"].encode()
-        ).hexdigest(16)
-        for key, data in self.charm.peers.relation.data.items():
-            # We skip the leader so we don't have to wait on the defer
-            if (
-                key != self.charm.app
-                and key != self.charm.unit
-                and data.get("pgb_dbs", "") != pgb_dbs_hash
-            ):
-                logger.debug("Not all units have synced configuration")
-                join_event.defer()
-                return
+            entry["wildcard"] = True
+        self.charm.update_relation_databases({str(join_event.relation.id): entry})
+
+        if not self.charm.peers.units_synced():
+            # The leader finishes the onboarding once every unit acked the new config
+            logger.debug("Not all units have synced configuration, postponing onboarding")
+            self.charm.peers.add_pending_onboarding(join_event.relation)
+            return
+
+        if not self.onboard_relation(join_event.relation, remote_app_databag):
+            # Retried by the leader on the next peer change or update-status
+            self.charm.peers.add_pending_onboarding(join_event.relation)
+
+    def onboard_relation(self, relation: Relation, remote_app_databag=None) -> bool:
+        """Create the user and database for the relation and share the credentials.
+
+        Only called once every unit has rendered the config that includes the relation database.
+
+        Returns:
+            Whether the relation was onboarded, False when it has to be retried later.
+        """
+        if remote_app_databag is None:
+            remote_app_databag = relation.data[relation.app]
+        database = remote_app_databag.get("database")
+        user = self._generate_username(relation)
+
+        databag = self.get_databags(relation)[0]
+        password = databag.get("password", pgb.generate_password())
+
+        if None in [database, password]:
+            logger.warning(f"{self.relation_name} relation {relation.id} has no database yet")
+            return False
 
         self.update_databags(
-            join_event.relation,
+            relation,
             {
                 "user": user,
                 "password": password,
@@ -286,6 +294,8 @@ class DbProvides(Object):
                     database, user, client_relations=self.charm.client_relations
                 )
             created_msg = f"database and user for {self.relation_name} relation created"
+            # The database gets a read-only alias along the wildcard once the relation is gone
+            self.charm.mark_dirty(DIRTY_READONLY_DBS)
             self.charm.unit.status = initial_status
             self.charm.update_status()
             logger.info(created_msg)
@@ -297,13 +307,14 @@ class DbProvides(Object):
             err_msg = f"failed to create database or user for {self.relation_name}"
             logger.error(err_msg)
             self.charm.unit.status = BlockedStatus(err_msg)
-            return
+            return False
 
         # set up auth function
         self.charm.backend.remove_auth_function(dbs=[database])
         self.charm.backend.initialise_auth_function([database])
 
         self.charm.backend.sync_hba(user)
+        return True
 
     def _on_relation_changed(self, change_event: RelationChangedEvent):
         """Handle db-relation-changed event.
@@ -317,7 +328,7 @@ class DbProvides(Object):
         """
         if not self.charm.backend.check_backend():
             # We can't relate an app to the backend database without a backend postgres relation
-            change_event.defer()
+            self.charm.defer(change_event)
             return
 
         logger.warning(
@@ -336,10 +347,10 @@ class DbProvides(Object):
             logger.warning(
                 "relation not fully initialised - deferring until join_event is complete"
             )
-            change_event.defer()
+            self.charm.defer(change_event)
             return
 
-        self.charm.render_pgb_config()
+        self.charm.mark_dirty(DIRTY_CONFIG)
         if self.charm.unit.is_leader():
             self.update_connection_info(change_event.relation, self.charm.config.listen_port)
             self.update_databags(
@@ -358,8 +369,17 @@ class DbProvides(Object):
                 },
             )
 
-    def update_connection_info(self, relation: Relation, port: str):
-        """Updates databag connection information."""
+    def update_connection_info(
+        self, relation: Relation, port: str, endpoints: tuple[str, str] | None = None
+    ):
+        """Updates databag connection information.
+
+        Args:
+            relation: the relation to update.
+            port: the listen port.
+            endpoints: the read-write and read-only endpoints, read from the K8s service if not
+                given, e.g. when updating several relations.
+        """
         if not self.charm.configuration_check():
             return
 
@@ -375,7 +395,11 @@ class DbProvides(Object):
             logger.warning("relation not fully initialised - skipping port update")
             return
 
-        read_write_host = self.charm.read_write_endpoints.split(",")[0].split(":")[0]
+        read_write_endpoints, read_only_endpoints = endpoints or (
+            self.charm.read_write_endpoints,
+            self.charm.read_only_endpoints,
+        )
+        read_write_host = read_write_endpoints.split(",")[0].split(":")[0]
 
         master_dbconnstr = {
             "host": read_write_host,
@@ -392,9 +416,7 @@ class DbProvides(Object):
             "host": read_write_host,
         }
 
-        read_only_hosts = [
-            host.split(":")[0] for host in self.charm.read_only_endpoints.split(",")
-        ]
+        read_only_hosts = [host.split(":")[0] for host in read_only_endpoints.split(",")]
         # Only one standby value in legacy relation on pgbouncer. There are multiple standbys on
         # postgres, but not on the legacy pgbouncer charm.
         if len(read_only_hosts) > 0:
@@ -404,6 +426,8 @@ class DbProvides(Object):
                 "host": standby_ip,
                 "dbname": f"{database}_standby" if len(f"{database}_standby") < 64 else database,
             })
+            if readonly := self.charm.readonly_service():
+                standby_dbconnstr["port"] = readonly["port"]
             connection_updates["standbys"] = pgb.parse_dict_to_kv_string(standby_dbconnstr)
 
         self.update_databags(relation, connection_updates)
@@ -467,31 +491,37 @@ class DbProvides(Object):
                 logger.warning(
                     f"backend relation not yet available - deferring {self.relation_name}-relation-broken event."
                 )
-                broken_event.defer()
+                self.charm.defer(broken_event)
             else:
                 # check if this relation was blocking the charm
                 self._check_for_blocking_relations(broken_event.relation.id)
             return
 
-        dbs = self.charm.get_relation_databases()
-        database = dbs.pop(str(broken_event.relation.id), {}).get("name")
-        self.charm.set_relation_databases(dbs)
+        relation_id = str(broken_event.relation.id)
+        database = (self.charm.peers.relation_database(relation_id) or {}).get("name")
+        self.charm.update_relation_databases({relation_id: None})
         if self.charm.unit.is_leader():
             self.charm.backend.postgres.delete_user(user)
-            delete_db = database not in [db["name"] for db in dbs.values()]
+            delete_db = database not in [
+                db["name"] for db in self.charm.get_relation_databases().values()
+            ]
             if database and delete_db:
                 self.charm.backend.remove_auth_function(dbs=[database])
 
         self._check_for_blocking_relations(broken_event.relation.id)
 
     def update_databags(self, relation, updates: dict[str, str]):
-        """Updates databag with the given dict."""
+        """Updates databag with the given dict, writing only the fields that changed."""
         # Databag entries can only be strings
         for key, item in updates.items():
             updates[key] = str(item)
 
         for databag in self.get_databags(relation):
-            databag.update(updates)
+            # Juju drops empty values from the databag, so an unset field matches an empty one
+            if changes := {
+                key: value for key, value in updates.items() if databag.get(key, "") != value
+            }:
+                databag.update(changes)
 
     def _generate_username(self, relation):
         """Generates a unique username for this relation."""
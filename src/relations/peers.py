@@ -18,7 +18,8 @@ Example:
 │ application data │ ╭──────────────────────────────────────────────────────────────────────────────────────────────╮ │
 │                  │ │                                                                                              │ │
 │                  │ │  auth_file        "pgbouncer_auth_relation_id_3" "md5aad46d9afbcc8c8248d254d567b577c1"       │ │
-│                  │ │  pgb_dbs_config   '{"1": {"name": "db_name", "legacy": false}}'                              │ │
+│                  │ │  pgb_db_1         {"legacy":false,"name":"db_name"}                                          │ │
+│                  │ │  pgb_dbs_version  4                                                                          │ │
 │                  │ │  leader_hostname  pgbouncer-k8s-0.pgbouncer-k8s-endpoints.test-pgbouncer-provider-gnrj.svc…  │ │
 │                  │ │  relation_id_4    Z4OtFCe6r5HG6mk1XuR6LkwZ                                                   │ │
 │                  │ ╰──────────────────────────────────────────────────────────────────────────────────────────────╯ │
@@ -29,16 +30,37 @@ Example:
 
 """
 
+import json
 import logging
 from hashlib import shake_128
 
 from ops.charm import CharmBase, HookEvent, RelationCreatedEvent
-from ops.framework import Object
+from ops.framework import Object, StoredState
 from ops.model import Relation, Unit
 
-from constants import APP_SCOPE, PEER_RELATION_NAME, UNIT_SCOPE, Scopes
+from constants import (
+    APP_SCOPE,
+    AUTH_FILE_DATABAG_KEY,
+    DIRTY_CONFIG,
+    DIRTY_ENDPOINTS,
+    DIRTY_MONITORING,
+    MONITORING_PASSWORD_KEY,
+    PEER_RELATION_NAME,
+    UNIT_SCOPE,
+    Scopes,
+)
 
 ADDRESS_KEY = "private-address"
+# Whether the unit has TLS files, unset until they were first read
+TLS_ENABLED_KEY = "tls_enabled"
+PENDING_ONBOARDING_KEY = "pending_onboarding"
+# Each relation database entry has a key of its own, and the version counts the updates
+DATABASE_KEY_PREFIX = "pgb_db_"
+DATABASES_VERSION_KEY = "pgb_dbs_version"
+# Single JSON blob of the entries, as written by earlier revisions. It's kept up to date while
+# an upgrade runs, with its hash, for the units still running an earlier revision
+LEGACY_DATABASES_KEY = "pgb_dbs_config"
+LEGACY_DATABASES_HASH_KEY = "pgb_dbs_config_hash"
 
 
 logger = logging.getLogger(__name__)
@@ -55,10 +77,15 @@ class Peers(Object):
         - relation-changed
     """
 
+    _stored = StoredState()
+
     def __init__(self, charm: CharmBase):
         super().__init__(charm, PEER_RELATION_NAME)
 
         self.charm = charm
+        self._stored.set_default(config_inputs_hash="")
+        # Inputs hash computed by the peer change of this dispatch, acked once rendered
+        self._config_inputs_hash_cache: str | None = None
 
         self.framework.observe(charm.on[PEER_RELATION_NAME].relation_created, self._on_created)
         self.framework.observe(charm.on[PEER_RELATION_NAME].relation_joined, self._on_changed)
@@ -93,6 +120,164 @@ class Peers(Object):
             return None
         return self.relation.data[self.charm.unit]
 
+    @staticmethod
+    def _legacy_hash(value: str) -> str:
+        """Version of a blob of earlier revisions, as acked by the units running them."""
+        return shake_128(value.encode()).hexdigest(16)
+
+    @property
+    def config_version(self) -> str:
+        """Version of the relation databases config, acked by each unit in its pgb_dbs field."""
+        if self.relation_databases_versioned:
+            return self.app_databag[DATABASES_VERSION_KEY]
+        return self._legacy_hash(self.app_databag.get(LEGACY_DATABASES_KEY, "{}"))
+
+    @property
+    def relation_databases(self) -> dict[str, dict] | None:
+        """The stored entry of each relation database, by relation id, None if never stored.
+
+        The entries are ordered by relation id. Entries written by earlier revisions, as a single
+        blob, are returned as they were stored.
+        """
+        if self.relation_databases_versioned:
+            return self.versioned_relation_databases
+        if LEGACY_DATABASES_KEY in self.app_databag:
+            return json.loads(self.app_databag[LEGACY_DATABASES_KEY])
+        return None
+
+    @property
+    def versioned_relation_databases(self) -> dict[str, dict]:
+        """The entries stored by relation, ordered by relation id."""
+        entries = {
+            key.removeprefix(DATABASE_KEY_PREFIX): value
+            for key, value in self.app_databag.items()
+            if key.startswith(DATABASE_KEY_PREFIX)
+        }
+        return {
+            relation_id: json.loads(entries[relation_id])
+            for relation_id in sorted(entries, key=int)
+        }
+
+    def relation_database(self, relation_id: str) -> dict | None:
+        """The stored entry of the relation database of a relation, reading only its key."""
+        if not self.relation_databases_versioned:
+            return (self.relation_databases or {}).get(relation_id)
+        if value := self.app_databag.get(f"{DATABASE_KEY_PREFIX}{relation_id}"):
+            return json.loads(value)
+        return None
+
+    @property
+    def relation_databases_versioned(self) -> bool:
+        """Whether the relation databases are stored by relation.
+
+        A blob of earlier revisions that doesn't match the hash of its mirror was rewritten by a
+        leader running an earlier revision during an upgrade, so it takes precedence.
+        """
+        databag = self.app_databag
+        if DATABASES_VERSION_KEY not in databag:
+            return False
+        if LEGACY_DATABASES_KEY in databag:
+            return self._legacy_hash(databag[LEGACY_DATABASES_KEY]) == databag.get(
+                LEGACY_DATABASES_HASH_KEY
+            )
+        return True
+
+    @property
+    def stored_relation_ids(self) -> set[str]:
+        """Ids of the relations with a key of their own, including stale ones."""
+        return {
+            key.removeprefix(DATABASE_KEY_PREFIX)
+            for key in self.app_databag
+            if key.startswith(DATABASE_KEY_PREFIX)
+        }
+
+    def update_relation_databases(
+        self, changes: dict[str, dict | None], keep_legacy: bool = False
+    ) -> None:
+        """Write the given relation database entries, and bump the config version.
+
+        Only the keys of the entries that changed are written, so that an update costs the same
+        whatever the number of relations. Stored blobs of earlier revisions are dropped, unless
+        units of earlier revisions still read them.
+
+        Args:
+            changes: the new entry of each relation id, None to remove it.
+            keep_legacy: whether to keep the blob of earlier revisions, to be mirrored next.
+        """
+        databag = self.app_databag
+        updates = {}
+        for relation_id, entry in changes.items():
+            key = f"{DATABASE_KEY_PREFIX}{relation_id}"
+            value = "" if entry is None else json.dumps(entry, separators=(",", ":"))
+            if databag.get(key, "") != value:
+                updates[key] = value
+        if not keep_legacy:
+            for key in (LEGACY_DATABASES_KEY, LEGACY_DATABASES_HASH_KEY):
+                if key in databag:
+                    updates[key] = ""
+        if not updates and DATABASES_VERSION_KEY in databag:
+            return
+        updates[DATABASES_VERSION_KEY] = str(int(databag.get(DATABASES_VERSION_KEY, "0")) + 1)
+        databag.update(updates)
+
+    def mirror_legacy_databases(self, databases: dict[str, dict]) -> None:
+        """Write the relation databases in the blob read by the units of earlier revisions."""
+        value = json.dumps(databases)
+        if self.app_databag.get(LEGACY_DATABASES_KEY) != value:
+            self.app_databag.update({
+                LEGACY_DATABASES_KEY: value,
+                LEGACY_DATABASES_HASH_KEY: self._legacy_hash(value),
+            })
+
+    @property
+    def has_legacy_databases(self) -> bool:
+        """Whether the blob of earlier revisions is still stored."""
+        return bool(self.relation) and LEGACY_DATABASES_KEY in self.app_databag
+
+    def units_synced(self) -> bool:
+        """Whether every other unit has acked the current relation databases config.
+
+        Units of earlier revisions ack the hash of the blob they read, which is up to date when
+        it's mirrored during an upgrade.
+        """
+        if not self.relation:
+            return True
+        acks = {self.config_version}
+        if LEGACY_DATABASES_KEY in self.app_databag:
+            acks.add(self._legacy_hash(self.app_databag[LEGACY_DATABASES_KEY]))
+        for unit in self.relation.units:
+            if unit != self.charm.unit and self.relation.data[unit].get("pgb_dbs", "") not in acks:
+                return False
+        return True
+
+    @property
+    def pending_onboarding(self) -> list[tuple[str, int]]:
+        """Client relations waiting for every unit to ack the config before being onboarded."""
+        if not self.relation:
+            return []
+        return [
+            (relation_name, relation_id)
+            for relation_name, relation_id in json.loads(
+                self.app_databag.get(PENDING_ONBOARDING_KEY, "[]")
+            )
+        ]
+
+    def add_pending_onboarding(self, relation: Relation) -> None:
+        """Record a client relation to be onboarded once the units converge."""
+        pending = self.pending_onboarding
+        if (relation.name, relation.id) not in pending:
+            pending.append((relation.name, relation.id))
+            self.app_databag[PENDING_ONBOARDING_KEY] = json.dumps(pending)
+
+    def remove_pending_onboarding(self, done: list[tuple[str, int]]) -> None:
+        """Forget the given onboarding requests, keeping the others for a later retry."""
+        if not done:
+            return
+        if pending := [entry for entry in self.pending_onboarding if entry not in done]:
+            self.app_databag[PENDING_ONBOARDING_KEY] = json.dumps(pending)
+        else:
+            self.app_databag.pop(PENDING_ONBOARDING_KEY, None)
+
     def _get_unit_hostname(self, unit: Unit) -> str | None:
         """Get the hostname of a specific unit."""
         # Check if host is current host.
@@ -111,40 +296,77 @@ class Peers(Object):
         Defers:
             - If config is unavailable
         """
-        self.unit_databag[ADDRESS_KEY] = self.charm.unit_pod_hostname
+        self.update_unit_databag({ADDRESS_KEY: self.charm.unit_pod_hostname})
+
+    def update_unit_databag(self, data: dict[str, str]) -> None:
+        """Write the given fields to the unit databag, skipping those that didn't change.
+
+        Every write to the unit databag fires relation-changed on all the other units, so no-op
+        writes are avoided to keep peer events from cascading.
+        """
+        if changes := {
+            key: value for key, value in data.items() if self.unit_databag.get(key) != value
+        }:
+            self.unit_databag.update(changes)
+
+    def _config_inputs_hash(self) -> str:
+        """Hash of the peer shared state that the rendered config and monitoring layer depend on."""
+        inputs = {
+            "app_databag": dict(self.app_databag),
+            "auth_file": self.charm.get_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY),
+            "monitoring_password": self.charm.get_secret(APP_SCOPE, MONITORING_PASSWORD_KEY),
+            "backend": self.charm.backend.postgres_databag,
+            "tls": self.charm.get_tls_files(),
+        }
+        return shake_128(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest(16)
 
     def _on_changed(self, event: HookEvent):
         """If the current unit is a follower, write updated config and auth files to filesystem.
 
         Every time the pgbouncer config is changed, update_cfg is called. This updates the leader's
         config file in the peer databag, which propagates the config to the follower units. In this
-        function, we check for that updated config and render it to the container.
+        function, we check for that updated config and render it to the container. The config is
+        only re-rendered when the shared inputs it depends on have changed since the last render.
 
         Deferrals:
             - If pgbouncer config is unavailable
             - If pgbouncer container is unavailable.
         """
-        self.unit_databag.update({ADDRESS_KEY: self.charm.unit_pod_hostname})
+        self.update_unit_databag({ADDRESS_KEY: self.charm.unit_pod_hostname})
 
         if not self.charm.is_container_ready:
             logger.debug("_on_peer_changed defer: container unavailable")
-            event.defer()
+            self.charm.defer(event)
             return
 
-        pgb_dbs_hash = shake_128(self.app_databag.get("pgb_dbs_config", "{}").encode()).hexdigest(
-            16
-        )
-        self.charm.render_pgb_config()
-        self.charm.toggle_monitoring_layer(self.charm.backend.ready)
-        self.unit_databag["pgb_dbs"] = pgb_dbs_hash
+        self._config_inputs_hash_cache = self._config_inputs_hash()
+        if self._config_inputs_hash_cache != self._stored.config_inputs_hash:
+            # The config is acked by reconcile, once it has been rendered
+            self.charm.mark_dirty(DIRTY_CONFIG, DIRTY_MONITORING)
+        else:
+            logger.debug("_on_peer_changed: config inputs unchanged, skipping render")
 
         if self.charm.unit.is_leader() and self.charm.configuration_check():
-            self.charm.client_relation.update_endpoints()
+            # Followers acking the config is what unblocks the pending onboarding requests
+            self.charm.complete_pending_onboarding()
+            self.charm.mark_dirty(DIRTY_ENDPOINTS)
+
+    def ack_config_rendered(self) -> None:
+        """Record that the workload runs the config of the current shared inputs."""
+        if not self.relation:
+            return
+        # A stale hash at worst triggers a no-op render on the next peer change
+        self._stored.config_inputs_hash = (
+            self._config_inputs_hash_cache or self._config_inputs_hash()
+        )
+        self.update_unit_databag({"pgb_dbs": self.config_version})
+
+    def reset_config_inputs(self) -> None:
+        """Force the next peer change to re-render the config, e.g. after a container restart."""
+        self._stored.config_inputs_hash = ""
 
     def _on_departed(self, event):
-        self.charm.update_client_connection_info()
-        if self.charm.unit.is_leader():
-            self.charm.client_relation.update_endpoints()
+        self.charm.mark_dirty(DIRTY_ENDPOINTS)
 
     def _on_leader_elected(self, _):
-        self.charm.update_client_connection_info()
+        self.charm.mark_dirty(DIRTY_ENDPOINTS)
@@ -7,6 +7,14 @@ Importantly, this relation doesn't handle scaling the same way others do. All Pg
 read/writes, and they expose the read/write nodes of the backend database through the database name
 f"{dbname}_readonly".
 
+Client applications can request the pool-mode, pool-size and max-db-connections of the pools of
+their database in their application data. As in the [databases] section of pgbouncer.ini, they
+apply to each pgbouncer instance, and the sizes can't exceed the max_db_connections config option.
+The guaranteed-connections and burst-connections fields report the share of max_db_connections
+each relation user gets on a pgbouncer instance (see quotas.py).
+The recommended-pool-size field is the number of connections each client unit can pool without
+piling up waiting clients.
+
 ┏━━━━━━━━━━━━━━━━━━┳━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┳━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
 ┃ relation (id: 4) ┃ application                                                                                   ┃ pgbouncer-k8s                                                                                  ┃
 ┡━━━━━━━━━━━━━━━━━━╇━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━╇━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┩
@@ -31,7 +39,8 @@ f"{dbname}_readonly".
 """
 
 import logging
-from hashlib import shake_128
+import math
+from typing import get_args
 
 from charms.data_platform_libs.v0.data_interfaces import (
     DatabaseProvides,
@@ -42,9 +51,14 @@ from charms.postgresql_k8s.v0.postgresql import (
     PERMISSIONS_GROUP_ADMIN,
 )
 from charms.postgresql_k8s.v0.postgresql import PostgreSQL as PostgreSQLv0
-from ops.charm import CharmBase, RelationBrokenEvent, RelationDepartedEvent
+from ops.charm import (
+    CharmBase,
+    RelationBrokenEvent,
+    RelationChangedEvent,
+    RelationDepartedEvent,
+)
 from ops.framework import Object
-from ops.model import Application, BlockedStatus
+from ops.model import Application, BlockedStatus, Relation
 from single_kernel_postgresql.compat.postgresql import (
     ACCESS_GROUP_RELATION,
     PostgreSQLCreateDatabaseError,
@@ -54,16 +68,25 @@ from single_kernel_postgresql.compat.postgresql import (
     PostgreSQLGetPostgreSQLVersionError,
 )
 
-from constants import CLIENT_RELATION_NAME
+from config import PoolMode
+from constants import CLIENT_RELATION_NAME, DIRTY_CONFIG, DIRTY_READONLY_DBS
 
 logger = logging.getLogger(__name__)
 
+# Pool settings the client application can request for its database
+POOL_POLICY_FIELDS = ("pool-mode", "pool-size", "max-db-connections")
+# Client connections that can share a server connection without queueing much. In session mode,
+# each client holds a server connection; in the other modes, clients are mostly idle between
+# their transactions or statements.
+CLIENTS_PER_SERVER = {"session": 1, "transaction": 4, "statement": 8}
+
 
 class PgBouncerProvider(Object):
     """Defines functionality for the 'provides' side of the 'postgresql-client' relation.
 
     Hook events observed:
         - database-requested
+        - relation-changed
         - relation-broken
     """
 
@@ -83,6 +106,9 @@ class PgBouncerProvider(Object):
         self.framework.observe(
             self.database_provides.on.database_requested, self._on_database_requested
         )
+        self.framework.observe(
+            charm.on[self.relation_name].relation_changed, self._on_relation_changed
+        )
         self.framework.observe(
             charm.on[self.relation_name].relation_departed, self._on_relation_departed
         )
@@ -108,6 +134,8 @@ class PgBouncerProvider(Object):
         """Handle the client relation-requested event.
 
         Generate password and handle user and database creation for the related application.
+        When some units haven't yet rendered the config with the new database, the relation is
+        recorded as pending and the leader onboards it once every unit acked the config.
 
         Deferrals:
             - If backend relation is not fully initialised
@@ -116,20 +144,112 @@ class PgBouncerProvider(Object):
             return
 
         if not self.charm.backend.check_backend() or not self.charm.read_write_endpoints:
-            event.defer()
+            self.charm.defer(event)
             return
 
         # Retrieve the database name and extra user roles using the charm library.
         database = event.database
         rel_id = event.relation.id
+        if self.charm.backend_for(database) is None:
+            logger.debug(f"Deferring database requested: the shard of {database} isn't ready")
+            self.charm.defer(event)
+            return
 
         # Make sure that certain groups are not in the list
         extra_user_roles = self.sanitize_extra_roles(event.extra_user_roles)
-        extra_user_roles.append(ACCESS_GROUP_RELATION)
 
-        dbs = self.charm.generate_relation_databases()
-        dbs[str(rel_id)] = {"name": database, "legacy": False}
-        if (
+        entry = self.database_entry(database, self._requested_pool(rel_id))
+        if self.requires_wildcard(extra_user_roles):
+            entry["wildcard"] = True
+        self.charm.update_relation_databases({str(rel_id): entry})
+
+        if not self.charm.peers.units_synced():
+            logger.debug("Not all units have synced configuration, postponing onboarding")
+            self.charm.peers.add_pending_onboarding(event.relation)
+            return
+
+        if not self.onboard_relation(event.relation, database, event.extra_user_roles):
+            # Retried by the leader on the next peer change or update-status
+            self.charm.peers.add_pending_onboarding(event.relation)
+
+    @staticmethod
+    def database_entry(database: str, data: dict[str, str]) -> dict[str, str | bool | dict]:
+        """Relation databases entry of a client relation, with the pool settings it requested."""
+        entry = {"name": database, "legacy": False}
+        if pool := {field: data[field] for field in POOL_POLICY_FIELDS if field in data}:
+            entry["pool"] = pool
+        return entry
+
+    def _requested_pool(self, relation_id: int) -> dict[str, str]:
+        """Pool settings requested by the client application, as found in the relation data."""
+        data = self.database_provides.fetch_relation_data([relation_id], POOL_POLICY_FIELDS)
+        return data.get(relation_id, {})
+
+    def get_pool_policy(
+        self, relation_id: int | str, data: dict[str, str]
+    ) -> dict[str, str | int]:
+        """Validate the pool settings requested by the client application.
+
+        The requested settings override the global ones for the relation database, as long as
+        they fit in the global max_db_connections. Invalid requests are logged and ignored.
+
+        Args:
+            relation_id: the id of the relation.
+            data: the pool settings requested in the relation data.
+
+        Returns:
+            The pgbouncer database settings, keyed by their pgbouncer.ini name.
+        """
+        policy = {}
+        budget = self.charm.config.max_db_connections
+
+        if (pool_mode := data.get("pool-mode")) is not None:
+            if pool_mode in get_args(PoolMode):
+                policy["pool_mode"] = pool_mode
+            else:
+                logger.warning(f"Relation {relation_id} requested invalid pool-mode {pool_mode}")
+
+        for field, minimum in (("max-db-connections", 0), ("pool-size", 1)):
+            if (value := data.get(field)) is None:
+                continue
+            try:
+                value = int(value)
+            except ValueError:
+                value = None
+            limit = policy.get("max_db_connections", budget)
+            if value is None or value < minimum or (limit and not 0 < value <= limit):
+                logger.warning(
+                    f"Ignoring {field} {data[field]} requested by relation {relation_id}, it must "
+                    f"be at least {minimum}" + (f" and at most {limit}" if limit else "")
+                )
+                continue
+            policy[field.replace("-", "_")] = value
+        return policy
+
+    def _on_relation_changed(self, event: RelationChangedEvent) -> None:
+        """Share the pool settings requested by the client application, if they changed."""
+        if not self.charm.unit.is_leader():
+            return
+
+        if not (database := self.charm.peers.relation_database(str(event.relation.id))):
+            # Not onboarded yet, the settings are applied with the database request
+            return
+
+        if (pool := self._requested_pool(event.relation.id)) == database.get("pool", {}):
+            return
+
+        logger.info(f"Relation {event.relation.id} requested the pool settings {pool}")
+        if pool:
+            database["pool"] = pool
+        else:
+            database.pop("pool", None)
+        self.charm.update_relation_databases({str(event.relation.id): database})
+        self.charm.mark_dirty(DIRTY_CONFIG)
+
+    @staticmethod
+    def requires_wildcard(extra_user_roles: list[str]) -> bool:
+        """Whether the requested roles need access to every database through the wildcard."""
+        return (
             PERMISSIONS_GROUP_ADMIN in extra_user_roles
             or "superuser" in extra_user_roles
             or "createdb" in extra_user_roles
@@ -140,47 +260,59 @@ class PgBouncerProvider(Object):
             or "charmed_dml" in extra_user_roles
             or "charmed_read" in extra_user_roles
             or "charmed_stats" in extra_user_roles
-        ):
-            dbs["*"] = {"name": "*", "auth_dbname": database, "legacy": False}
+        )
 
-        self.charm.set_relation_databases(dbs)
+    def onboard_relation(
+        self, relation: Relation, database: str | None = None, extra_user_roles: str | None = None
+    ) -> bool:
+        """Create the user and database for the relation and share the credentials.
 
-        pgb_dbs_hash = shake_128(
-            self.charm.peers.app_databag["pgb_dbs_config"].encode()
-        ).hexdigest(16)
-        for key in self.charm.peers.relation.data:
-            # We skip the leader so we don't have to wait on the defer
-            if (
-                key != self.charm.app
-                and key != self.charm.unit
-                and self.charm.peers.relation.data[key].get("pgb_dbs", "") != pgb_dbs_hash
-            ):
-                logger.debug("Not all units have synced configuration")
-                event.defer()
-                return
+        Only called once every unit has rendered the config that includes the relation database.
+        When not given, the database and extra user roles are read from the relation data.
+
+        Returns:
+            Whether the relation was onboarded, False when it has to be retried later.
+        """
+        rel_id = relation.id
+        if database is None:
+            data = self.database_provides.fetch_relation_data(
+                [rel_id], ["database", "extra-user-roles"]
+            ).get(rel_id, {})
+            database = data.get("database")
+            extra_user_roles = data.get("extra-user-roles")
+        if not database:
+            logger.warning(f"{self.relation_name} relation {rel_id} has no database requested")
+            return False
+
+        extra_user_roles = self.sanitize_extra_roles(extra_user_roles)
+        extra_user_roles.append(ACCESS_GROUP_RELATION)
+
+        # The database may be routed to another cluster than backend-database
+        if not (backend := self.charm.backend_for(database)):
+            logger.warning(f"{self.relation_name} relation {rel_id}: {database} shard not ready")
+            return False
 
         # Creates the user and the database for this specific relation.
         user = f"relation_id_{rel_id}"
         logger.debug("generating relation user")
         password = pgb.generate_password()
         try:
-            if isinstance(self.charm.backend.postgres, PostgreSQLv0):
-                self.charm.backend.postgres.create_user(
-                    user, password, extra_user_roles=extra_user_roles
-                )
+            postgres = backend.postgres
+            if isinstance(postgres, PostgreSQLv0):
+                postgres.create_user(user, password, extra_user_roles=extra_user_roles)
                 logger.debug("creating database")
-                self.charm.backend.postgres.create_database(
+                postgres.create_database(
                     database, user, client_relations=self.charm.client_relations
                 )
             else:
                 logger.debug("creating database")
-                self.charm.backend.postgres.create_database(database)
-                self.charm.backend.postgres.create_user(
+                postgres.create_database(database)
+                postgres.create_user(
                     user, password, extra_user_roles=extra_user_roles, database=database
                 )
             # set up auth function
-            self.charm.backend.remove_auth_function(dbs=[database])
-            self.charm.backend.initialise_auth_function(dbs=[database])
+            backend.remove_auth_function(dbs=[database])
+            backend.initialise_auth_function(dbs=[database])
         except (
             PostgreSQLCreateDatabaseError,
             PostgreSQLCreateUserError,
@@ -193,17 +325,20 @@ class PgBouncerProvider(Object):
                 and e.message is not None
                 else f"Failed to initialize relation {self.relation_name}"
             )
-            return
+            return False
 
+        # The database gets a read-only alias along the wildcard once the relation is gone
+        self.charm.mark_dirty(DIRTY_READONLY_DBS)
         self.charm.render_pgb_config()
 
-        self.charm.backend.sync_hba(user)
+        backend.sync_hba(user)
 
         # Share the credentials and updated connection info with the client application.
         self.database_provides.set_credentials(rel_id, user, password)
         # Set the database name
         self.database_provides.set_database(rel_id, database)
-        self.update_connection_info(event.relation)
+        self.update_connection_info(relation)
+        return True
 
     def _on_relation_departed(self, event: RelationDepartedEvent) -> None:
         """Check if this relation is being removed, and update databags accordingly.
@@ -231,17 +366,21 @@ class PgBouncerProvider(Object):
             self.charm.peers.unit_databag.pop(self._depart_flag(event.relation), None)
             return
 
-        dbs = self.charm.get_relation_databases()
-        database = dbs.pop(str(event.relation.id), {}).get("name")
-        self.charm.set_relation_databases(dbs)
+        database = (self.charm.peers.relation_database(str(event.relation.id)) or {}).get("name")
+        self.charm.update_relation_databases({str(event.relation.id): None})
 
-        delete_db = database not in [db["name"] for db in dbs.values()]
+        if not (backend := self.charm.backend_for(database)):
+            logger.warning(f"Not deleting the user of relation {event.relation.id}: no shard")
+            return
+        delete_db = database not in [
+            db["name"] for db in self.charm.get_relation_databases().values()
+        ]
         if database and delete_db:
-            self.charm.backend.remove_auth_function(dbs=[database])
+            backend.remove_auth_function(dbs=[database])
         # Delete the user.
         try:
             user = f"relation_id_{event.relation.id}"
-            self.charm.backend.postgres.delete_user(user)
+            backend.postgres.delete_user(user)
         except PostgreSQLDeleteUserError as e:
             logger.exception(e)
             self.charm.unit.status = BlockedStatus(
@@ -249,33 +388,60 @@ class PgBouncerProvider(Object):
             )
             raise
 
-    def update_connection_info(self, relation):
-        """Updates client-facing relation information."""
+    def update_connection_info(self, relation: Relation | None = None) -> None:
+        """Updates client-facing relation information, of every client relation if not given.
+
+        The endpoints and the version of each backend cluster are read once for all relations.
+        """
         if not self.charm.unit.is_leader() or not self.charm.configuration_check():
             return
 
         self.update_endpoints(relation)
 
-        # Set the database version.
-        if (
-            self.database_provides.fetch_relation_field(relation.id, "database")
-            and self.charm.backend.check_backend()
-        ):
-            self.database_provides.set_version(
-                relation.id, self.charm.backend.postgres.get_postgresql_version(current_host=False)
-            )
+        if not self.charm.backend.check_backend():
+            return
+        # Set the database version, of the cluster the database is routed to.
+        versions = {}
+        for client in [relation] if relation else self.model.relations[self.relation_name]:
+            if not (
+                database := self.database_provides.fetch_relation_field(client.id, "database")
+            ) or not (backend := self.charm.backend_for(database)):
+                continue
+            if backend not in versions:
+                versions[backend] = backend.postgres.get_postgresql_version(current_host=False)
+            self._update_relation_data(client.id, {"version": versions[backend]})
+
+    def _update_relation_data(self, relation_id: int, data: dict[str, str]) -> None:
+        """Write only the fields that differ from the current relation data.
+
+        Secret backed fields get a new secret revision on every write, so no-op updates are
+        skipped and the remaining changes are sent in a single update.
+        """
+        current = self.database_provides.fetch_my_relation_data([relation_id], list(data)) or {}
+        current = current.get(relation_id, {})
+        # Juju drops empty values from the databag, so an unset field matches an empty one
+        changes = {key: value for key, value in data.items() if current.get(key, "") != value}
+        if not changes:
+            return
+
+        logger.debug(f"Updating fields {sorted(changes)} in relation {relation_id}")
+        self.database_provides.update_relation_data(relation_id, changes)
 
     def update_endpoints(self, relation=None) -> None:
         """Set the endpoints for the relation."""
         relations = [relation] if relation else self.model.relations[self.relation_name]
 
-        key, ca, cert = self.charm.tls.get_tls_files()
+        key, ca, cert = self.charm.get_tls_files()
         if all((key, ca, cert)):
             tls_flag = "True"
             tls_ca = ca
         else:
             tls_flag = "False"
             tls_ca = ""
+        read_write_endpoints = self.charm.read_write_endpoints
+        read_only_endpoints = self.charm.read_only_endpoints
+        quotas = self.charm.get_user_quotas()
+        databases = self.charm.get_relation_databases()
         # Set the endpoints for each relation.
         for relation in relations:
             if not relation or not relation.data or not relation.data.get(relation.app):
@@ -286,30 +452,94 @@ class PgBouncerProvider(Object):
             database = self.database_provides.fetch_relation_field(relation.id, "database")
             password = self.database_provides.fetch_my_relation_field(relation.id, "password")
             if not database or not password:
-                return
+                continue
 
-            self.database_provides.set_tls(relation.id, tls_flag)
-            self.database_provides.set_tls_ca(relation.id, tls_ca)
-            self.database_provides.set_endpoints(relation.id, self.charm.read_write_endpoints)
-            self.database_provides.set_read_only_endpoints(
-                relation.id, self.charm.read_only_endpoints
-            )
-            self.database_provides.set_uris(
-                relation.id,
-                f"postgresql://{user}:{password}@{self.charm.read_write_endpoints}/{database}",
-            )
+            quota = quotas.get(user, {})
+            rw_endpoints, ro_endpoints = read_write_endpoints, read_only_endpoints
+            group_port = None
+            if group := self.charm.isolated_group(relation.app.name):
+                group_port = group["port"]
+                rw_endpoints = self.charm.get_hosts_ports("rw", group_port)
+                ro_endpoints = self.charm.get_hosts_ports("ro", group_port)
+            data = {
+                "tls": tls_flag,
+                "tls-ca": tls_ca,
+                "endpoints": rw_endpoints,
+                "read-only-endpoints": ro_endpoints,
+                "uris": self._uri(user, password, database, rw_endpoints, "rw", group_port),
+                # Server connections of the user on each pgbouncer instance
+                "guaranteed-connections": str(quota.get("guaranteed", "")),
+                "burst-connections": str(quota.get("burst", "")),
+                "recommended-pool-size": str(
+                    self.recommended_pool_size(
+                        relation, databases.get(str(relation.id), {}), quota
+                    )
+                ),
+            }
             # Make sure that the URI will be a secret
             if (
                 secret_fields := self.database_provides.fetch_relation_field(
                     relation.id, "requested-secrets"
                 )
             ) and "read-only-uris" in secret_fields:
-                self.database_provides.set_read_only_uris(
-                    relation.id,
-                    f"postgresql://{user}:{password}@{self.charm.read_write_endpoints}/{database}_readonly"
+                data["read-only-uris"] = (
+                    self._uri(
+                        user, password, f"{database}_readonly", ro_endpoints, "ro", group_port
+                    )
                     if len(f"{database}_readonly") < 64
-                    else f"postgresql://{user}:{password}@{self.charm.read_write_endpoints}/{database}",
+                    else self._uri(user, password, database, rw_endpoints, "rw", group_port)
                 )
+            self._update_relation_data(relation.id, data)
+
+    def _uri(
+        self,
+        user: str,
+        password: str,
+        database: str,
+        endpoints: str,
+        port_type: str,
+        port: int | None,
+    ) -> str:
+        """Connection URI of the database on a listener.
+
+        When the pod endpoints are published, the URI lists the pod of every unit for the
+        client to balance its connections between, instead of the K8s service.
+        """
+        if pod_endpoints := self.charm.get_pod_endpoints(port_type, port):
+            return (
+                f"postgresql://{user}:{password}@{pod_endpoints}/{database}"
+                "?load_balance_hosts=random"
+            )
+        return f"postgresql://{user}:{password}@{endpoints}/{database}"
+
+    def recommended_pool_size(
+        self, relation: Relation, database: dict, quota: dict[str, int]
+    ) -> int:
+        """Size of the connection pool each unit of the client application should keep.
+
+        Every pgbouncer instance opens up to the pool size of the relation database for the
+        relation user, within its burst quota, and each unit runs the same instances. The client
+        connections these server connections can serve depend on the pool mode.
+
+        Args:
+            relation: the client relation.
+            database: the relation databases entry of the relation.
+            quota: the connection quota of the relation user, if any.
+        """
+        policy = self.get_pool_policy(relation.id, database.get("pool", {}))
+        if group := self.charm.isolated_group(relation.app.name):
+            # Served by a single dedicated instance
+            default_pool_size, instances = group["pool_sizes"][0], 1
+        else:
+            default_pool_size, instances = self.charm.pool_sizes[0], len(self.charm._services)
+        servers = policy.get("pool_size", default_pool_size)
+        if quota:
+            servers = min(servers, quota["burst"])
+        servers *= instances * max(self.charm.app.planned_units(), 1)
+        clients = (
+            servers * CLIENTS_PER_SERVER[policy.get("pool_mode", self.charm.config.pool_mode)]
+        )
+        return max(math.ceil(clients / max(len(relation.units), 1)), 1)
 
     def get_database(self, relation):
         """Gets database name from relation."""
@@ -37,13 +37,13 @@ REVOKE ALL PRIVILEGES ON SCHEMA public FROM auth_user;
  * All of the administrative functions for pgbouncer will live in its own
  * schema, conveniently titled "pgbouncer"
  */
-CREATE SCHEMA IF NOT EXISTS auth_user;
+CREATE SCHEMA IF NOT EXISTS auth_schema;
 /**
  * ...but even though pgbouncer gets its own schema, lock down what it can do
  * on it
  */
-REVOKE ALL PRIVILEGES ON SCHEMA auth_user FROM auth_user;
-GRANT USAGE ON SCHEMA auth_user TO auth_user;
+REVOKE ALL PRIVILEGES ON SCHEMA auth_schema FROM auth_user;
+GRANT USAGE ON SCHEMA auth_schema TO auth_user;
 
 /**
  * The "get_auth" function allows us to return the appropriate login credentials
@@ -52,7 +52,7 @@ GRANT USAGE ON SCHEMA auth_user TO auth_user;
  *
  * See: http://www.pgbouncer.org/config.html#auth_query
  */
-CREATE OR REPLACE FUNCTION auth_user.get_auth(username TEXT)
+CREATE OR REPLACE FUNCTION auth_schema.get_auth(username TEXT)
 RETURNS TABLE(username TEXT, password TEXT) AS
 $$
   SELECT rolname::TEXT, rolpassword::TEXT
@@ -73,5 +73,5 @@ LANGUAGE SQL STABLE SECURITY DEFINER;
  * As mentioned, the pgbouncer user will only be able to access its one function
  * and all it can do is execute. Here is where it does exactly that
  */
-REVOKE ALL ON FUNCTION auth_user.get_auth(username TEXT) FROM PUBLIC, auth_user;
-GRANT EXECUTE ON FUNCTION auth_user.get_auth(username TEXT) TO auth_user;
+REVOKE ALL ON FUNCTION auth_schema.get_auth(username TEXT) FROM PUBLIC, auth_user;
+GRANT EXECUTE ON FUNCTION auth_schema.get_auth(username TEXT) TO auth_user;
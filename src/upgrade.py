@@ -25,10 +25,10 @@ from constants import (
     ADMIN_PASSWORD_KEY,
     APP_SCOPE,
     AUTH_FILE_DATABAG_KEY,
-    CLIENT_RELATION_NAME,
     MONITORING_PASSWORD_KEY,
     PGB,
 )
+from instrumentation import K8S, trace_io
 
 DEFAULT_MESSAGE = "Pre-upgrade check failed and cannot safely upgrade"
 
@@ -148,7 +148,7 @@ class PgbouncerUpgrade(DataUpgrade):
             or not pgb_container.get_services()
         ):
             logger.debug("Deferring upgrade on_pebble_ready: no unit not yet")
-            event.defer()
+            self.charm.defer(event)
             return
 
         if self.state not in ["upgrading", "recovery"]:
@@ -156,8 +156,7 @@ class PgbouncerUpgrade(DataUpgrade):
 
         if self.charm.unit.is_leader():
             self.charm.reconcile_k8s_service()
-            for relation in self.model.relations.get(CLIENT_RELATION_NAME, []):
-                self.charm.client_relation.update_connection_info(relation)
+            self.charm.client_relation.update_connection_info()
             self._generate_admin_console_user()
         self._handle_md5_monitoring_auth()
 
@@ -165,7 +164,7 @@ class PgbouncerUpgrade(DataUpgrade):
             self._cluster_checks()
         except ClusterNotReadyError:
             logger.exception("Deferring on_pebble_ready: checks did not pass")
-            event.defer()
+            self.charm.defer(event)
             return
 
         self.set_unit_completed()
@@ -180,6 +179,9 @@ class PgbouncerUpgrade(DataUpgrade):
             logger.debug("on_upgrade_changed early exit: Cannot get pebble services")
             return
 
+        if self.idle:
+            # No unit of an earlier revision reads the legacy relation databases anymore
+            self.charm.drop_legacy_relation_databases()
         self.charm.update_config()
 
     @override
@@ -196,12 +198,17 @@ class PgbouncerUpgrade(DataUpgrade):
         """Set the rolling update partition to a specific value."""
         try:
             patch = {"spec": {"updateStrategy": {"rollingUpdate": {"partition": partition}}}}
-            Client().patch(
-                StatefulSet,
-                name=self.charm.model.app.name,
-                namespace=self.charm.model.name,
-                obj=patch,
-            )
+            with trace_io(
+                K8S,
+                "patch",
+                **{"k8s.resource": "StatefulSet", "k8s.name": self.charm.model.app.name},
+            ):
+                Client().patch(
+                    StatefulSet,
+                    name=self.charm.model.app.name,
+                    namespace=self.charm.model.name,
+                    obj=patch,
+                )
             logger.debug(f"Kubernetes StatefulSet partition set to {partition}")
         except ApiError as e:
             cause = "`juju trust` needed" if e.status.code == 403 else str(e)
@@ -0,0 +1,321 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Hook latency and side effects as the number of client relations grows.
+
+Every hook runs against a settled deployment with 1 to 1000 client relations, split between the
+`database` and legacy `db` interfaces. The workload, K8s API and backend database calls, as well
+as the relation and secret hook tool calls, are counted and compared against hook_counts.json,
+so that a change doing more work per hook fails the suite. Independently of the baseline, only
+the hook tool calls listed in PER_RELATION_BUDGET may grow with the number of client relations.
+
+Set HOOK_BENCHMARK_UPDATE=1 to rewrite hook_counts.json after an intended change, and
+HOOK_BENCHMARK_OUTPUT to a file path to keep the measured latencies.
+"""
+
+import functools
+import json
+import os
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+from ops import pebble, testing
+from scenario.mocking import _MockModelBackend
+
+import charm
+from charm import LAZY_LIBRARY_HOOKS, PgBouncerK8sCharm
+from constants import BACKEND_RELATION_NAME, CLIENT_RELATION_NAME, PEER_RELATION_NAME, PGB
+
+BASELINE_PATH = Path(__file__).parent / "hook_counts.json"
+RELATION_COUNTS = (1, 10, 100, 1000)
+HOOKS = ("update-status", "config-changed", "database-requested", "peers-changed")
+
+APP_NAME = "pgbouncer-k8s"
+CORES = max(min(os.cpu_count(), 4), 2)
+
+# Model backend methods, by the kind of hook tool call they make
+HOOK_TOOLS = {
+    "relation_reads": ("relation_get", "relation_list"),
+    "relation_writes": ("relation_set",),
+    "secret_reads": ("secret_get", "secret_info_get"),
+    "secret_writes": ("secret_add", "secret_set", "secret_remove", "secret_grant"),
+}
+WORKLOAD_CALLS = {
+    "pebble_pushes": "push",
+    "pebble_signals": "send_signal",
+    "pebble_restarts": "restart",
+    "pebble_replans": "replan",
+}
+
+# Side effects allowed per additional client relation; all the others must not grow with the
+# number of client relations
+PER_RELATION_BUDGET = {"relation_reads": 3}
+
+_latencies = {}
+
+
+def pebble_layer() -> pebble.Layer:
+    """The layer of a running unit."""
+    services = {
+        f"{PGB}_{service_id}": {
+            "override": "replace",
+            "command": "pgbouncer",
+            "startup": "enabled",
+        }
+        for service_id in range(CORES)
+    }
+    services["metrics_server"] = {
+        "override": "replace",
+        "command": "pgbouncer_exporter",
+        "startup": "enabled",
+    }
+    return pebble.Layer({"services": services})
+
+
+def settled_state(relations: int, requested: bool = False) -> testing.State:
+    """State of a leader unit serving the given number of onboarded client relations.
+
+    Args:
+        relations: number of client relations.
+        requested: whether to add a `database` relation that has requested a database, but was
+            not onboarded yet.
+    """
+    internal_secret = testing.Secret(
+        {
+            "auth-file": '"pgbouncer_auth_relation_id_1" "SCRAM-SHA-256$4096:salt$key:key"',
+            "monitoring-password": "monitoring",
+        },
+        label=f"{PEER_RELATION_NAME}.{APP_NAME}.app",
+        owner="app",
+    )
+    backend_secret = testing.Secret({"username": "relation_id_1", "password": "password"})
+    backend = testing.Relation(
+        BACKEND_RELATION_NAME,
+        remote_app_name="postgresql-k8s",
+        local_app_data={"database": PGB, "extra-user-roles": "SUPERUSER"},
+        remote_app_data={
+            "endpoints": "postgresql-k8s-primary:5432",
+            "read-only-endpoints": "postgresql-k8s-replicas:5432",
+            "secret-user": backend_secret.id,
+            "version": "16.4",
+            "database": PGB,
+        },
+    )
+
+    clients = []
+    for index in range(relations):
+        database = f"db_{index}"
+        if index % 2:
+            clients.append(
+                testing.Relation(
+                    "db",
+                    remote_app_name=f"legacy-client-{index}",
+                    local_app_data={
+                        "database": database,
+                        "user": f"relation_id_{index}",
+                        "password": "password",
+                    },
+                    local_unit_data={"database": database},
+                    remote_units_data={0: {"database": database}},
+                )
+            )
+        else:
+            clients.append(
+                testing.Relation(
+                    CLIENT_RELATION_NAME,
+                    remote_app_name=f"client-{index}",
+                    remote_app_data={"database": database},
+                    local_app_data={
+                        "data": json.dumps({"database": database}),
+                        "endpoints": f"{APP_NAME}-service.default.svc.cluster.local:6432",
+                        "version": "16.4",
+                        "database": database,
+                    },
+                )
+            )
+    if requested:
+        clients.append(
+            testing.Relation(
+                CLIENT_RELATION_NAME,
+                remote_app_name="requesting-client",
+                remote_app_data={"database": "requested_db"},
+            )
+        )
+
+    databases = {
+        str(relation.id): {"name": relation.local_app_data["database"], "legacy": True}
+        if relation.endpoint == "db"
+        else {"name": relation.remote_app_data["database"], "legacy": False}
+        for relation in clients
+        if relation.local_app_data
+    }
+    # Every unit acked the current relation databases config
+    config_version = "1"
+    peers = testing.PeerRelation(
+        PEER_RELATION_NAME,
+        local_app_data={
+            "internal-secret": internal_secret.id,
+            **{
+                f"pgb_db_{relation_id}": json.dumps(database, separators=(",", ":"))
+                for relation_id, database in databases.items()
+            },
+            "pgb_dbs_version": config_version,
+            "current_port": "6432",
+        },
+        local_unit_data={
+            "container_initialised": "True",
+            "userlist_nonce": "nonce",
+            "pgb_dbs": config_version,
+            "tls_enabled": "False",
+        },
+        peers_data={1: {"container_initialised": "True", "pgb_dbs": config_version}},
+    )
+
+    container = testing.Container(
+        PGB,
+        can_connect=True,
+        layers={PGB: pebble_layer()},
+        service_statuses=dict.fromkeys(pebble_layer().services, pebble.ServiceStatus.ACTIVE),
+        execs={testing.Exec(["pgbouncer", "--version"], stdout="PgBouncer 1.21.0\n")},
+    )
+    # The workload image serves the charm metrics
+    charm_metrics = testing.StoredState(
+        owner_path="PgBouncerK8sCharm/CharmMetrics[charm-metrics]",
+        content={"server_available": True},
+    )
+    return testing.State(
+        leader=True,
+        relations=[peers, backend, *clients],
+        secrets=[internal_secret, backend_secret],
+        containers=[container],
+        stored_states=[charm_metrics],
+    )
+
+
+def fake_connect() -> MagicMock:
+    """Stub of psycopg2.connect, for a backend database that accepts every query."""
+    connect = MagicMock()
+    connection = connect.return_value
+    for cursor in (
+        connection.cursor.return_value,
+        connection.cursor.return_value.__enter__.return_value,
+        connection.__enter__.return_value.cursor.return_value.__enter__.return_value,
+    ):
+        cursor.fetchone.return_value = ("PostgreSQL 16.4 on x86_64-pc-linux-gnu",)
+        cursor.fetchall.return_value = []
+    return connect
+
+
+def hook_event(ctx: testing.Context, hook: str, state: testing.State):
+    """The event to run for the given hook."""
+    if hook == "update-status":
+        return ctx.on.update_status()
+    if hook == "config-changed":
+        return ctx.on.config_changed()
+    if hook == "database-requested":
+        requesting = state.get_relations(CLIENT_RELATION_NAME)[-1]
+        return ctx.on.relation_changed(requesting)
+    peers = state.get_relations(PEER_RELATION_NAME)[0]
+    return ctx.on.relation_changed(peers, remote_unit=1)
+
+
+@functools.cache
+def run_hook(hook: str, relations: int) -> tuple[float, dict[str, int]]:
+    """Run the hook and return its latency and the count of its side effects."""
+    ctx = testing.Context(PgBouncerK8sCharm, app_name=APP_NAME, app_trusted=True)
+    state = settled_state(relations, requested=hook == "database-requested")
+
+    # Both the pod and the service are read through Client.get
+    lightkube_client = MagicMock()
+    lightkube_client.get.return_value.spec.type = "ClusterIP"
+    connect = fake_connect()
+    mocks = {}
+    with ExitStack() as stack:
+        stack.enter_context(patch("lightkube.Client", return_value=lightkube_client))
+        stack.enter_context(patch("psycopg2.connect", connect))
+        # The K8s service is connectable, so that the hooks update every client relation
+        probe = stack.enter_context(patch.object(charm.socket, "socket"))
+        probe.return_value.__enter__.return_value.connect_ex.return_value = 0
+        for method in {method for methods in HOOK_TOOLS.values() for method in methods}:
+            original = getattr(_MockModelBackend, method)
+            mocks[method] = stack.enter_context(
+                patch.object(_MockModelBackend, method, autospec=True, side_effect=original)
+            )
+        for method in WORKLOAD_CALLS.values():
+            original = getattr(testing.model.Container, method)
+            mocks[method] = stack.enter_context(
+                patch.object(testing.model.Container, method, autospec=True, side_effect=original)
+            )
+        for library in LAZY_LIBRARY_HOOKS:
+            prop = vars(PgBouncerK8sCharm)[library]
+            mocks[library] = stack.enter_context(patch.object(prop, "func", side_effect=prop.func))
+        # Render the workload files once, as a running unit would have
+        state = ctx.run(ctx.on.config_changed(), state)
+        for mock in (lightkube_client, connect, *mocks.values()):
+            mock.reset_mock()
+        charm.get_pod.cache_clear()
+        charm.get_node.cache_clear()
+
+        event = hook_event(ctx, hook, state)
+        start = time.perf_counter()
+        ctx.run(event, state)
+        latency = time.perf_counter() - start
+
+    counts = {
+        kind: sum(mocks[method].call_count for method in methods)
+        for kind, methods in HOOK_TOOLS.items()
+    }
+    counts.update({kind: mocks[method].call_count for kind, method in WORKLOAD_CALLS.items()})
+    counts["libraries_constructed"] = sum(
+        mocks[library].call_count for library in LAZY_LIBRARY_HOOKS
+    )
+    counts["k8s_api_calls"] = len(lightkube_client.method_calls)
+    counts["postgresql_connections"] = connect.call_count
+    return latency, counts
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    yield baseline
+    if os.environ.get("HOOK_BENCHMARK_UPDATE"):
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+    if output := os.environ.get("HOOK_BENCHMARK_OUTPUT"):
+        Path(output).write_text(json.dumps(_latencies, indent=2, sort_keys=True))
+
+
+@pytest.mark.parametrize("relations", RELATION_COUNTS)
+@pytest.mark.parametrize("hook", HOOKS)
+def test_hook(hook, relations, baseline):
+    latency, counts = run_hook(hook, relations)
+    _latencies.setdefault(hook, {})[str(relations)] = latency
+    print(f"{hook} with {relations} relations: {latency * 1000:.1f}ms, {counts}")
+
+    if os.environ.get("HOOK_BENCHMARK_UPDATE"):
+        baseline.setdefault(hook, {})[str(relations)] = counts
+        return
+
+    expected = baseline[hook][str(relations)]
+    regressions = {
+        kind: f"{expected.get(kind, 0)} -> {count}"
+        for kind, count in counts.items()
+        if count > expected.get(kind, 0)
+    }
+    assert not regressions, f"{hook} with {relations} relations does more work: {regressions}"
+
+
+@pytest.mark.parametrize("hook", HOOKS)
+def test_hook_scaling(hook):
+    # Both the `database` and legacy `db` interfaces are related from 10 relations on
+    fewest, most = RELATION_COUNTS[1], RELATION_COUNTS[-1]
+    _, base = run_hook(hook, fewest)
+    _, counts = run_hook(hook, most)
+
+    over_budget = {
+        kind: f"{base.get(kind, 0)} -> {count}"
+        for kind, count in counts.items()
+        if count - base.get(kind, 0) > PER_RELATION_BUDGET.get(kind, 0) * (most - fewest)
+    }
+    assert not over_budget, f"{hook} grows with the number of client relations: {over_budget}"
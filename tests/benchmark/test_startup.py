@@ -0,0 +1,96 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Charm startup time and memory, measured per dispatched hook in a fresh interpreter.
+
+Set STARTUP_BENCHMARK_OUTPUT to a file path to keep the measurements, e.g. to compare releases.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+CHARM_ROOT = Path(__file__).parents[2]
+
+# Charm libraries that hooks not observed by them should not import.
+LAZY_MODULES = (
+    "charms.grafana_k8s.v0.grafana_dashboard",
+    "charms.loki_k8s.v0.loki_push_api",
+    "charms.postgresql_k8s.v0.postgresql_tls",
+    "charms.prometheus_k8s.v0.prometheus_scrape",
+    "upgrade",
+)
+
+STARTUP_SCRIPT = """
+import json
+import sys
+import time
+import tracemalloc
+
+from ops.testing import Harness
+
+tracemalloc.start()
+start = time.perf_counter()
+from charm import PgBouncerK8sCharm
+
+imported = time.perf_counter()
+harness = Harness(PgBouncerK8sCharm)
+harness.begin()
+constructed = time.perf_counter()
+_, peak = tracemalloc.get_traced_memory()
+
+print(json.dumps({
+    "import_seconds": imported - start,
+    "construct_seconds": constructed - imported,
+    "peak_memory_bytes": peak,
+    "modules": sorted(sys.modules),
+}))
+"""
+
+_results = {}
+
+
+def measure_startup(hook: str) -> dict:
+    """Import and construct the charm for the given hook in a new interpreter."""
+    env = {
+        **os.environ,
+        "JUJU_DISPATCH_PATH": f"hooks/{hook}",
+        "PYTHONPATH": os.pathsep.join([str(CHARM_ROOT / "src"), str(CHARM_ROOT / "lib")]),
+    }
+    process = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        cwd=CHARM_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+@pytest.fixture(scope="module", autouse=True)
+def save_results():
+    yield
+    if output := os.environ.get("STARTUP_BENCHMARK_OUTPUT"):
+        Path(output).write_text(json.dumps(_results, indent=2, sort_keys=True))
+
+
+@pytest.mark.parametrize(
+    "hook",
+    ["update-status", "pgb-peers-relation-changed", "config-changed", "pgbouncer-pebble-ready"],
+)
+def test_startup(hook):
+    result = measure_startup(hook)
+    modules = set(result.pop("modules"))
+    _results[hook] = result
+    print(
+        f"{hook}: import {result['import_seconds'] * 1000:.1f}ms, "
+        f"construct {result['construct_seconds'] * 1000:.1f}ms, "
+        f"peak {result['peak_memory_bytes'] / 2**20:.1f}MiB"
+    )
+
+    if hook in ("update-status", "pgb-peers-relation-changed"):
+        assert not modules.intersection(LAZY_MODULES)
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+r"""Throughput of local pgbouncer instances configured the way the charm configures them.
+
+For every combination of instance count and `max_db_connections`, the instances are started
+with the pgbouncer.ini the charm renders (sharing the listen port through so_reuseport), and
+pgbench drives them in each pool mode. TPS, latency percentiles and the skew of transactions
+between the instances are written to a JSON report.
+
+Requires the pgbouncer and pgbench binaries, and a PostgreSQL server the given user can create
+the pgbench tables in. The charm config resets server connections with `LOAD 'login_hook'`, as
+the PostgreSQL charms ship that library; pass --no-login-hook for servers without it.
+
+Example:
+    tox -e throughput -- --pg-host 127.0.0.1 --pg-user postgres --pg-password secret \
+        --instances 1,2,4 --max-db-connections 0,40,100 --output report.json
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import psycopg2
+from jinja2 import Template
+
+CHARM_ROOT = Path(__file__).parents[2]
+sys.path[:0] = [str(CHARM_ROOT / "src"), str(CHARM_ROOT / "lib")]
+
+from charm import get_pool_sizes, render_pgb_ini  # noqa: E402
+
+POOL_MODES = ("session", "transaction", "statement")
+# Statement pooling does not allow multi-statement transactions
+POOL_MODE_SCRIPTS = {
+    "session": "tpcb-like",
+    "transaction": "tpcb-like",
+    "statement": "select-only",
+}
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pg-host", default="127.0.0.1")
+    parser.add_argument("--pg-port", type=int, default=5432)
+    parser.add_argument("--pg-user", default="postgres")
+    parser.add_argument("--pg-password", required=True)
+    parser.add_argument("--database", default="pgbench")
+    parser.add_argument("--listen-port", type=int, default=6432)
+    parser.add_argument("--instances", default="1,2,4", help="comma-separated instance counts")
+    parser.add_argument(
+        "--max-db-connections", default="0,100", help="comma-separated max_db_connections"
+    )
+    parser.add_argument("--pool-modes", default=",".join(POOL_MODES))
+    parser.add_argument("--max-prepared-statements", type=int, default=100)
+    parser.add_argument("--clients", type=int, default=64, help="pgbench clients")
+    parser.add_argument("--jobs", type=int, default=4, help="pgbench threads")
+    parser.add_argument("--duration", type=int, default=30, help="seconds per pgbench run")
+    parser.add_argument("--scale", type=int, default=10, help="pgbench scale factor")
+    parser.add_argument("--no-login-hook", action="store_true")
+    parser.add_argument("--pgbouncer", default="pgbouncer")
+    parser.add_argument("--pgbench", default="pgbench")
+    parser.add_argument("--output", default="throughput.json")
+    return parser.parse_args()
+
+
+def render_configs(
+    args: argparse.Namespace,
+    workdir: Path,
+    instances: int,
+    max_db_connections: int,
+    pool_mode: str,
+) -> list[dict]:
+    """Render the pgbouncer.ini of each instance as the charm does, for a local backend."""
+    services = [
+        {
+            "id": service_id,
+            "dir": f"{workdir}/instance_{service_id}",
+            "ini_path": f"{workdir}/instance_{service_id}/pgbouncer.ini",
+            "log_dir": f"{workdir}/instance_{service_id}",
+        }
+        for service_id in range(instances)
+    ]
+    auth_file = workdir / "userlist.txt"
+    auth_file.write_text(f'"{args.pg_user}" "{args.pg_password}"\n')
+
+    default_pool_size, min_pool_size, reserve_pool_size = get_pool_sizes(
+        max_db_connections, instances
+    )
+    template = Template((CHARM_ROOT / "templates" / "pgb_config.j2").read_text())
+    for service in services:
+        Path(service["dir"]).mkdir(parents=True, exist_ok=True)
+        if os.geteuid() == 0:
+            # pgbouncer drops privileges to the postgres user set in the config
+            shutil.chown(workdir, "postgres")
+            shutil.chown(service["dir"], "postgres")
+        content = render_pgb_ini(
+            template,
+            service,
+            services,
+            base_socket_dir=f"{workdir}/instance_",
+            databases={
+                args.database: {
+                    "host": args.pg_host,
+                    "dbname": args.database,
+                    "port": args.pg_port,
+                    "auth_user": args.pg_user,
+                }
+            },
+            readonly_databases={},
+            listen_port=args.listen_port,
+            pool_mode=pool_mode,
+            max_db_connections=max_db_connections,
+            max_prepared_statements=args.max_prepared_statements,
+            default_pool_size=default_pool_size,
+            min_pool_size=min_pool_size,
+            reserve_pool_size=reserve_pool_size,
+            admin_user=args.pg_user,
+            stats_user=args.pg_user,
+            auth_type="scram-sha-256",
+            auth_query="SELECT usename, passwd FROM pg_shadow WHERE usename=$1",
+            auth_file=auth_file,
+            enable_tls=False,
+        )
+        if args.no_login_hook:
+            content = content.replace("DISCARD ALL; LOAD 'login_hook';", "DISCARD ALL;")
+        Path(service["ini_path"]).write_text(content)
+    return services
+
+
+def start_instances(args: argparse.Namespace, services: list[dict]) -> list[subprocess.Popen]:
+    """Start a pgbouncer process per instance and wait for all of them to accept connections."""
+    processes = [
+        subprocess.Popen([args.pgbouncer, service["ini_path"]], stderr=subprocess.DEVNULL)
+        for service in services
+    ]
+    deadline = time.monotonic() + 10
+    for service in services:
+        socket_path = f"{service['dir']}/.s.PGSQL.{args.listen_port}"
+        while not Path(socket_path).exists():
+            if time.monotonic() > deadline:
+                stop_instances(processes)
+                raise RuntimeError(f"pgbouncer instance {service['id']} did not start")
+            time.sleep(0.1)
+    with socket.create_connection(("127.0.0.1", args.listen_port), timeout=10):
+        pass
+    return processes
+
+
+def stop_instances(processes: list[subprocess.Popen]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait(timeout=10)
+
+
+def instance_transactions(args: argparse.Namespace, services: list[dict]) -> list[int]:
+    """Transactions each instance served for the benchmark database, from its admin console."""
+    transactions = []
+    for service in services:
+        connection = psycopg2.connect(
+            host=service["dir"],
+            port=args.listen_port,
+            dbname="pgbouncer",
+            user=args.pg_user,
+            password=args.pg_password,
+        )
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW STATS;")
+            columns = [column.name for column in cursor.description]
+            rows = [dict(zip(columns, row, strict=True)) for row in cursor.fetchall()]
+        connection.close()
+        transactions.append(
+            sum(int(row["total_xact_count"]) for row in rows if row["database"] == args.database)
+        )
+    return transactions
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def run_pgbench(args: argparse.Namespace, pool_mode: str, logdir: Path) -> dict:
+    """Drive the instances through the shared listen port and return TPS and latencies."""
+    command = [
+        args.pgbench,
+        "--host=127.0.0.1",
+        f"--port={args.listen_port}",
+        f"--username={args.pg_user}",
+        f"--client={args.clients}",
+        f"--jobs={args.jobs}",
+        f"--time={args.duration}",
+        f"--builtin={POOL_MODE_SCRIPTS[pool_mode]}",
+        "--log",
+        f"--log-prefix={logdir}/pgbench_log",
+        "--no-vacuum",
+        args.database,
+    ]
+    output = subprocess.run(
+        command,
+        env={**os.environ, "PGPASSWORD": args.pg_password},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    tps = float(re.search(r"tps = ([\d.]+) \(without initial connection time\)", output)[1])
+
+    # Each transaction log line is: client_id transaction_no time script_no time_epoch time_us
+    latencies = sorted(
+        int(line.split()[2]) / 1000
+        for log_file in logdir.glob("pgbench_log*")
+        for line in log_file.read_text().splitlines()
+        if line
+    )
+    return {
+        "tps": tps,
+        "transactions": len(latencies),
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0,
+        },
+    }
+
+
+def skew(transactions: list[int]) -> dict:
+    """How unevenly so_reuseport spread the work between the instances."""
+    mean = statistics.mean(transactions)
+    return {
+        "per_instance_transactions": transactions,
+        "max_over_mean": max(transactions) / mean if mean else 0.0,
+        "coefficient_of_variation": statistics.pstdev(transactions) / mean if mean else 0.0,
+    }
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = parse_args()
+    for binary in (args.pgbouncer, args.pgbench):
+        if not shutil.which(binary):
+            sys.exit(f"{binary} not found")
+
+    logger.info("Initialising pgbench tables")
+    subprocess.run(
+        [
+            args.pgbench,
+            f"--host={args.pg_host}",
+            f"--port={args.pg_port}",
+            f"--username={args.pg_user}",
+            f"--scale={args.scale}",
+            "--initialize",
+            "--quiet",
+            args.database,
+        ],
+        env={**os.environ, "PGPASSWORD": args.pg_password},
+        check=True,
+        capture_output=True,
+    )
+
+    results = []
+    for instances in (int(value) for value in args.instances.split(",")):
+        for max_db_connections in (int(value) for value in args.max_db_connections.split(",")):
+            default_pool_size, min_pool_size, reserve_pool_size = get_pool_sizes(
+                max_db_connections, instances
+            )
+            for pool_mode in args.pool_modes.split(","):
+                with tempfile.TemporaryDirectory(prefix="pgb-throughput-") as tmp:
+                    workdir = Path(tmp)
+                    services = render_configs(
+                        args, workdir, instances, max_db_connections, pool_mode
+                    )
+                    processes = start_instances(args, services)
+                    try:
+                        logdir = workdir / "pgbench"
+                        logdir.mkdir()
+                        result = run_pgbench(args, pool_mode, logdir)
+                        result.update(skew(instance_transactions(args, services)))
+                    finally:
+                        stop_instances(processes)
+
+                result.update({
+                    "instances": instances,
+                    "max_db_connections": max_db_connections,
+                    "default_pool_size": default_pool_size,
+                    "min_pool_size": min_pool_size,
+                    "reserve_pool_size": reserve_pool_size,
+                    "pool_mode": pool_mode,
+                    "clients": args.clients,
+                })
+                logger.info(
+                    f"{instances} instances, max_db_connections={max_db_connections}, "
+                    f"{pool_mode}: {result['tps']:.0f} tps, "
+                    f"p99 {result['latency_ms']['p99']:.2f}ms, "
+                    f"skew {result['max_over_mean']:.2f}"
+                )
+                results.append(result)
+
+    Path(args.output).write_text(
+        json.dumps(
+            {
+                "pgbench": {
+                    "clients": args.clients,
+                    "jobs": args.jobs,
+                    "duration": args.duration,
+                    "scale": args.scale,
+                },
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    logger.info(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
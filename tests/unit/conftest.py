@@ -1,9 +1,10 @@
 # Copyright 2023 Canonical Ltd.
 # See LICENSE file for licensing details.
+from unittest.mock import MagicMock
 
 import pytest
 
 
 @pytest.fixture(autouse=True)
 def lightkube_patch(monkeypatch):
-    monkeypatch.setattr("lightkube.Client", lambda *_, **__: None)
+    monkeypatch.setattr("lightkube.Client", lambda *_, **__: MagicMock())
@@ -0,0 +1,553 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Local stand-in for a pgbouncer admin console and a PostgreSQL server.
+
+The server speaks enough of the PostgreSQL v3 wire protocol (trust authentication and simple
+queries) for psycopg2 to connect to it, and answers the admin console `SHOW` commands, admin
+commands such as `PAUSE` or `RECONNECT`, and the catalog queries used to probe a server. Answers
+are built from a `FakeState`, that scenarios such as `saturation`, `failover` or
+`lagging_replica` modify, so that features reading live stats can be tested offline.
+
+Example:
+    with FakePostgres() as server:
+        server.add_database("db_1")
+        server.apply(saturation("db_1", waiting=10))
+        connection = psycopg2.connect(host=server.host, port=server.port, dbname="pgbouncer")
+"""
+
+import re
+import socketserver
+import struct
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from itertools import count
+
+PROTOCOL_VERSION = 196608
+SSL_REQUEST_CODE = 80877103
+GSSENC_REQUEST_CODE = 80877104
+
+TYPE_OIDS = {bool: 16, int: 20, float: 701, str: 25}
+
+POOLS_COLUMNS = (
+    "database",
+    "user",
+    "cl_active",
+    "cl_waiting",
+    "cl_active_cancel_req",
+    "cl_waiting_cancel_req",
+    "sv_active",
+    "sv_active_cancel",
+    "sv_being_canceled",
+    "sv_idle",
+    "sv_used",
+    "sv_tested",
+    "sv_login",
+    "maxwait",
+    "maxwait_us",
+    "pool_mode",
+)
+STATS_COLUMNS = (
+    "database",
+    "total_server_assignment_count",
+    "total_xact_count",
+    "total_query_count",
+    "total_received",
+    "total_sent",
+    "total_xact_time",
+    "total_query_time",
+    "total_wait_time",
+    "avg_server_assignment_count",
+    "avg_xact_count",
+    "avg_query_count",
+    "avg_recv",
+    "avg_sent",
+    "avg_xact_time",
+    "avg_query_time",
+    "avg_wait_time",
+)
+CONNECTION_COLUMNS = (
+    "type",
+    "user",
+    "database",
+    "state",
+    "addr",
+    "port",
+    "local_addr",
+    "local_port",
+    "connect_time",
+    "request_time",
+    "wait",
+    "wait_us",
+    "close_needed",
+    "ptr",
+    "link",
+    "remote_pid",
+    "tls",
+    "application_name",
+    "prepared_statements",
+)
+MEM_COLUMNS = ("name", "size", "used", "free", "memtotal")
+DATABASES_COLUMNS = (
+    "name",
+    "host",
+    "port",
+    "database",
+    "force_user",
+    "pool_size",
+    "min_pool_size",
+    "reserve_pool",
+    "pool_mode",
+    "max_connections",
+    "current_connections",
+    "paused",
+    "disabled",
+)
+ADMIN_COMMANDS = (
+    "PAUSE",
+    "RESUME",
+    "RECONNECT",
+    "RELOAD",
+    "KILL",
+    "SUSPEND",
+    "DISABLE",
+    "ENABLE",
+    "WAIT_CLOSE",
+    "SHUTDOWN",
+)
+# Columns holding text, every other column of the admin console is numeric
+TEXT_COLUMNS = {
+    "database",
+    "user",
+    "pool_mode",
+    "type",
+    "state",
+    "addr",
+    "local_addr",
+    "connect_time",
+    "request_time",
+    "ptr",
+    "link",
+    "tls",
+    "application_name",
+    "name",
+    "host",
+    "force_user",
+}
+
+
+class QueryError(Exception):
+    """Error returned to the client as an ErrorResponse."""
+
+    def __init__(self, message: str, sqlstate: str = "42601"):
+        super().__init__(message)
+        self.message = message
+        self.sqlstate = sqlstate
+
+
+@dataclass
+class QueryResult:
+    """Result of a query: the tag of its CommandComplete message and the returned rows."""
+
+    tag: str
+    columns: tuple[str, ...] = ()
+    rows: list[tuple] = field(default_factory=list)
+
+
+@dataclass
+class FakeState:
+    """What the admin console and the catalog queries report.
+
+    The `pools`, `stats`, `clients`, `servers`, `mem` and `databases` rows are dicts keyed by
+    the columns of the matching `SHOW` command; missing numeric columns are reported as 0.
+    """
+
+    pools: list[dict] = field(default_factory=list)
+    stats: list[dict] = field(default_factory=list)
+    clients: list[dict] = field(default_factory=list)
+    servers: list[dict] = field(default_factory=list)
+    mem: list[dict] = field(default_factory=list)
+    databases: list[dict] = field(default_factory=list)
+    paused: set[str] = field(default_factory=set)
+    disabled: set[str] = field(default_factory=set)
+    reconnects: dict[str, int] = field(default_factory=dict)
+    reloads: int = 0
+    version: str = "PostgreSQL 16.4 on x86_64-pc-linux-gnu, compiled by gcc, 64-bit"
+    bouncer_version: str = "PgBouncer 1.21.0"
+    in_recovery: bool = False
+    replication_lag: float | None = None
+    settings: dict[str, str] = field(default_factory=lambda: {"max_connections": "100"})
+
+
+Scenario = Callable[[FakeState], None]
+
+
+def single_value(column: str, value, tag: str = "SELECT 1") -> QueryResult:
+    """Result of a query returning one row of one column."""
+    return QueryResult(tag, (column,), [(value,)])
+
+
+def _rows(rows: list[dict], columns: tuple[str, ...]) -> list[tuple]:
+    return [
+        tuple(row.get(column, None if column in TEXT_COLUMNS else 0) for column in columns)
+        for row in rows
+    ]
+
+
+def _select(rows: list[dict], database: str | None) -> list[dict]:
+    return [row for row in rows if database is None or row.get("database") == database]
+
+
+def saturation(database: str, waiting: int = 10, maxwait: int = 5) -> Scenario:
+    """Every server connection of the database's pools is busy and clients are queueing.
+
+    Args:
+        database: the saturated database.
+        waiting: number of clients waiting for a server connection, per pool.
+        maxwait: seconds the oldest waiting client has been waiting for.
+    """
+
+    def apply(state: FakeState) -> None:
+        for db in state.databases:
+            if db["name"] == database:
+                db["current_connections"] = db["pool_size"]
+        for pool in _select(state.pools, database):
+            pool_size = next(
+                (db["pool_size"] for db in state.databases if db["name"] == database), 20
+            )
+            pool.update(
+                cl_active=pool_size,
+                cl_waiting=waiting,
+                sv_active=pool_size,
+                sv_idle=0,
+                sv_used=0,
+                maxwait=maxwait,
+                maxwait_us=0,
+            )
+        for stats in _select(state.stats, database):
+            stats["avg_wait_time"] = maxwait * 1_000_000
+
+    return apply
+
+
+def failover() -> Scenario:
+    """The server behind the pools was demoted: its connections are gone, and it's a replica."""
+
+    def apply(state: FakeState) -> None:
+        state.servers.clear()
+        for pool in state.pools:
+            pool.update(sv_active=0, sv_idle=0, sv_used=0, sv_tested=0, sv_login=0)
+        state.in_recovery = True
+        state.replication_lag = 0.0
+
+    return apply
+
+
+def lagging_replica(seconds: float) -> Scenario:
+    """The server is a replica replaying WAL the given number of seconds behind its primary."""
+
+    def apply(state: FakeState) -> None:
+        state.in_recovery = True
+        state.replication_lag = seconds
+
+    return apply
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Serves one client connection."""
+
+    server: "_Server"
+
+    def handle(self) -> None:
+        parameters = self._startup()
+        if parameters is None:
+            return
+        admin = parameters.get("database") == "pgbouncer"
+        self._greet(admin)
+
+        transaction_status = b"I"
+        while (header := self.rfile.read(5)) and len(header) == 5:
+            message_type, length = struct.unpack("!ci", header)
+            payload = self.rfile.read(length - 4)
+            if message_type == b"X":
+                return
+            if message_type == b"Q":
+                transaction_status = self._query(payload, admin, transaction_status)
+            else:
+                self._error(QueryError(f"unsupported message {message_type!r}", "08P01"))
+            self._send(b"Z", transaction_status)
+
+    def _greet(self, admin: bool) -> None:
+        """Accept the connection without a password and report the server parameters."""
+        fake = self.server.fake
+        self._send(b"R", struct.pack("!i", 0))
+        for name, value in (
+            ("server_version", "1.21.0/bouncer" if admin else fake.state.version.split()[1]),
+            ("server_encoding", "UTF8"),
+            ("client_encoding", "UTF8"),
+            ("DateStyle", "ISO, MDY"),
+            ("integer_datetimes", "on"),
+            ("standard_conforming_strings", "on"),
+            ("TimeZone", "UTC"),
+        ):
+            self._send(b"S", f"{name}\0{value}\0".encode())
+        self._send(b"K", struct.pack("!ii", next(fake._pids), 0))
+        self._send(b"Z", b"I")
+
+    def _query(self, payload: bytes, admin: bool, transaction_status: bytes) -> bytes:
+        """Answer a simple query and return the new transaction status."""
+        query = payload.rstrip(b"\0").decode().strip().rstrip(";").strip()
+        if not query:
+            self._send(b"I", b"")
+            return transaction_status
+        try:
+            result = self.server.fake.execute(query, admin=admin)
+        except QueryError as e:
+            self._error(e)
+            return b"E" if transaction_status == b"T" else transaction_status
+        self._result(result)
+        if result.tag == "BEGIN":
+            return b"T"
+        if result.tag in ("COMMIT", "ROLLBACK"):
+            return b"I"
+        return transaction_status
+
+    def _startup(self) -> dict[str, str] | None:
+        """Read the startup packet, declining encryption, and return its parameters."""
+        while True:
+            header = self.rfile.read(8)
+            if len(header) < 8:
+                return None
+            length, code = struct.unpack("!ii", header)
+            payload = self.rfile.read(length - 8)
+            if code in (SSL_REQUEST_CODE, GSSENC_REQUEST_CODE):
+                self.wfile.write(b"N")
+                continue
+            if code != PROTOCOL_VERSION:
+                return None
+            values = payload.rstrip(b"\0").decode().split("\0")
+            return dict(zip(values[::2], values[1::2], strict=True))
+
+    def _send(self, message_type: bytes, payload: bytes) -> None:
+        self.wfile.write(message_type + struct.pack("!i", len(payload) + 4) + payload)
+
+    def _error(self, error: QueryError) -> None:
+        fields = (
+            b"SERROR",
+            b"VERROR",
+            f"C{error.sqlstate}".encode(),
+            f"M{error.message}".encode(),
+        )
+        self._send(b"E", b"\0".join(fields) + b"\0\0")
+
+    def _result(self, result: QueryResult) -> None:
+        if result.columns:
+            description = struct.pack("!h", len(result.columns))
+            for index, column in enumerate(result.columns):
+                values = [row[index] for row in result.rows if row[index] is not None]
+                oid = TYPE_OIDS.get(type(values[0]), 25) if values else 25
+                description += (
+                    column.encode() + b"\0" + struct.pack("!ihihih", 0, 0, oid, -1, -1, 0)
+                )
+            self._send(b"T", description)
+            for row in result.rows:
+                data = struct.pack("!h", len(row))
+                for value in row:
+                    if value is None:
+                        data += struct.pack("!i", -1)
+                        continue
+                    if isinstance(value, bool):
+                        value = "t" if value else "f"
+                    encoded = str(value).encode()
+                    data += struct.pack("!i", len(encoded)) + encoded
+                self._send(b"D", data)
+        self._send(b"C", result.tag.encode() + b"\0")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, fake: "FakePostgres"):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.fake = fake
+
+
+class FakePostgres:
+    """PostgreSQL server and pgbouncer admin console stand-in, listening on localhost.
+
+    Connections to the `pgbouncer` database get the admin console; any other database gets the
+    catalog queries. Every query is recorded in `queries`, and further queries can be answered
+    by registering handlers with `add_handler`.
+    """
+
+    def __init__(self, state: FakeState | None = None):
+        self.state = state or FakeState()
+        self.queries: list[str] = []
+        self._lock = threading.Lock()
+        self._pids = count(1000)
+        self._server: _Server | None = None
+        self._handlers: list[tuple[re.Pattern, Callable[..., QueryResult]]] = []
+        self.add_handler(
+            r"select version\(\)", lambda: single_value("version", self.state.version)
+        )
+        self.add_handler(
+            r"select pg_is_in_recovery\(\)",
+            lambda: single_value("pg_is_in_recovery", self.state.in_recovery),
+        )
+        self.add_handler(
+            r"select extract\(epoch from \(?now\(\) - pg_last_xact_replay_timestamp\(\)\)?\)",
+            self._replication_lag,
+        )
+        self.add_handler(
+            r"select current_setting\('(\w+)'\)",
+            lambda name: single_value("current_setting", self.state.settings[name]),
+        )
+
+    def __enter__(self) -> "FakePostgres":
+        """Start the server."""
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        """Stop the server."""
+        self.stop()
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> None:
+        """Listen on a free port of localhost."""
+        self._server = _Server(self)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_handler(self, pattern: str, handler: Callable[..., QueryResult]) -> None:
+        """Answer queries fully matching the pattern, case-insensitively.
+
+        Args:
+            pattern: regular expression, whose groups are passed to the handler.
+            handler: returns the result of the query.
+        """
+        self._handlers.insert(0, (re.compile(pattern, re.IGNORECASE | re.DOTALL), handler))
+
+    def add_database(
+        self,
+        name: str,
+        user: str = "pgbouncer_k8s",
+        pool_mode: str = "session",
+        pool_size=20,
+        max_connections=0,
+    ) -> None:
+        """Add a database with an idle pool, as pgbouncer lists it after a client connected."""
+        with self._lock:
+            self.state.databases.append({
+                "name": name,
+                "host": "postgresql-k8s-primary",
+                "port": 5432,
+                "database": name,
+                "pool_size": pool_size,
+                "pool_mode": pool_mode,
+                "max_connections": max_connections,
+                "current_connections": 1,
+            })
+            self.state.pools.append({
+                "database": name,
+                "user": user,
+                "sv_idle": 1,
+                "pool_mode": pool_mode,
+            })
+            self.state.stats.append({"database": name})
+
+    def apply(self, *scenarios: Scenario) -> None:
+        """Apply the scenarios to the state, in order."""
+        with self._lock:
+            for scenario in scenarios:
+                scenario(self.state)
+
+    def execute(self, query: str, admin: bool = False) -> QueryResult:
+        """Answer a single query.
+
+        Raises:
+            QueryError: if the query is not supported.
+        """
+        with self._lock:
+            self.queries.append(query)
+            command = query.split()[0].upper()
+            if command in ("BEGIN", "COMMIT", "ROLLBACK"):
+                return QueryResult(command)
+            if command == "SET":
+                return QueryResult("SET")
+            if admin:
+                return self._admin(command, query.split()[1:])
+            for pattern, handler in self._handlers:
+                if match := pattern.fullmatch(query):
+                    return handler(*match.groups())
+            raise QueryError(f"unsupported query: {query}", "0A000")
+
+    def _admin(self, command: str, arguments: list[str]) -> QueryResult:
+        if command == "SHOW" and arguments:
+            return self._show(arguments[0].upper())
+        if command not in ADMIN_COMMANDS:
+            raise QueryError("invalid command", "08P01")
+
+        database = arguments[0] if arguments else None
+        if command == "KILL" and database is None:
+            raise QueryError("KILL requires a database", "08P01")
+        databases = [database] if database else [db["name"] for db in self.state.databases]
+        if command in ("PAUSE", "RESUME"):
+            self._toggle(self.state.paused, databases, command == "PAUSE")
+        elif command in ("DISABLE", "ENABLE"):
+            self._toggle(self.state.disabled, databases, command == "DISABLE")
+        elif command == "RECONNECT":
+            for name in databases:
+                self.state.reconnects[name] = self.state.reconnects.get(name, 0) + 1
+        elif command == "RELOAD":
+            self.state.reloads += 1
+        elif command == "KILL":
+            self.state.servers = [s for s in self.state.servers if s["database"] != database]
+            self.state.clients = [c for c in self.state.clients if c["database"] != database]
+        return QueryResult(command)
+
+    @staticmethod
+    def _toggle(names: set[str], databases: list[str], add: bool) -> None:
+        if add:
+            names.update(databases)
+        else:
+            names.difference_update(databases)
+
+    def _show(self, name: str) -> QueryResult:
+        if name == "POOLS":
+            return QueryResult("SHOW", POOLS_COLUMNS, _rows(self.state.pools, POOLS_COLUMNS))
+        if name == "STATS":
+            return QueryResult("SHOW", STATS_COLUMNS, _rows(self.state.stats, STATS_COLUMNS))
+        if name in ("CLIENTS", "SERVERS"):
+            rows = self.state.clients if name == "CLIENTS" else self.state.servers
+            return QueryResult("SHOW", CONNECTION_COLUMNS, _rows(rows, CONNECTION_COLUMNS))
+        if name == "MEM":
+            return QueryResult("SHOW", MEM_COLUMNS, _rows(self.state.mem, MEM_COLUMNS))
+        if name == "DATABASES":
+            rows = [
+                {
+                    **database,
+                    "paused": int(database["name"] in self.state.paused),
+                    "disabled": int(database["name"] in self.state.disabled),
+                }
+                for database in self.state.databases
+            ]
+            return QueryResult("SHOW", DATABASES_COLUMNS, _rows(rows, DATABASES_COLUMNS))
+        if name == "VERSION":
+            return single_value("version", self.state.bouncer_version, tag="SHOW")
+        raise QueryError(f"unknown SHOW command: {name}", "08P01")
+
+    def _replication_lag(self) -> QueryResult:
+        lag = self.state.replication_lag if self.state.in_recovery else None
+        return single_value("lag", lag)
@@ -82,6 +82,7 @@ class TestBackendDatabaseRelation(unittest.TestCase):
         _,
     ):
         self.harness.set_leader(True)
+        _app_databag.return_value = {}
         pw = _gen_pw.return_value
         postgres = _postgres.return_value
         _relation.return_value.data = {}
@@ -91,6 +92,7 @@ class TestBackendDatabaseRelation(unittest.TestCase):
         mock_event.username = "mock_user"
 
         self.backend._on_database_created(mock_event)
+        self.charm.reconcile()
         hash_pw = get_md5_password(self.backend.auth_user, pw)
 
         postgres.create_user.assert_called_with(self.backend.auth_user, hash_pw, admin=True)
@@ -118,6 +120,7 @@ class TestBackendDatabaseRelation(unittest.TestCase):
         _get_secret.side_effect = ModelError
 
         self.backend._on_database_created(mock_event)
+        self.charm.reconcile()
 
         mock_event.defer.assert_called_once_with()
         mock_event.defer.reset_mock()
@@ -125,6 +128,7 @@ class TestBackendDatabaseRelation(unittest.TestCase):
         _get_secret.side_effect = None
 
         self.backend._on_database_created(mock_event)
+        self.charm.reconcile()
         assert not _render_pgb.called
         assert not _toggle_monitoring.called
         _get_secret.assert_called_once_with("app", "auth_file")
@@ -132,6 +136,7 @@ class TestBackendDatabaseRelation(unittest.TestCase):
 
         _get_secret.return_value = "AUTH"
         self.backend._on_database_created(mock_event)
+        self.charm.reconcile()
         _render_pgb.assert_called_once_with()
         _toggle_monitoring.assert_called_once_with(True)
 
@@ -139,6 +144,7 @@ class TestBackendDatabaseRelation(unittest.TestCase):
     @patch("charm.PgBouncerK8sCharm.render_pgb_config")
     def test_on_endpoints_changed(self, _render_pgb, _update_client_conn):
         self.charm.backend._on_endpoints_changed(MagicMock())
+        self.charm.reconcile()
         _render_pgb.assert_called_once_with()
         _update_client_conn.assert_called_once_with()
 
@@ -147,6 +153,7 @@ class TestBackendDatabaseRelation(unittest.TestCase):
     @patch("charm.PgBouncerK8sCharm.render_pgb_config")
     def test_on_relation_changed(self, _render_pgb, _update_client_conn, _check_pgb):
         self.charm.backend._on_relation_changed(MagicMock())
+        self.charm.reconcile()
         _render_pgb.assert_called_once_with()
         _update_client_conn.assert_called_once_with()
         _render_pgb.reset_mock()
@@ -155,12 +162,14 @@ class TestBackendDatabaseRelation(unittest.TestCase):
         # early exit
         _check_pgb.return_value = False
         self.charm.backend._on_relation_changed(MagicMock())
+        self.charm.reconcile()
         assert not _render_pgb.called
         assert not _update_client_conn.called
 
         # connerror
         _check_pgb.side_effect = PebbleConnectionError
         self.charm.backend._on_relation_changed(MagicMock())
+        self.charm.reconcile()
         assert not _render_pgb.called
         assert not _update_client_conn.called
 
@@ -178,6 +187,7 @@ class TestBackendDatabaseRelation(unittest.TestCase):
         depart_event = MagicMock()
         depart_event.departing_unit = self.charm.unit
         self.backend._on_relation_departed(depart_event)
+        self.charm.reconcile()
         _render.assert_called_once_with()
 
     @patch(
@@ -220,7 +230,7 @@ class TestBackendDatabaseRelation(unittest.TestCase):
         conn = _postgres.return_value._connect_to_database().__enter__()
         cursor = conn.cursor().__enter__()
         cursor.execute.assert_called_with(
-            install_script.replace("auth_user", self.backend.auth_user)
+            install_script.replace("auth_schema", "user").replace("auth_user", "user")
         )
         conn.close.assert_called()
 
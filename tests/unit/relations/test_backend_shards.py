@@ -0,0 +1,178 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import unittest
+from unittest.mock import MagicMock, PropertyMock, patch
+
+from ops.testing import Harness
+
+from charm import PgBouncerK8sCharm
+from config import parse_database_routing
+from constants import (
+    APP_SCOPE,
+    AUTH_FILE_DATABAG_KEY,
+    DIRTY_AUTH_FILE,
+    DIRTY_CONFIG,
+    DIRTY_ENDPOINTS,
+    PEER_RELATION_NAME,
+    PG,
+    PGB,
+    SHARD_RELATION_NAME,
+)
+
+AUTH_FILE = '"pgbouncer_auth_relation_1" "md5aaa"\n"pgbouncer_stats_pgbouncer_k8s" "SCRAM"'
+
+
+class TestBackendShards(unittest.TestCase):
+    def setUp(self):
+        self.harness = Harness(PgBouncerK8sCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+
+        self.charm = self.harness.charm
+        self.shards = self.charm.backend_shards
+
+        self.peers_rel_id = self.harness.add_relation(PEER_RELATION_NAME, "pgbouncer-k8s")
+        self.harness.add_relation_unit(self.peers_rel_id, self.charm.unit.name)
+        self.shard_rel_id = self.harness.add_relation(SHARD_RELATION_NAME, "postgresql-eu")
+        self.harness.add_relation_unit(self.shard_rel_id, "postgresql-eu/0")
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.shard_rel_id,
+                "postgresql-eu",
+                {
+                    "endpoints": "eu-primary:5432",
+                    "read-only-endpoints": "eu-replica-1:5432,eu-replica-0:5432",
+                    "username": "relation_7",
+                    "password": "shard-pass",
+                    "version": "16.6",
+                },
+            )
+            self.harness.update_config({"database-routing": "orders=postgresql-eu,billing=other"})
+
+    def test_parse_database_routing(self):
+        assert parse_database_routing("") == {}
+        assert parse_database_routing(" orders = postgresql-eu, billing=other ") == {
+            "orders": "postgresql-eu",
+            "billing": "other",
+        }
+        for value in ("orders", "orders=Postgres", "bad name=app", "a=app,a=other"):
+            with self.assertRaises(ValueError):
+                parse_database_routing(value)
+
+    def test_shard(self):
+        shard = self.shards.shards["postgresql-eu"]
+
+        assert shard.endpoint == "eu-primary:5432"
+        assert shard.get_read_only_endpoints() == {"eu-replica-0:5432", "eu-replica-1:5432"}
+        assert shard.auth_user == f"pgbouncer_auth_relation_7_shard_{self.shard_rel_id}"
+        assert shard.backend_version == "16.6"
+
+    def test_routing(self):
+        # The auth user of the shard isn't set up yet
+        assert self.shards.routing() == {"orders": None, "billing": None}
+        assert self.charm.backend_for("orders") is None
+        assert self.charm.backend_for("other_db") is self.charm.backend
+
+        shard = self.shards.shards["postgresql-eu"]
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+            self.charm.set_secret(
+                APP_SCOPE, AUTH_FILE_DATABAG_KEY, f'{AUTH_FILE}\n"{shard.auth_user}" "md5bbb"'
+            )
+        routing = self.shards.routing()
+        assert routing["orders"].relation.id == self.shard_rel_id
+        assert routing["billing"] is None
+        assert self.charm.backend_for("orders").application == "postgresql-eu"
+
+    @patch(
+        "relations.backend_database.BackendDatabaseRequires.auth_user",
+        new_callable=PropertyMock,
+        return_value="pgbouncer_auth_relation_1",
+    )
+    @patch(
+        "relations.backend_database.BackendDatabaseRequires.relation",
+        new_callable=PropertyMock,
+        return_value=MagicMock(),
+    )
+    @patch("relations.backend_shards.ShardBackend.postgres", new_callable=PropertyMock)
+    def test_auth_function(self, _postgres, _relation, _auth_user):
+        shard = self.shards.shards["postgresql-eu"]
+        self.charm.backend.__dict__.pop("auth_query", None)
+        auth_user = f"pgbouncer_auth_relation_7_shard_{self.shard_rel_id}"
+
+        shard.initialise_auth_function(["orders"])
+
+        # The auth function is in the schema that the global auth_query of pgbouncer calls
+        assert self.charm.backend.auth_query == (
+            "SELECT username, password FROM pgbouncer_auth_relation_1.get_auth($1)"
+        )
+        cursor = _postgres.return_value._connect_to_database().__enter__().cursor().__enter__()
+        script = cursor.execute.call_args.args[0]
+        assert "CREATE OR REPLACE FUNCTION pgbouncer_auth_relation_1.get_auth(" in script
+        assert (
+            "GRANT EXECUTE ON FUNCTION pgbouncer_auth_relation_1.get_auth(username TEXT) "
+            f"TO {auth_user};"
+        ) in script
+        assert f"GRANT USAGE ON SCHEMA pgbouncer_auth_relation_1 TO {auth_user};" in script
+
+    @patch(
+        "relations.backend_database.BackendDatabaseRequires.auth_user",
+        new_callable=PropertyMock,
+        return_value="pgbouncer_auth_relation_1",
+    )
+    @patch("relations.backend_shards.ShardBackend.initialise_auth_function")
+    @patch("relations.backend_shards.ShardBackend.postgres", new_callable=PropertyMock)
+    @patch("relations.backend_shards.generate_password", return_value="auth-pass")
+    def test_on_database_created(self, _generate_password, _postgres, _init_auth, _):
+        self.charm.mark_dirty = MagicMock()
+        event = MagicMock()
+        event.relation = self.charm.model.get_relation(SHARD_RELATION_NAME, self.shard_rel_id)
+        auth_user = f"pgbouncer_auth_relation_7_shard_{self.shard_rel_id}"
+
+        # Followers only render what the leader set up
+        self.shards._on_database_created(event)
+        _postgres.assert_not_called()
+
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+        # The backend-database relation must set up the auth file first
+        self.shards._on_database_created(event)
+        event.defer.assert_called_once_with()
+        _postgres.return_value.create_user.assert_not_called()
+
+        with self.harness.hooks_disabled():
+            self.charm.set_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY, AUTH_FILE)
+            self.harness.update_relation_data(
+                self.peers_rel_id,
+                self.charm.app.name,
+                {"pgb_dbs_config": '{"1": {"name": "orders", "legacy": false}}'},
+            )
+        self.shards._on_database_created(event)
+
+        hashed_password = _postgres.return_value.create_user.call_args.args[1]
+        _postgres.return_value.create_user.assert_called_once_with(
+            auth_user, hashed_password, admin=True
+        )
+        _init_auth.assert_called_once_with([PGB, PG, "orders"])
+        assert self.charm.get_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY) == (
+            f'{AUTH_FILE}\n"{auth_user}" "{hashed_password}"'
+        )
+        self.charm.mark_dirty.assert_called_once_with(
+            DIRTY_AUTH_FILE, DIRTY_CONFIG, DIRTY_ENDPOINTS
+        )
+        assert self.shards.auth_lines(self.charm.get_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY)) == [
+            f'"{auth_user}" "{hashed_password}"'
+        ]
+
+    def test_on_relation_broken(self):
+        auth_user = f"pgbouncer_auth_relation_7_shard_{self.shard_rel_id}"
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+            self.charm.set_secret(
+                APP_SCOPE, AUTH_FILE_DATABAG_KEY, f'{AUTH_FILE}\n"{auth_user}" "md5bbb"'
+            )
+
+        self.harness.remove_relation(self.shard_rel_id)
+
+        assert self.charm.get_secret(APP_SCOPE, AUTH_FILE_DATABAG_KEY) == AUTH_FILE
@@ -75,12 +75,10 @@ class TestDb(unittest.TestCase):
     @patch("charms.postgresql_k8s.v0.postgresql.PostgreSQL.create_database")
     @patch("relations.backend_database.BackendDatabaseRequires.remove_auth_function")
     @patch("relations.backend_database.BackendDatabaseRequires.initialise_auth_function")
-    @patch("charm.PgBouncerK8sCharm.set_relation_databases")
-    @patch("charm.PgBouncerK8sCharm.generate_relation_databases")
+    @patch("charm.PgBouncerK8sCharm.update_relation_databases")
     def test_on_relation_joined(
         self,
-        _gen_rel_dbs,
-        _set_rel_dbs,
+        _update_rel_dbs,
         _init_auth,
         _remove_auth,
         _create_database,
@@ -93,8 +91,6 @@ class TestDb(unittest.TestCase):
     ):
         self.harness.set_leader(True)
 
-        _gen_rel_dbs.return_value = {}
-
         mock_event = Mock()
         mock_event.app.name = "external_test_app"
         mock_event.relation.id = 1
@@ -108,7 +104,6 @@ class TestDb(unittest.TestCase):
                 self.peers_rel_id, self.app, {"pgb_dbs_config": "{}"}
             )
 
-        _set_rel_dbs.reset_mock()
         relation_data = mock_event.relation.data = {}
         relation_data[self.charm.unit] = {}
         relation_data[self.charm.app] = {}
@@ -117,11 +112,9 @@ class TestDb(unittest.TestCase):
         _postgres.create_user = _create_user
         _postgres.create_database = _create_database
 
-        _set_rel_dbs.reset_mock()
         self.db_admin_relation._on_relation_joined(mock_event)
-        _set_rel_dbs.assert_called_once_with({
-            "1": {"name": "test_db", "legacy": True},
-            "*": {"name": "*", "auth_dbname": "test_db", "legacy": False},
+        _update_rel_dbs.assert_called_once_with({
+            "1": {"name": "test_db", "legacy": True, "wildcard": True}
         })
 
         _create_user.assert_called_with(user, password, admin=True)
@@ -134,13 +127,10 @@ class TestDb(unittest.TestCase):
             assert dbag["password"] == password
 
         # Check admin permissions aren't present when we use db_relation
-        _set_rel_dbs.reset_mock()
+        _update_rel_dbs.reset_mock()
         self.db_relation._on_relation_joined(mock_event)
         _create_user.assert_called_with(user, password, admin=False)
-        _set_rel_dbs.assert_called_once_with({
-            "1": {"name": "test_db", "legacy": True},
-            "*": {"name": "*", "auth_dbname": "test_db", "legacy": False},
-        })
+        _update_rel_dbs.assert_called_once_with({"1": {"name": "test_db", "legacy": True}})
 
     @patch("relations.backend_database.BackendDatabaseRequires.check_backend", return_value=True)
     @patch(
@@ -179,10 +169,9 @@ class TestDb(unittest.TestCase):
         # Call the function
         event = Mock()
         self.db_relation._on_relation_changed(event)
+        self.charm.reconcile()
 
-        _update_connection_info.assert_called_with(
-            event.relation, self.charm.config["listen_port"]
-        )
+        _update_connection_info.assert_any_call(event.relation, self.charm.config["listen_port"])
         _update_databags.assert_called_with(
             event.relation,
             {
@@ -275,20 +264,16 @@ class TestDb(unittest.TestCase):
         "relations.backend_database.BackendDatabaseRequires.postgres", new_callable=PropertyMock
     )
     @patch("relations.backend_database.BackendDatabaseRequires.remove_auth_function")
-    @patch("charm.PgBouncerK8sCharm.set_relation_databases")
-    @patch("charm.PgBouncerK8sCharm.generate_relation_databases")
     def test_on_relation_broken(
         self,
-        _gen_rel_dbs,
-        _set_rel_dbs,
         _remove_auth,
         _backend_postgres,
         _delete_user,
         _postgres,
         _check_backend,
     ):
-        _gen_rel_dbs.return_value = {"42": {"name": "test_db", "legacy": True}}
         self.harness.set_leader(True)
+        self.charm.set_relation_databases({"42": {"name": "test_db", "legacy": True}})
         database = "test_db"
         username = "test_user"
         _backend_postgres.return_value = _postgres
@@ -307,7 +292,8 @@ class TestDb(unittest.TestCase):
         self.db_relation._on_relation_broken(mock_event)
 
         _delete_user.assert_called_once_with(username)
-        _set_rel_dbs.assert_called_once_with({})
+        _remove_auth.assert_called_once_with(dbs=[database])
+        assert self.charm.get_relation_databases() == {}
 
     def test_get_allowed_subnets(self):
         rel = self.charm.model.get_relation("db", self.db_rel_id)
@@ -326,3 +312,16 @@ class TestDb(unittest.TestCase):
         rel = self.charm.model.get_relation("db", self.db_rel_id)
 
         assert self.charm.legacy_db_relation.get_external_app(rel).name == "client_app"
+
+    @patch("relations.db.DbProvides.get_databags")
+    def test_update_databags_skips_unchanged_fields(self, _get_databags):
+        databag = Mock()
+        databag.get.side_effect = {"port": "6432", "host": "host"}.get
+        _get_databags.return_value = [databag]
+        rel = self.charm.model.get_relation("db", self.db_rel_id)
+
+        self.db_relation.update_databags(rel, {"port": 6432, "host": "host"})
+        databag.update.assert_not_called()
+
+        self.db_relation.update_databags(rel, {"port": 6432, "host": "other"})
+        databag.update.assert_called_once_with({"host": "other"})
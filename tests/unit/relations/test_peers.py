@@ -4,6 +4,7 @@
 import unittest
 from unittest.mock import Mock, PropertyMock, patch
 
+from ops.pebble import ConnectionError as PebbleConnectionError
 from ops.testing import Harness
 
 from charm import PgBouncerK8sCharm
@@ -38,6 +39,7 @@ class TestPeers(unittest.TestCase):
     ):
         self.harness.add_relation(BACKEND_RELATION_NAME, "postgres")
         self.charm.peers._on_changed(Mock())
+        self.charm.reconcile()
         render_pgb_config.assert_called_once_with()
         toggle_monitoring_layer.assert_called_once_with(False)
         render_pgb_config.reset_mock()
@@ -47,6 +49,138 @@ class TestPeers(unittest.TestCase):
         is_container_ready.return_value = False
         event = Mock()
         self.charm.peers._on_changed(event)
+        self.charm.reconcile()
         event.defer.assert_called_once_with()
         assert not render_pgb_config.called
         assert not toggle_monitoring_layer.called
+
+    @patch(
+        "charm.PgBouncerK8sCharm.is_container_ready", new_callable=PropertyMock, return_value=True
+    )
+    @patch("charm.PgBouncerK8sCharm.render_pgb_config")
+    @patch("charm.PgBouncerK8sCharm.toggle_monitoring_layer")
+    def test_on_peers_changed_skips_unchanged_inputs(
+        self, toggle_monitoring_layer, render_pgb_config, is_container_ready
+    ):
+        self.harness.add_relation(BACKEND_RELATION_NAME, "postgres")
+        self.charm.peers._on_changed(Mock())
+        self.charm.reconcile()
+        render_pgb_config.assert_called_once_with()
+        unit_databag = dict(self.charm.peers.unit_databag)
+
+        # Nothing changed, so nothing is rendered nor written to the peer databag
+        with patch.object(type(self.charm.peers.unit_databag), "update", autospec=True) as _update:
+            self.charm.peers._on_changed(Mock())
+            self.charm.reconcile()
+            _update.assert_not_called()
+        render_pgb_config.assert_called_once_with()
+        assert dict(self.charm.peers.unit_databag) == unit_databag
+
+        # A change in the shared config triggers a new render
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.rel_id, self.app, {"pgb_dbs_config": '{"1": {"name": "db"}}'}
+            )
+        self.charm.peers._on_changed(Mock())
+        self.charm.reconcile()
+        assert render_pgb_config.call_count == 2
+
+        # Forced re-render after a container restart
+        self.charm.peers.reset_config_inputs()
+        self.charm.peers._on_changed(Mock())
+        self.charm.reconcile()
+        assert render_pgb_config.call_count == 3
+
+    @patch(
+        "charm.PgBouncerK8sCharm.is_container_ready", new_callable=PropertyMock, return_value=True
+    )
+    @patch("charm.PgBouncerK8sCharm.render_pgb_config", side_effect=PebbleConnectionError)
+    @patch("charm.PgBouncerK8sCharm.toggle_monitoring_layer")
+    def test_on_peers_changed_acks_rendered_config(
+        self, toggle_monitoring_layer, render_pgb_config, is_container_ready
+    ):
+        self.harness.add_relation(BACKEND_RELATION_NAME, "postgres")
+
+        # The workload isn't reachable, so the config isn't acked and is rendered again
+        self.charm.peers._on_changed(Mock())
+        self.charm.reconcile()
+        assert "pgb_dbs" not in self.charm.peers.unit_databag
+        self.charm.peers._on_changed(Mock())
+        self.charm.reconcile()
+        assert render_pgb_config.call_count == 2
+
+        # Nor when the config can't be rendered yet
+        render_pgb_config.side_effect = None
+        render_pgb_config.return_value = False
+        self.charm.peers._on_changed(Mock())
+        self.charm.reconcile()
+        assert "pgb_dbs" not in self.charm.peers.unit_databag
+
+        render_pgb_config.return_value = True
+        self.charm.peers._on_changed(Mock())
+        self.charm.reconcile()
+        assert self.charm.peers.unit_databag["pgb_dbs"] == self.charm.peers.config_version
+        self.charm.peers._on_changed(Mock())
+        self.charm.reconcile()
+        assert render_pgb_config.call_count == 4
+
+    def test_update_relation_databases(self):
+        self.harness.set_leader()
+        peers = self.charm.peers
+        assert peers.relation_databases is None
+
+        peers.update_relation_databases({
+            "12": {"name": "db", "legacy": False},
+            "3": {"name": "other", "legacy": True},
+        })
+        version = peers.config_version
+
+        # Each entry has a key of its own, listed by relation id
+        assert peers.app_databag["pgb_db_12"] == '{"name":"db","legacy":false}'
+        assert peers.relation_databases == {
+            "3": {"name": "other", "legacy": True},
+            "12": {"name": "db", "legacy": False},
+        }
+        assert peers.relation_database("3") == {"name": "other", "legacy": True}
+        assert peers.relation_database("4") is None
+
+        # Only the changed entries are written
+        with patch.object(type(peers.app_databag), "update", autospec=True) as _update:
+            peers.update_relation_databases({
+                "3": {"name": "other", "legacy": True},
+                "12": {"name": "db", "legacy": False, "pool": {"pool-size": "5"}},
+            })
+            _update.assert_called_once_with(
+                peers.app_databag,
+                {
+                    "pgb_db_12": '{"name":"db","legacy":false,"pool":{"pool-size":"5"}}',
+                    "pgb_dbs_version": str(int(version) + 1),
+                },
+            )
+
+        # Nothing is written if nothing changed
+        peers.update_relation_databases({"3": {"name": "other", "legacy": True}, "4": None})
+        assert peers.config_version == version
+
+        peers.update_relation_databases({"3": None})
+        assert peers.relation_databases == {"12": {"name": "db", "legacy": False}}
+        assert peers.config_version == str(int(version) + 1)
+
+    def test_update_relation_databases_legacy(self):
+        self.harness.set_leader()
+        peers = self.charm.peers
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.rel_id, self.app, {"pgb_dbs_config": '{"1": {"name": "db"}}'}
+            )
+        legacy_version = peers.config_version
+        assert peers.relation_databases == {"1": {"name": "db"}}
+        assert peers.relation_database("1") == {"name": "db"}
+        assert not peers.relation_databases_versioned
+
+        peers.update_relation_databases({"1": {"name": "db"}, "2": {"name": "other"}})
+
+        assert "pgb_dbs_config" not in peers.app_databag
+        assert peers.relation_databases == {"1": {"name": "db"}, "2": {"name": "other"}}
+        assert peers.config_version == "1"
+        assert peers.config_version != legacy_version
@@ -3,10 +3,13 @@
 #
 # Learn more about testing at: https://juju.is/docs/sdk/testing
 
+import json
 import logging
 import math
+import os
 import socket
 import unittest
+from hashlib import shake_128
 from signal import SIGHUP
 from unittest.mock import MagicMock, Mock, PropertyMock, call, patch
 
@@ -14,19 +17,31 @@ import lightkube
 import psycopg2
 import pytest
 from jinja2 import Template
-from ops import BlockedStatus, JujuVersion
+from ops import ActiveStatus, BlockedStatus, JujuVersion
 from ops.model import RelationDataTypeError
+from ops.pebble import ConnectionError as PebbleConnectionError
 from ops.testing import Harness
 from parameterized import parameterized
 
-from charm import PgBouncerK8sCharm
+from charm import LAZY_LIBRARY_HOOKS, PgBouncerK8sCharm, get_pool_sizes
 from constants import (
     BACKEND_RELATION_NAME,
+    DIRTY_AUTH_FILE,
+    DIRTY_CONFIG,
+    DIRTY_ENDPOINTS,
+    DIRTY_READONLY_DBS,
+    DIRTY_STATUS,
+    MAX_ISOLATED_APPLICATIONS,
     PEER_RELATION_NAME,
     PGB,
+    READONLY_SERVICE_ID,
     SECRET_INTERNAL_LABEL,
+    TOO_MANY_ISOLATED_APPLICATIONS_MESSAGE,
 )
 
+from .fake_postgres import FakePostgres, saturation
+from .helpers import _FakeApiError
+
 
 class TestCharm(unittest.TestCase):
     def setUp(self):
@@ -80,8 +95,48 @@ class TestCharm(unittest.TestCase):
             "listen_port": 6464,
         })
         _render.assert_called_once_with(restart=True)
+        # Flush the state marked dirty by leader-elected, as at the end of a dispatch
+        self.charm.reconcile()
         _update_connection_info.assert_called_with()
 
+    @patch("ops.model.Container.restart")
+    @patch("charm.PgBouncerK8sCharm._reconcile_dedicated_services")
+    @patch("charm.PgBouncerK8sCharm.reconcile_k8s_service")
+    @patch("charm.PgBouncerK8sCharm.render_pgb_config")
+    def test_on_config_changed_isolated_ports_shift(
+        self, _render, _reconcile_k8s_service, _reconcile_dedicated_services, _restart
+    ):
+        self.harness.set_leader(True)
+        container = self.harness.model.unit.get_container(PGB)
+        self.charm.on.pgbouncer_pebble_ready.emit(container)
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"isolated-applications": "batch,reporting"})
+            self.harness.update_relation_data(
+                self.rel_id,
+                self.charm.app.name,
+                {
+                    "current_port": "6432",
+                    "current_isolated_ports": self.charm._service_settings()[
+                        "current_isolated_ports"
+                    ],
+                },
+            )
+        _restart.reset_mock()
+
+        # Removing the first group moves the second one to its port and instance id
+        self.harness.update_config({"isolated-applications": "reporting"})
+
+        _render.assert_called_with(restart=False)
+        _restart.assert_called_once_with("pgbouncer_isolated_reporting")
+        assert json.loads(
+            self.harness.get_relation_data(self.rel_id, self.charm.app)["current_isolated_ports"]
+        ) == {"reporting": 6433}
+
+        # Nothing moved
+        _restart.reset_mock()
+        self.harness.update_config({"isolated-applications": "reporting,batch"})
+        _restart.assert_not_called()
+
     @patch(
         "charm.PgBouncerK8sCharm.is_container_ready", new_callable=PropertyMock, return_value=False
     )
@@ -97,8 +152,10 @@ class TestCharm(unittest.TestCase):
         assert len(layer.services) == self.charm._cores + 2
 
     @patch("charm.PgBouncerK8sCharm.update_status")
+    @patch("charm.PgBouncerK8sCharm._push_pgb_config")
+    @patch("charm.PgBouncerK8sCharm._render_pgb_config_files")
     @patch("charm.PgBouncerK8sCharm.render_pgb_config")
-    def test_on_pgbouncer_pebble_ready(self, _render, _update_status):
+    def test_on_pgbouncer_pebble_ready(self, _render, _render_files, _push, _update_status):
         self.harness.add_relation(BACKEND_RELATION_NAME, "postgres")
         self.harness.set_leader(True)
 
@@ -110,14 +167,18 @@ class TestCharm(unittest.TestCase):
             )
             self.assertTrue(container_service.is_running())
         _update_status.assert_called_once_with()
-        _render.assert_called_once_with()
+        # The config is staged before the services start, without reloading them
+        _push.assert_called_once_with(_render_files.return_value)
+        assert not _render.called
+        assert self.charm.peers.unit_databag["pgb_dbs"] == self.charm.peers.config_version
 
     @patch("charm.PgBouncerK8sCharm.update_status")
     @patch("charm.PgBouncerK8sCharm.push_tls_files_to_workload")
-    @patch("charm.PgBouncerK8sCharm.render_pgb_config")
-    @patch("charm.PostgreSQLTLS.get_tls_files")
+    @patch("charm.PgBouncerK8sCharm._push_pgb_config")
+    @patch("charm.PgBouncerK8sCharm._render_pgb_config_files")
+    @patch("charms.postgresql_k8s.v0.postgresql_tls.PostgreSQLTLS.get_tls_files")
     def test_on_pgbouncer_pebble_ready_ensure_tls_files(
-        self, get_tls_files, _render, push_tls_files_to_workload, _update_status
+        self, get_tls_files, _render_files, _push, push_tls_files_to_workload, _update_status
     ):
         get_tls_files.return_value = ("key", "ca", "cert")
 
@@ -130,10 +191,10 @@ class TestCharm(unittest.TestCase):
         container = self.harness.model.unit.get_container(PGB)
         self.charm.on.pgbouncer_pebble_ready.emit(container)
 
-        get_tls_files.assert_called_once_with()
+        get_tls_files.assert_called_with()
         push_tls_files_to_workload.assert_called_once_with(False)
         _update_status.assert_called_once_with()
-        _render.assert_called_once_with()
+        _push.assert_called_once_with(_render_files.return_value)
 
     @patch("charm.PgBouncerK8sCharm.check_pgb_running")
     @patch("ops.model.Container.send_signal")
@@ -226,13 +287,16 @@ class TestCharm(unittest.TestCase):
                 databases=expected_databases,
                 readonly_databases={},
                 peer_id=i,
+                instance_address=f"127.0.1.{i + 1}",
                 peers=range(self.charm._cores),
                 socket_dir=f"/var/lib/pgbouncer/instance_{i}",
+                base_socket_dir="/var/lib/pgbouncer/instance_",
                 log_file=f"/var/log/pgbouncer/instance_{i}/pgbouncer.log",
                 pid_file=f"/var/lib/pgbouncer/instance_{i}/pgbouncer.pid",
                 listen_port=6432,
                 pool_mode="session",
                 max_db_connections=100,
+                user_quotas={"relation_id_2": {"guaranteed": 50, "burst": 100}},
                 max_prepared_statements=100,
                 default_pool_size=default_pool_size,
                 min_pool_size=min_pool_size,
@@ -247,6 +311,7 @@ class TestCharm(unittest.TestCase):
             _push_file.assert_any_call(
                 f"/var/lib/pgbouncer/instance_{i}/pgbouncer.ini", expected_content, 0o400
             )
+            assert "1 = host=/var/lib/pgbouncer/instance_0 port=6432" in expected_content
         _check_pgb_running.assert_called_once_with()
         _send_signal.assert_has_calls([
             call(SIGHUP, service["name"]) for service in self.charm._services
@@ -278,8 +343,10 @@ class TestCharm(unittest.TestCase):
                 databases=expected_databases,
                 readonly_databases={},
                 peer_id=i,
+                instance_address=f"127.0.1.{i + 1}",
                 peers=range(self.charm._cores),
                 socket_dir=f"/var/lib/pgbouncer/instance_{i}",
+                base_socket_dir="/var/lib/pgbouncer/instance_",
                 log_file=f"/var/log/pgbouncer/instance_{i}/pgbouncer.log",
                 pid_file=f"/var/lib/pgbouncer/instance_{i}/pgbouncer.pid",
                 listen_port=6432,
@@ -300,6 +367,114 @@ class TestCharm(unittest.TestCase):
                 f"/var/lib/pgbouncer/instance_{i}/pgbouncer.ini", expected_content, 0o400
             )
 
+    @parameterized.expand([
+        (0, 4, (20, 10, 10)),
+        (100, 2, (25, 13, 13)),
+        (100, 4, (13, 7, 7)),
+        (10, 4, (2, 1, 1)),
+    ])
+    def test_get_pool_sizes(self, max_db_connections, instances, expected):
+        assert get_pool_sizes(max_db_connections, instances) == expected
+
+    @patch("charm.PgBouncerK8sCharm.check_pgb_running")
+    @patch("ops.model.Container.send_signal")
+    @patch("charm.PgBouncerK8sCharm.push_file")
+    def test_render_pgb_config_unchanged(self, _push_file, _send_signal, _check_pgb_running):
+        container = self.harness.model.unit.get_container(PGB)
+        self.charm.on.pgbouncer_pebble_ready.emit(container)
+        _push_file.reset_mock()
+        _send_signal.reset_mock()
+
+        # Rendering the same content again is a no-op while the services are running
+        self.charm.render_pgb_config()
+        _push_file.assert_not_called()
+        _send_signal.assert_not_called()
+
+        # Restarts always push and restart the services
+        with patch("ops.model.Container.restart") as _restart:
+            self.charm.render_pgb_config(restart=True)
+        assert _push_file.call_count == self.charm._cores
+        assert _restart.call_count == self.charm._cores
+        _push_file.reset_mock()
+
+        # So do config changes
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"max_db_connections": 42})
+        self.charm.render_pgb_config()
+        assert _push_file.call_count == self.charm._cores
+        assert _send_signal.call_count == self.charm._cores
+
+    @patch("charm.PgBouncerK8sCharm.get_tls_files")
+    @patch("charm.PgBouncerK8sCharm.check_pgb_running")
+    @patch("ops.model.Container.send_signal")
+    @patch("charm.PgBouncerK8sCharm.push_file")
+    def test_push_tls_files_to_workload_renewed(
+        self, _push_file, _send_signal, _check_pgb_running, _get_tls_files
+    ):
+        _get_tls_files.return_value = ("key", "ca", "cert")
+        container = self.harness.model.unit.get_container(PGB)
+        self.charm.on.pgbouncer_pebble_ready.emit(container)
+        self.charm.push_tls_files_to_workload()
+        _send_signal.reset_mock()
+
+        # Same files
+        self.charm.push_tls_files_to_workload()
+        _send_signal.assert_not_called()
+
+        # The ini files are unchanged, but pgbouncer has to load the renewed certificate
+        _get_tls_files.return_value = ("new key", "ca", "new cert")
+        self.charm.push_tls_files_to_workload()
+        _send_signal.assert_has_calls([
+            call(SIGHUP, service["name"]) for service in self.charm._services
+        ])
+
+    @patch("charm.PgBouncerK8sCharm.update_status")
+    @patch("charm.PgBouncerK8sCharm.update_client_connection_info")
+    @patch("charm.PgBouncerK8sCharm.toggle_monitoring_layer")
+    @patch("charm.PgBouncerK8sCharm.render_auth_file")
+    @patch("charm.PgBouncerK8sCharm.render_pgb_config")
+    def test_reconcile(
+        self,
+        _render_pgb_config,
+        _render_auth_file,
+        _toggle_monitoring_layer,
+        _update_client_connection_info,
+        _update_status,
+    ):
+        self.charm.reconcile()
+        _render_pgb_config.reset_mock()
+        _update_client_connection_info.reset_mock()
+        _update_status.reset_mock()
+
+        # Several handlers marking the same state dirty result in a single operation
+        self.charm.mark_dirty(DIRTY_CONFIG, DIRTY_ENDPOINTS)
+        self.charm.mark_dirty(DIRTY_CONFIG, DIRTY_STATUS, monitoring_enabled=True)
+        self.charm.reconcile()
+        _render_pgb_config.assert_called_once_with()
+        _render_auth_file.assert_not_called()
+        _toggle_monitoring_layer.assert_called_once_with(True)
+        _update_client_connection_info.assert_called_once_with()
+        _update_status.assert_called_once_with()
+
+        # Nothing left to do
+        _render_pgb_config.reset_mock()
+        self.charm.reconcile()
+        _render_pgb_config.assert_not_called()
+
+        # The workload is unreachable, so the state is kept for the next dispatch
+        _render_pgb_config.side_effect = PebbleConnectionError
+        self.charm.mark_dirty(DIRTY_AUTH_FILE, DIRTY_CONFIG)
+        self.charm.reconcile()
+        assert self.charm._stored.dirty == [DIRTY_AUTH_FILE, DIRTY_CONFIG]
+
+        _render_pgb_config.side_effect = None
+        _render_pgb_config.reset_mock()
+        _render_auth_file.reset_mock()
+        self.charm.reconcile()
+        _render_auth_file.assert_called_once_with()
+        _render_pgb_config.assert_called_once_with()
+        assert self.charm._stored.dirty == []
+
     @patch("charm.PgBouncerK8sCharm.get_secret", return_value="test")
     @patch("charm.PgBouncerK8sCharm.push_file")
     def test_render_auth_file(self, _push_file, get_secret):
@@ -348,9 +523,163 @@ class TestCharm(unittest.TestCase):
 
         assert self.charm.generate_relation_databases() == {}
 
+    @patch("charms.data_platform_libs.v0.data_interfaces.DatabaseProvides.fetch_relation_data")
+    def test_generate_relation_databases(self, _fetch_relation_data):
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+        _fetch_relation_data.return_value = {
+            2: {"database": "admin_db", "extra-user-roles": "charmed_admin"},
+            3: {"database": "backup_db", "extra-user-roles": "CHARMED_BACKUP"},
+            4: {"database": "app_db", "pool-size": "5"},
+            5: {},
+        }
+
+        # Same roles as the database requests of the client relation
+        assert self.charm.generate_relation_databases() == {
+            "2": {"name": "admin_db", "legacy": False, "wildcard": True},
+            "3": {"name": "backup_db", "legacy": False, "wildcard": True},
+            "4": {"name": "app_db", "legacy": False, "pool": {"pool-size": "5"}},
+            "*": {"name": "*", "auth_dbname": "backup_db", "legacy": False},
+        }
+
+    def test_update_relation_databases(self):
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+
+        self.charm.update_relation_databases({
+            "2": {"name": "first_db", "legacy": True, "wildcard": True},
+            "7": {"name": "second_db", "legacy": False, "wildcard": True},
+            "*": {"name": "*", "auth_dbname": "first_db", "legacy": False},
+        })
+
+        # The wildcard is derived from the relations needing it, not stored
+        assert "pgb_db_*" not in self.charm.peers.app_databag
+        assert self.charm.get_relation_databases()["*"] == {
+            "name": "*",
+            "auth_dbname": "second_db",
+            "legacy": False,
+        }
+
+        self.charm.update_relation_databases({
+            "2": None,
+            "7": {"name": "second_db", "legacy": False},
+        })
+        assert self.charm.get_relation_databases() == {"7": {"name": "second_db", "legacy": False}}
+
+    @patch("charm.PgBouncerK8sCharm.generate_relation_databases")
+    def test_update_relation_databases_legacy(self, _generate_relation_databases):
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+            self.harness.update_relation_data(
+                self.rel_id,
+                self.charm.app.name,
+                {"pgb_dbs_config": '{"1": {"name": "db", "legacy": false}}'},
+            )
+        _generate_relation_databases.side_effect = lambda: self.charm.set_relation_databases({
+            "1": {"name": "db", "legacy": False, "wildcard": True}
+        })
+
+        self.charm.update_relation_databases({"3": {"name": "other", "legacy": False}})
+
+        # The entries of earlier revisions are rebuilt from the relations first
+        _generate_relation_databases.assert_called_once_with()
+        assert self.charm.get_relation_databases() == {
+            "1": {"name": "db", "legacy": False, "wildcard": True},
+            "3": {"name": "other", "legacy": False},
+            "*": {"name": "*", "auth_dbname": "db", "legacy": False},
+        }
+
+        self.charm.update_relation_databases({"3": None})
+        _generate_relation_databases.assert_called_once_with()
+
+    @patch("charm.PgBouncerK8sCharm.generate_relation_databases")
+    def test_update_relation_databases_mixed_revisions(self, _generate_relation_databases):
+        unit = f"{self.charm.app.name}/1"
+        legacy_blob = '{"1": {"name": "db", "legacy": false}}'
+        upgrade_rel_id = self.harness.model.get_relation("upgrade").id
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+            self.harness.add_relation_unit(self.rel_id, unit)
+            self.harness.add_relation_unit(upgrade_rel_id, unit)
+            # This unit was upgraded first, the other one still runs the earlier revision
+            self.harness.update_relation_data(
+                upgrade_rel_id, self.charm.unit.name, {"state": "completed"}
+            )
+            self.harness.update_relation_data(upgrade_rel_id, unit, {"state": "idle"})
+            self.harness.update_relation_data(
+                self.rel_id, self.charm.app.name, {"pgb_dbs_config": legacy_blob}
+            )
+            self.harness.update_relation_data(
+                self.rel_id, unit, {"pgb_dbs": shake_128(legacy_blob.encode()).hexdigest(16)}
+            )
+        _generate_relation_databases.side_effect = lambda: self.charm.set_relation_databases({
+            "1": {"name": "db", "legacy": False, "wildcard": True}
+        })
+        assert self.charm.upgrade_in_progress
+        assert self.charm.peers.units_synced()
+
+        self.charm.update_relation_databases({"3": {"name": "other", "legacy": False}})
+
+        # The blob read by the earlier revision is kept up to date along the new keys
+        databases = self.charm.get_relation_databases()
+        assert databases == {
+            "1": {"name": "db", "legacy": False, "wildcard": True},
+            "3": {"name": "other", "legacy": False},
+            "*": {"name": "*", "auth_dbname": "db", "legacy": False},
+        }
+        app_databag = self.charm.peers.app_databag
+        assert json.loads(app_databag["pgb_dbs_config"]) == databases
+        assert self.charm.peers.relation_databases_versioned
+
+        # Units of both revisions can ack the new config
+        assert not self.charm.peers.units_synced()
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.rel_id,
+                unit,
+                {"pgb_dbs": shake_128(app_databag["pgb_dbs_config"].encode()).hexdigest(16)},
+            )
+        assert self.charm.peers.units_synced()
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.rel_id, unit, {"pgb_dbs": self.charm.peers.config_version}
+            )
+        assert self.charm.peers.units_synced()
+
+        # A leader of the earlier revision rewrites the blob, which then takes precedence
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.rel_id, self.charm.app.name, {"pgb_dbs_config": legacy_blob}
+            )
+        assert self.charm.get_relation_databases() == {"1": {"name": "db", "legacy": False}}
+        assert self.charm.peers.config_version == shake_128(legacy_blob.encode()).hexdigest(16)
+
+        # Until the new leader rebuilds the entries from the relations, dropping the stale ones
+        self.charm.update_relation_databases({})
+        assert _generate_relation_databases.call_count == 2
+        assert "pgb_db_3" not in app_databag
+        assert json.loads(app_databag["pgb_dbs_config"]) == {
+            "1": {"name": "db", "legacy": False, "wildcard": True},
+            "*": {"name": "*", "auth_dbname": "db", "legacy": False},
+        }
+
+        # Once the upgrade finished, the blob isn't kept anymore
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                upgrade_rel_id, self.charm.unit.name, {"state": "idle"}
+            )
+        assert not self.charm.upgrade_in_progress
+        self.charm.drop_legacy_relation_databases()
+        assert "pgb_dbs_config" not in app_databag
+        assert "pgb_dbs_config_hash" not in app_databag
+        assert self.charm.get_relation_databases() == {
+            "1": {"name": "db", "legacy": False, "wildcard": True},
+            "*": {"name": "*", "auth_dbname": "db", "legacy": False},
+        }
+
     @patch("charm.PgBouncerK8sCharm.push_file")
     @patch("charm.PgBouncerK8sCharm.update_config")
-    @patch("charm.PostgreSQLTLS.get_tls_files")
+    @patch("charms.postgresql_k8s.v0.postgresql_tls.PostgreSQLTLS.get_tls_files")
     def test_push_tls_files_to_workload_enabled_tls(self, get_tls_files, update_config, push_file):
         get_tls_files.return_value = ("key", "ca", "cert")
 
@@ -365,7 +694,7 @@ class TestCharm(unittest.TestCase):
 
     @patch("charm.PgBouncerK8sCharm.push_file")
     @patch("charm.PgBouncerK8sCharm.update_config")
-    @patch("charm.PostgreSQLTLS.get_tls_files")
+    @patch("charms.postgresql_k8s.v0.postgresql_tls.PostgreSQLTLS.get_tls_files")
     def test_push_tls_files_to_workload_disabled_tls(
         self, get_tls_files, update_config, push_file
     ):
@@ -393,7 +722,13 @@ class TestCharm(unittest.TestCase):
     def test_get_readonly_dbs(self, _backend_rel, _postgres_databag, _):
         with self.harness.hooks_disabled():
             self.harness.update_relation_data(
-                self.rel_id, self.charm.app.name, {"readonly_dbs": '["includedb"]'}
+                self.rel_id,
+                self.charm.app.name,
+                {
+                    "readonly_dbs": '["includedb", "relationdb"]',
+                    # Served with the aliases of its relation instead
+                    "pgb_dbs_config": '{"1": {"name": "relationdb", "legacy": false}}',
+                },
             )
 
         # Returns empty if no wildcard
@@ -416,35 +751,199 @@ class TestCharm(unittest.TestCase):
             }
         }
 
+    @patch(
+        "charm.BackendDatabaseRequires.auth_user",
+        new_callable=PropertyMock,
+        return_value="auth_user",
+    )
+    @patch(
+        "charm.BackendDatabaseRequires.postgres_databag",
+        new_callable=PropertyMock,
+        return_value={"endpoints": "HOST:PORT"},
+    )
+    @patch(
+        "charm.BackendDatabaseRequires.relation", new_callable=PropertyMock, return_value=Mock()
+    )
+    def test_get_relation_config_pool_policy(self, _backend_rel, _postgres_databag, _):
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"max_db_connections": 50})
+            self.harness.update_relation_data(
+                self.rel_id,
+                self.charm.app.name,
+                {
+                    "pgb_dbs_config": json.dumps({
+                        "1": {
+                            "name": "oltp",
+                            "legacy": False,
+                            "pool": {"pool-mode": "transaction", "pool-size": "5"},
+                        },
+                        # The first policy requested for a shared database applies
+                        "2": {"name": "oltp", "legacy": False, "pool": {"pool-size": "10"}},
+                        # Over the global budget
+                        "3": {
+                            "name": "batch",
+                            "legacy": False,
+                            "pool": {"pool-mode": "session", "max-db-connections": "80"},
+                        },
+                        "4": {"name": "other", "legacy": False},
+                    })
+                },
+            )
+
+        config = self.charm._get_relation_config()
+
+        assert config["oltp"]["pool"] == {"pool_mode": "transaction", "pool_size": 5}
+        assert config["oltp_readonly"]["pool"] == {"pool_mode": "transaction", "pool_size": 5}
+        assert config["batch"]["pool"] == {"pool_mode": "session"}
+        assert config["other"]["pool"] == {}
+
+        with open("templates/pgb_config.j2") as file:
+            rendered = Template(file.read()).render(
+                databases=config, readonly_databases={}, peers=[], peer_id=0
+            )
+        assert (
+            "oltp = host=HOST dbname=oltp port=PORT auth_user=auth_user pool_mode=transaction "
+            "pool_size=5\n"
+        ) in rendered
+        assert "other = host=HOST dbname=other port=PORT auth_user=auth_user\n" in rendered
+
+    @patch("relations.backend_shards.BackendShards.routing")
+    @patch(
+        "charm.BackendDatabaseRequires.auth_user",
+        new_callable=PropertyMock,
+        return_value="auth_user",
+    )
+    @patch(
+        "charm.BackendDatabaseRequires.get_read_only_endpoints",
+        return_value={"replica:5432"},
+    )
+    @patch(
+        "charm.BackendDatabaseRequires.postgres_databag",
+        new_callable=PropertyMock,
+        return_value={"endpoints": "primary:5432"},
+    )
+    @patch(
+        "charm.BackendDatabaseRequires.relation", new_callable=PropertyMock, return_value=Mock()
+    )
+    def test_get_relation_config_routing(
+        self, _backend_rel, _postgres_databag, _read_only_endpoints, _auth_user, _routing
+    ):
+        shard = Mock(endpoint="eu-primary:5433", auth_user="shard_auth_user")
+        shard.get_read_only_endpoints.return_value = {"eu-replica-1:5433", "eu-replica-0:5433"}
+        _routing.return_value = {"orders": shard, "billing": None}
+        databases = {
+            "1": {"name": "orders", "legacy": False},
+            "2": {"name": "billing", "legacy": False},
+            "3": {"name": "other", "legacy": False},
+            "*": {"name": "*", "auth_dbname": "other"},
+        }
+
+        config = self.charm._get_relation_config(databases)
+
+        assert config["orders"] == {
+            "host": "eu-primary",
+            "dbname": "orders",
+            "port": "5433",
+            "auth_user": "shard_auth_user",
+            "pool": {},
+        }
+        assert config["orders_readonly"]["host"] == "eu-replica-0,eu-replica-1"
+        assert config["orders_readonly"]["auth_user"] == "shard_auth_user"
+        # Not served by the primary until the shard is ready
+        assert "billing" not in config
+        assert "billing_readonly" not in config
+        assert config["other"]["host"] == "primary"
+        assert config["other"]["auth_user"] == "auth_user"
+        assert config["other_readonly"]["host"] == "replica"
+        assert config["*"]["host"] == "primary"
+
+        # The shard entries authenticate with the auth user of the shard, through the auth
+        # function installed in the schema of the global auth_query
+        self.charm.backend.__dict__.pop("auth_query", None)
+        with open("templates/pgb_config.j2") as file:
+            rendered = Template(file.read()).render(
+                databases=config,
+                readonly_databases={},
+                peers=[],
+                peer_id=0,
+                auth_query=self.charm.backend.auth_query,
+            )
+        assert (
+            "orders = host=eu-primary dbname=orders port=5433 auth_user=shard_auth_user\n"
+        ) in rendered
+        assert "auth_query = SELECT username, password FROM auth_user.get_auth($1)\n" in rendered
+
     @patch("charm.BackendDatabaseRequires.postgres")
     @patch(
         "charm.PgBouncerK8sCharm.get_relation_databases",
-        return_value={"1": {"name": "excludeddb"}},
+        return_value={"1": {"name": "relationdb"}},
     )
     def test_collect_readonly_dbs(self, _get_relation_databases, _postgres):
-        _postgres._connect_to_database().__enter__().cursor().__enter__().fetchall.return_value = (
-            ("includeddb",),
-            ("excludeddb",),
-        )
+        cursor = _postgres._connect_to_database().__enter__().cursor().__enter__()
+        cursor.fetchall.return_value = (("includeddb",), ("relationdb",), ("postgres",))
+        _postgres.reset_mock()
 
         # don't collect if not leader
-        self.charm._collect_readonly_dbs()
+        assert not self.charm._collect_readonly_dbs()
         assert "readonly_dbs" not in self.charm.peers.app_databag
 
         with self.harness.hooks_disabled():
             self.harness.set_leader()
 
-        self.charm._collect_readonly_dbs()
+        # The backend isn't queried without a wildcard database
+        assert not self.charm._collect_readonly_dbs()
+        _postgres._connect_to_database.assert_not_called()
+
+        _get_relation_databases.return_value = {
+            "1": {"name": "relationdb"},
+            "*": {"name": "*", "auth_dbname": "relationdb"},
+        }
+        assert self.charm._collect_readonly_dbs()
+
+        # The relation databases are only left out on render
+        assert self.charm.peers.app_databag["readonly_dbs"] == '["includeddb", "relationdb"]'
 
-        assert self.charm.peers.app_databag["readonly_dbs"] == '["includeddb"]'
+        # The databag is only written when the databases changed
+        with patch.object(
+            type(self.charm.peers.app_databag), "__setitem__", autospec=True
+        ) as _setitem:
+            assert not self.charm._collect_readonly_dbs()
+        _setitem.assert_not_called()
 
         # don't fail if no connection
-        _postgres._connect_to_database().__enter__().cursor().__enter__().fetchall.return_value = ()
+        cursor.fetchall.return_value = ()
         _postgres._connect_to_database().__enter__.side_effect = psycopg2.Error
 
-        self.charm._collect_readonly_dbs()
+        assert not self.charm._collect_readonly_dbs()
+
+        assert self.charm.peers.app_databag["readonly_dbs"] == '["includeddb", "relationdb"]'
+
+        # The databases aren't enumerated in autodb mode
+        _postgres.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"autodb-mode": True})
+
+        assert self.charm._collect_readonly_dbs()
+
+        assert "readonly_dbs" not in self.charm.peers.app_databag
+        _postgres._connect_to_database.assert_not_called()
+
+    @patch("charm.PgBouncerK8sCharm.render_pgb_config")
+    @patch("charm.PgBouncerK8sCharm._collect_readonly_dbs")
+    def test_reconcile_readonly_dbs(self, _collect_readonly_dbs, _render_pgb_config):
+        _collect_readonly_dbs.return_value = False
+        self.charm.mark_dirty(DIRTY_READONLY_DBS)
+        self.charm.reconcile()
+
+        _collect_readonly_dbs.assert_called_once_with()
+        _render_pgb_config.assert_not_called()
+
+        # New databases are rendered in the same dispatch
+        _collect_readonly_dbs.return_value = True
+        self.charm.mark_dirty(DIRTY_READONLY_DBS)
+        self.charm.reconcile()
 
-        assert self.charm.peers.app_databag["readonly_dbs"] == '["includeddb"]'
+        _render_pgb_config.assert_called_once_with()
 
     @patch("charm.PgBouncerK8sCharm.get_service")
     @patch("charm.get_pod")
@@ -543,6 +1042,209 @@ class TestCharm(unittest.TestCase):
             expected_service, field_manager=self.charm.app.name
         )
 
+    @patch("charm.PgBouncerK8sCharm.get_service")
+    @patch("charm.get_pod")
+    def test_reconcile_k8s_service_isolated_ports(self, _get_pod, _get_service):
+        _lightkube_client = MagicMock()
+        self.charm.lightkube_client = _lightkube_client
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"isolated-applications": "batch=10, reporting"})
+
+        assert self.charm.reconcile_k8s_service(port_changed=True)
+
+        service = _lightkube_client.apply.call_args.args[0]
+        assert [(port.name, port.port, port.targetPort) for port in service.spec.ports] == [
+            ("pgbouncer", 6432, 6432),
+            ("pgbouncer-6433", 6433, 6433),
+            ("pgbouncer-6434", 6434, 6434),
+        ]
+
+    @patch("charm.PgBouncerK8sCharm.get_service")
+    @patch("charm.get_pod")
+    def test_reconcile_k8s_service_readonly(self, _get_pod, _get_service):
+        _lightkube_client = MagicMock()
+        self.charm.lightkube_client = _lightkube_client
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"readonly-listen-port": 6440})
+
+        assert self.charm.reconcile_k8s_service(port_changed=True)
+
+        readonly, main = (call.args[0] for call in _lightkube_client.apply.call_args_list)
+        assert readonly.metadata.name == "pgbouncer-k8s-readonly-service"
+        assert readonly.spec.type == main.spec.type == "ClusterIP"
+        assert [(port.name, port.port) for port in readonly.spec.ports] == [
+            ("pgbouncer-6440", 6440)
+        ]
+        assert main.metadata.name == self.charm.k8s_service_name
+        _lightkube_client.delete.assert_not_called()
+
+        # Disabled again
+        _lightkube_client.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"readonly-listen-port": 0})
+        _lightkube_client.delete.side_effect = _FakeApiError(404)
+
+        assert self.charm.reconcile_k8s_service(port_changed=True)
+
+        _lightkube_client.delete.assert_called_once_with(
+            lightkube.resources.core_v1.Service,
+            name="pgbouncer-k8s-readonly-service",
+            namespace=self.charm.model.name,
+        )
+        _lightkube_client.apply.assert_called_once()
+
+    @patch("charm.PgBouncerK8sCharm.get_service")
+    @patch("charm.get_pod")
+    def test_reconcile_k8s_service_topology_aware_routing(self, _get_pod, _get_service):
+        _lightkube_client = MagicMock()
+        self.charm.lightkube_client = _lightkube_client
+        with self.harness.hooks_disabled():
+            self.harness.update_config({
+                "topology-aware-routing": True,
+                "readonly-listen-port": 6440,
+            })
+
+        assert self.charm.reconcile_k8s_service(port_changed=True)
+
+        for call_args in _lightkube_client.apply.call_args_list:
+            service = call_args.args[0]
+            assert service.metadata.annotations == {"service.kubernetes.io/topology-mode": "Auto"}
+            # Pods without a local unit would drop the traffic from within the cluster
+            assert service.spec.internalTrafficPolicy is None
+            assert service.spec.externalTrafficPolicy is None
+
+        _lightkube_client.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_config({
+                "expose-external": "loadbalancer",
+                "loadbalancer-extra-annotations": '{"lb": "value"}',
+            })
+
+        assert self.charm.reconcile_k8s_service(port_changed=True)
+
+        for call_args in _lightkube_client.apply.call_args_list:
+            service = call_args.args[0]
+            assert service.metadata.annotations == {
+                "service.kubernetes.io/topology-mode": "Auto",
+                "lb": "value",
+            }
+            assert service.spec.externalTrafficPolicy == "Local"
+
+    @patch("charm.get_node")
+    @patch("charm.get_pod")
+    def test_get_node_hosts_topology_aware_routing(self, _get_pod, _get_node):
+        with self.harness.hooks_disabled():
+            self.harness.add_relation_unit(self.rel_id, "pgbouncer-k8s/1")
+        _get_node.side_effect = lambda unit_name, model_name: MagicMock(
+            status=MagicMock(
+                addresses=[MagicMock(type="InternalIP", address=f"node-{unit_name[-1]}")]
+            )
+        )
+
+        def pod(unit_name, model_name):
+            ready = MagicMock(type="Ready", status="True" if unit_name.endswith("0") else "False")
+            return MagicMock(status=MagicMock(conditions=[ready]))
+
+        _get_pod.side_effect = pod
+
+        assert self.charm.get_node_hosts() == {"node-0", "node-1"}
+
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"topology-aware-routing": True})
+        # The node of the unit that isn't ready doesn't route to any unit
+        assert self.charm.get_node_hosts() == {"node-0"}
+
+    @patch("charm.PgBouncerK8sCharm.reconcile_k8s_service", return_value=True)
+    @patch("charm.PgBouncerK8sCharm.render_pgb_config")
+    def test_on_config_changed_service_settings(self, _render, _reconcile_k8s_service):
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+        self.harness.update_config({"topology-aware-routing": True})
+
+        _reconcile_k8s_service.assert_called_once_with(port_changed=True)
+        _render.assert_called_once_with(restart=True)
+        assert self.charm.peers.app_databag["current_topology_aware_routing"] == "True"
+
+        # Applied already
+        _reconcile_k8s_service.reset_mock()
+        _render.reset_mock()
+        self.harness.update_config({"pool_mode": "transaction"})
+
+        _reconcile_k8s_service.assert_called_once_with(port_changed=False)
+        _render.assert_called_once_with(restart=False)
+
+    @patch("charm.PgBouncerK8sCharm.get_service")
+    def test_get_hosts_ports_readonly(self, _get_service):
+        _get_service.return_value.spec.type = "ClusterIP"
+        domain = f"{self.charm.model.name}.svc.cluster.local"
+
+        # Without a dedicated listener, read-only traffic goes to the main one
+        assert self.charm.get_hosts_ports("ro") == f"pgbouncer-k8s-service.{domain}:6432"
+
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"readonly-listen-port": 6440})
+        assert self.charm.get_hosts_ports("ro") == (
+            f"pgbouncer-k8s-readonly-service.{domain}:6440"
+        )
+        _get_service.assert_called_with("pgbouncer-k8s-readonly-service")
+        assert self.charm.get_hosts_ports("rw") == f"pgbouncer-k8s-service.{domain}:6432"
+
+        # The service is not created yet
+        _get_service.return_value = None
+        assert self.charm.get_hosts_ports("ro") == ""
+
+    def test_get_pod_endpoints(self):
+        with self.harness.hooks_disabled():
+            self.harness.add_relation_unit(self.rel_id, "pgbouncer-k8s/10")
+            self.harness.add_relation_unit(self.rel_id, "pgbouncer-k8s/2")
+
+        # Not published by default
+        assert self.charm.get_pod_endpoints("rw") == ""
+
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"publish-pod-endpoints": True})
+        domain = f"pgbouncer-k8s-endpoints.{self.charm.model.name}.svc.cluster.local"
+        assert self.charm.get_pod_endpoints("rw") == (
+            f"pgbouncer-k8s-0.{domain}:6432,"
+            f"pgbouncer-k8s-2.{domain}:6432,"
+            f"pgbouncer-k8s-10.{domain}:6432"
+        )
+        assert self.charm.get_pod_endpoints("rw", 6433).endswith(f"pgbouncer-k8s-10.{domain}:6433")
+
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"readonly-listen-port": 6440})
+        assert self.charm.get_pod_endpoints("ro").endswith(f"pgbouncer-k8s-10.{domain}:6440")
+        assert self.charm.get_pod_endpoints("rw").endswith(f"pgbouncer-k8s-10.{domain}:6432")
+
+        # The pods are not reachable from outside of the cluster
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"expose-external": "nodeport"})
+        assert self.charm.get_pod_endpoints("rw") == ""
+
+    @patch("charm.PgBouncerK8sCharm.get_service")
+    @patch("charm.get_node")
+    def test_get_hosts_ports_isolated(self, _get_node, _get_service):
+        ports = []
+        for name, node_port in (("pgbouncer", 30001), ("pgbouncer-6433", 30002)):
+            port = MagicMock()
+            port.name = name
+            port.nodePort = node_port
+            ports.append(port)
+        _get_service.return_value.spec.type = "NodePort"
+        _get_service.return_value.spec.ports = ports
+        address = MagicMock(type="ExternalIP", address="1.2.3.4")
+        _get_node.return_value.status.addresses = [address]
+
+        assert self.charm.get_hosts_ports("rw") == "1.2.3.4:30001"
+        assert self.charm.get_hosts_ports("rw", 6433) == "1.2.3.4:30002"
+        # Not allocated yet
+        assert self.charm.get_hosts_ports("rw", 6434) == ""
+
+        _get_service.return_value.spec.type = "ClusterIP"
+        assert self.charm.get_hosts_ports("ro", 6433) == (
+            f"{self.charm.k8s_service_name}.{self.charm.model.name}.svc.cluster.local:6433"
+        )
+
     @patch("charm.PgBouncerK8sCharm.get_service")
     def test_get_hosts_ports_cluster_ip(self, _get_service):
         get_service_mock, spec_mock = MagicMock(), MagicMock()
@@ -688,6 +1390,429 @@ class TestCharm(unittest.TestCase):
         assert isinstance(self.charm.unit.status, BlockedStatus)
         assert self.charm.unit.status.message == "Configuration Error. Please check the logs"
 
+    @patch(
+        "relations.backend_database.BackendDatabaseRequires.stats_user",
+        new_callable=PropertyMock,
+        return_value="pgbouncer_stats_pgbouncer_k8s",
+    )
+    @patch("charm.PgBouncerK8sCharm.get_secret", return_value="monitoring-password")
+    @patch("charm.instance_address", return_value="127.0.0.1")
+    def test_get_pool_load(self, _instance_address, _get_secret, _):
+        with FakePostgres() as fake:
+            fake.add_database("busy_db", pool_size=5, max_connections=5)
+            fake.add_database("idle_db", max_connections=10)
+            fake.apply(saturation("busy_db", waiting=3))
+            self.harness.update_config({"listen_port": fake.port})
+            readonly = {"name": f"{PGB}_readonly", "id": READONLY_SERVICE_ID, "port": fake.port}
+
+            with patch.object(self.charm, "dedicated_services", return_value=[readonly]):
+                load = self.charm.get_pool_load()
+
+                # Every instance is queried, the dedicated ones on their own port
+                services = [*self.charm._services, readonly]
+                assert load == {
+                    "clients": 8 * len(services),
+                    "servers": 6 * len(services),
+                    "waiting": 3 * len(services),
+                    # The most server connections on one instance
+                    "users": {"pgbouncer_k8s": 6},
+                    "busiest": ("busy_db", 5, 5),
+                }
+                assert fake.queries.count("SHOW POOLS") == len(services)
+                assert fake.queries.count("SHOW DATABASES") == len(services)
+                _instance_address.assert_has_calls([call(service["id"]) for service in services])
+
+                # The instances aren't reachable
+                with self.harness.hooks_disabled():
+                    self.harness.update_config({"listen_port": fake.port + 1})
+                readonly["port"] = fake.port + 1
+                assert self.charm.get_pool_load() is None
+
+        _get_secret.return_value = None
+        assert self.charm.get_pool_load() is None
+
+    @patch(
+        "relations.backend_database.BackendDatabaseRequires.stats_user",
+        new_callable=PropertyMock,
+        return_value="pgbouncer_stats_pgbouncer_k8s",
+    )
+    @patch("charm.PgBouncerK8sCharm.get_secret", return_value="monitoring-password")
+    @patch("charm.instance_address", return_value="127.0.0.1")
+    def test_get_pool_load_per_database(self, _instance_address, _get_secret, _):
+        with FakePostgres() as fake:
+            for name in ("db_1", "db_2", "db_3"):
+                fake.add_database(name, max_connections=10)
+            for database in fake.state.databases:
+                database["current_connections"] = 6
+            # Databases without a limit are never the busiest
+            fake.add_database("unlimited_db")
+            fake.state.databases[-1]["current_connections"] = 50
+            self.harness.update_config({"listen_port": fake.port})
+
+            load = self.charm.get_pool_load()
+
+        # The databases together hold more connections than the limit of any of them
+        assert load["busiest"] == ("db_1", 6, 10)
+
+    @patch("charm.PgBouncerK8sCharm.check_pgb_running", return_value=True)
+    @patch(
+        "relations.backend_database.BackendDatabaseRequires.postgres",
+        new_callable=PropertyMock,
+        return_value=MagicMock(),
+    )
+    @patch("charm.PgBouncerK8sCharm.get_pool_load")
+    def test_update_status_load(self, _get_pool_load, _postgres, _):
+        # Several databases under their own limit, holding more than it in total
+        _get_pool_load.side_effect = [
+            {"clients": 30, "servers": 24, "waiting": 0, "busiest": ("db_1", 8, 10)},
+            {"clients": 40, "servers": 20, "waiting": 20, "busiest": ("db_2", 10, 10)},
+            {"clients": 40, "servers": 20, "waiting": 20, "busiest": ("db_2", 10, 10)},
+            {"clients": 2, "servers": 2, "waiting": 0, "busiest": None},
+            None,
+        ]
+
+        self.charm.update_status(refresh_load=True)
+        assert self.charm.unit.status == ActiveStatus(
+            "clients 30, servers 24, waiting 0, busiest db_1 8/10"
+        )
+
+        # A single check with waiting clients is not saturation yet
+        self.charm.update_status(refresh_load=True)
+        assert self.charm.unit.status == ActiveStatus(
+            "clients 40, servers 20, waiting 20, busiest db_2 10/10"
+        )
+
+        self.charm.update_status(refresh_load=True)
+        saturated = ActiveStatus(
+            "Saturated: clients 40, servers 20, waiting 20, busiest db_2 10/10"
+        )
+        assert self.charm.unit.status == saturated
+
+        # Other hooks report the load last seen, without querying it
+        self.charm.update_status()
+        assert self.charm.unit.status == saturated
+        assert _get_pool_load.call_count == 3
+
+        # Without max_db_connections, no database has a limit
+        self.charm.update_status(refresh_load=True)
+        assert self.charm.unit.status == ActiveStatus("clients 2, servers 2, waiting 0")
+
+        self.charm.update_status(refresh_load=True)
+        assert self.charm.unit.status == ActiveStatus()
+
+    @patch("charm.PgBouncerK8sCharm.mark_dirty")
+    def test_rebalance_user_quotas(self, _mark_dirty):
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"max_db_connections": 40})
+            self.harness.update_relation_data(
+                self.rel_id,
+                self.charm.app.name,
+                {
+                    "pgb_dbs_config": json.dumps({
+                        "1": {"name": "db", "legacy": False},
+                        "2": {"name": "db", "legacy": False},
+                        "3": {"name": "legacy_db", "legacy": True},
+                    })
+                },
+            )
+        assert self.charm.get_user_quotas() == {
+            "relation_id_1": {"guaranteed": 10, "burst": 20},
+            "relation_id_2": {"guaranteed": 10, "burst": 20},
+        }
+
+        # Only the leader rebalances, from the load seen on update-status
+        self.charm._pool_load = {"users": {"relation_id_1": 30, "other_user": 5}}
+        self.charm.rebalance_user_quotas()
+        assert "user_usage" not in self.charm.peers.app_databag
+
+        self.harness.set_leader(True)
+        _mark_dirty.reset_mock()
+        self.charm.rebalance_user_quotas()
+        assert json.loads(self.charm.peers.app_databag["user_usage"]) == {
+            "relation_id_1": 30,
+            "relation_id_2": 0,
+        }
+        _mark_dirty.assert_called_once_with(DIRTY_CONFIG)
+        assert self.charm.get_user_quotas() == {
+            "relation_id_1": {"guaranteed": 10, "burst": 25},
+            "relation_id_2": {"guaranteed": 10, "burst": 15},
+        }
+
+        # Small moves in the usage don't rebalance
+        _mark_dirty.reset_mock()
+        self.charm._pool_load = {"users": {"relation_id_1": 31}}
+        self.charm.rebalance_user_quotas()
+        _mark_dirty.assert_not_called()
+
+    def test_get_user_quotas_per_database(self):
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"max_db_connections": 40})
+            self.harness.update_relation_data(
+                self.rel_id,
+                self.charm.app.name,
+                {
+                    "pgb_dbs_config": json.dumps({
+                        "1": {"name": "db", "legacy": False},
+                        "2": {"name": "db", "legacy": False},
+                        "3": {"name": "other_db", "legacy": False},
+                        "4": {
+                            "name": "small_db",
+                            "legacy": False,
+                            "pool": {"max-db-connections": "4"},
+                        },
+                    })
+                },
+            )
+
+        # max_db_connections limits each database, so each one splits its own budget
+        assert self.charm.get_user_quotas() == {
+            "relation_id_1": {"guaranteed": 10, "burst": 20},
+            "relation_id_2": {"guaranteed": 10, "burst": 20},
+            "relation_id_3": {"guaranteed": 20, "burst": 40},
+            "relation_id_4": {"guaranteed": 2, "burst": 4},
+        }
+
+    def test_isolated_groups(self):
+        assert self.charm.isolated_groups() == []
+
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"isolated-applications": "batch=10,reporting"})
+        batch, reporting = self.charm.isolated_groups()
+        assert batch["name"] == "pgbouncer_isolated_batch"
+        assert batch["port"] == 6433
+        assert batch["max_db_connections"] == 10
+        assert batch["pool_sizes"] == (5, 3, 3)
+        assert batch["ini_path"] == "/var/lib/pgbouncer/isolated_batch/pgbouncer.ini"
+        assert reporting["port"] == 6434
+        assert reporting["max_db_connections"] == 100
+        assert self.charm.isolated_group("reporting") == reporting
+        assert self.charm.isolated_group("other") is None
+
+        for value in ("Batch", "batch,batch", "batch=many"):
+            with self.harness.hooks_disabled():
+                self.harness.update_config({"isolated-applications": value})
+            assert not self.charm.configuration_check()
+            assert self.charm.isolated_groups() == []
+
+        # The instance ids of the isolated applications can't reach the read-only service one
+        applications = [f"app{index}" for index in range(MAX_ISOLATED_APPLICATIONS + 1)]
+        with self.harness.hooks_disabled():
+            self.harness.update_config({
+                "isolated-applications": ",".join(applications[:MAX_ISOLATED_APPLICATIONS])
+            })
+        assert self.charm.configuration_check()
+        assert self.charm.isolated_groups()[-1]["id"] == READONLY_SERVICE_ID - 1
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"isolated-applications": ",".join(applications)})
+        assert not self.charm.configuration_check()
+        assert self.charm.unit.status == BlockedStatus(
+            f"Configuration Error. {TOO_MANY_ISOLATED_APPLICATIONS_MESSAGE}"
+        )
+
+    def test_readonly_service(self):
+        assert self.charm.readonly_service() is None
+        assert self.charm.dedicated_services() == []
+
+        with self.harness.hooks_disabled():
+            self.harness.update_config({
+                "isolated-applications": "batch",
+                "readonly-listen-port": 6440,
+            })
+        readonly = self.charm.readonly_service()
+        assert readonly["name"] == "pgbouncer_readonly"
+        assert readonly["port"] == 6440
+        assert readonly["max_db_connections"] == 100
+        assert readonly["pool_sizes"] == (50, 25, 25)
+        assert [service["name"] for service in self.charm.dedicated_services()] == [
+            "pgbouncer_isolated_batch",
+            "pgbouncer_readonly",
+        ]
+
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"readonly-max-db-connections": 10})
+        assert self.charm.readonly_service()["pool_sizes"] == (5, 3, 3)
+
+        # Taken by the main listener, the isolated application and the metrics servers
+        for port in (6432, 6433, 9127, 9128):
+            with self.harness.hooks_disabled():
+                self.harness.update_config({"readonly-listen-port": port})
+            assert not self.charm.configuration_check()
+            assert self.charm.readonly_service() is None
+
+    @patch(
+        "charm.BackendDatabaseRequires.auth_user",
+        new_callable=PropertyMock,
+        return_value="auth_user",
+    )
+    @patch(
+        "charm.BackendDatabaseRequires.postgres_databag",
+        new_callable=PropertyMock,
+        return_value={"endpoints": "HOST:PORT", "read-only-endpoints": "RO_HOST:PORT"},
+    )
+    @patch(
+        "charm.BackendDatabaseRequires.relation", new_callable=PropertyMock, return_value=Mock()
+    )
+    def test_render_readonly_config(self, _backend_rel, _postgres_databag, _):
+        client_rel_id = self.harness.add_relation("database", "client")
+        with self.harness.hooks_disabled():
+            self.harness.update_config({
+                "readonly-listen-port": 6440,
+                "readonly-max-db-connections": 10,
+            })
+            self.harness.update_relation_data(
+                self.rel_id,
+                self.charm.app.name,
+                {
+                    "pgb_dbs_config": json.dumps({
+                        str(client_rel_id): {"name": "client_db", "legacy": False},
+                    })
+                },
+            )
+
+        rendered = self.charm._render_pgb_config_files()
+
+        readonly = rendered["/var/lib/pgbouncer/readonly/pgbouncer.ini"]
+        assert "client_db_readonly = host=RO_HOST dbname=client_db" in readonly
+        assert "client_db = " not in readonly
+        assert "listen_port = 6440\n" in readonly
+        assert "max_db_connections = 10\n" in readonly
+        assert "default_pool_size = 5\n" in readonly
+        # The read-only databases stay on the main listener too
+        shared = rendered["/var/lib/pgbouncer/instance_0/pgbouncer.ini"]
+        assert "client_db_readonly = host=RO_HOST" in shared
+        assert "client_db = host=HOST" in shared
+
+    @patch(
+        "charm.BackendDatabaseRequires.auth_user",
+        new_callable=PropertyMock,
+        return_value="auth_user",
+    )
+    @patch(
+        "charm.BackendDatabaseRequires.postgres_databag",
+        new_callable=PropertyMock,
+        return_value={"endpoints": "HOST:PORT", "read-only-endpoints": "RO_HOST:PORT"},
+    )
+    @patch(
+        "charm.BackendDatabaseRequires.relation", new_callable=PropertyMock, return_value=Mock()
+    )
+    def test_render_autodb_config(self, _backend_rel, _postgres_databag, _):
+        with self.harness.hooks_disabled():
+            self.harness.update_config({
+                "autodb-mode": True,
+                "autodb-idle-timeout": 600,
+                "readonly-listen-port": 6440,
+            })
+            self.harness.update_relation_data(
+                self.rel_id,
+                self.charm.app.name,
+                {
+                    "pgb_dbs_config": json.dumps({
+                        "1": {"name": "plain_db", "legacy": False},
+                        "2": {"name": "pooled_db", "legacy": False, "pool": {"pool-size": "5"}},
+                    }),
+                    "readonly_dbs": '["tenant_db"]',
+                },
+            )
+
+        rendered = self.charm._render_pgb_config_files()
+
+        shared = rendered["/var/lib/pgbouncer/instance_0/pgbouncer.ini"]
+        # The wildcard serves the databases with no settings of their own
+        assert "* = host=HOST auth_dbname=pgbouncer port=PORT auth_user=auth_user\n" in shared
+        assert "plain_db = " not in shared
+        assert "plain_db_readonly = host=RO_HOST dbname=plain_db" in shared
+        assert "pooled_db = host=HOST dbname=pooled_db port=PORT auth_user=auth_user" in shared
+        assert "tenant_db_readonly" not in shared
+        assert "autodb_idle_timeout = 600\n" in shared
+        # The read-only listener serves every database from the replicas
+        readonly = rendered["/var/lib/pgbouncer/readonly/pgbouncer.ini"]
+        assert "* = host=RO_HOST auth_dbname=pgbouncer port=PORT auth_user=auth_user\n" in readonly
+
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"autodb-mode": False})
+        rendered = self.charm._render_pgb_config_files()
+
+        shared = rendered["/var/lib/pgbouncer/instance_0/pgbouncer.ini"]
+        assert "* = " not in shared
+        assert "plain_db = host=HOST" in shared
+        assert "autodb_idle_timeout" not in shared
+
+    @patch("charm.PgBouncerK8sCharm._render_pgb_config_files")
+    def test_reconcile_dedicated_services(self, _render):
+        container = self.harness.model.unit.get_container(PGB)
+        ini_path = "/var/lib/pgbouncer/isolated_batch/pgbouncer.ini"
+        _render.return_value = {ini_path: "isolated config"}
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"isolated-applications": "batch"})
+
+        self.charm._reconcile_dedicated_services()
+
+        service = container.get_plan().services["pgbouncer_isolated_batch"]
+        assert service.startup == "enabled"
+        assert service.command == f"pgbouncer {ini_path}"
+        assert container.get_services("pgbouncer_isolated_batch")[
+            "pgbouncer_isolated_batch"
+        ].is_running()
+        assert container.pull(ini_path).read() == "isolated config"
+        assert "pebble signal HUP pgbouncer_isolated_batch" in (
+            container.pull("/etc/logrotate.d/pgbouncer").read()
+        )
+
+        # No longer isolated
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"isolated-applications": ""})
+        self.charm._reconcile_dedicated_services()
+
+        assert container.get_plan().services["pgbouncer_isolated_batch"].startup == "disabled"
+        assert not container.get_services("pgbouncer_isolated_batch")[
+            "pgbouncer_isolated_batch"
+        ].is_running()
+
+    @patch(
+        "charm.BackendDatabaseRequires.auth_user",
+        new_callable=PropertyMock,
+        return_value="auth_user",
+    )
+    @patch(
+        "charm.BackendDatabaseRequires.postgres_databag",
+        new_callable=PropertyMock,
+        return_value={"endpoints": "HOST:PORT"},
+    )
+    @patch(
+        "charm.BackendDatabaseRequires.relation", new_callable=PropertyMock, return_value=Mock()
+    )
+    def test_render_isolated_config(self, _backend_rel, _postgres_databag, _):
+        batch_rel_id = self.harness.add_relation("database", "batch")
+        web_rel_id = self.harness.add_relation("database", "web")
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"isolated-applications": "batch=10"})
+            self.harness.update_relation_data(
+                self.rel_id,
+                self.charm.app.name,
+                {
+                    "pgb_dbs_config": json.dumps({
+                        str(batch_rel_id): {"name": "batch_db", "legacy": False},
+                        str(web_rel_id): {"name": "web_db", "legacy": False},
+                    })
+                },
+            )
+
+        rendered = self.charm._render_pgb_config_files()
+
+        isolated = rendered["/var/lib/pgbouncer/isolated_batch/pgbouncer.ini"]
+        assert "batch_db = host=HOST" in isolated
+        assert "web_db" not in isolated
+        assert "listen_port = 6433\n" in isolated
+        assert "max_db_connections = 10\n" in isolated
+        assert "default_pool_size = 5\n" in isolated
+        assert "unix_socket_dir = /var/lib/pgbouncer/isolated_batch\n" in isolated
+
+        shared = rendered["/var/lib/pgbouncer/instance_0/pgbouncer.ini"]
+        assert "listen_port = 6432\n" in shared
+        # The isolated application takes no share of the shared budget
+        assert f"relation_id_{web_rel_id} = max_user_connections=100\n" in shared
+        assert f"relation_id_{batch_rel_id} =" not in shared
+
     #
     # Secrets
     #
@@ -948,3 +2073,79 @@ class TestCharm(unittest.TestCase):
             self.harness.charm._on_secret_remove(event)
             assert not event.remove_revision.called
             event = Mock()
+
+    @parameterized.expand([
+        ("update-status", set()),
+        ("logging-relation-changed", {"loki_push"}),
+        ("pgbouncer-pebble-ready", {"loki_push", "metrics_endpoint", "tls", "upgrade"}),
+        ("set-tls-private-key", {"tls"}),
+    ])
+    def test_construct_dispatch_libraries(self, hook, expected):
+        harness = Harness(PgBouncerK8sCharm)
+        self.addCleanup(harness.cleanup)
+        with patch.dict(os.environ, {"JUJU_DISPATCH_PATH": f"hooks/{hook}"}):
+            harness.begin()
+
+        constructed = {library for library in LAZY_LIBRARY_HOOKS if library in vars(harness.charm)}
+        assert constructed == expected
+
+        # Libraries are still available on first use
+        assert harness.charm.tls.get_tls_files() == (None, None, None)
+
+    @patch("charm.dispatched_hook", return_value="update-status")
+    @patch("charms.postgresql_k8s.v0.postgresql_tls.PostgreSQLTLS.get_tls_files")
+    def test_get_tls_files(self, _get_tls_files, _dispatched_hook):
+        unit_databag = self.charm.peers.unit_databag
+        unit_databag.pop("tls_enabled", None)
+        _get_tls_files.return_value = ("key", None, None)
+
+        # Read once, e.g. after an upgrade, then flagged as disabled
+        assert self.charm.get_tls_files() == ("key", None, None)
+        assert unit_databag["tls_enabled"] == "False"
+        _get_tls_files.reset_mock()
+        assert self.charm.get_tls_files() == (None, None, None)
+        _get_tls_files.assert_not_called()
+
+        # The TLS hooks read the files again
+        _dispatched_hook.return_value = "certificates-relation-changed"
+        _get_tls_files.return_value = ("key", "ca", "cert")
+        assert self.charm.get_tls_files() == ("key", "ca", "cert")
+        assert unit_databag["tls_enabled"] == "True"
+        _dispatched_hook.return_value = "update-status"
+        assert self.charm.get_tls_files() == ("key", "ca", "cert")
+
+    def test_alert_rules_and_dashboards_shared(self):
+        self.harness.set_leader(True)
+        metrics_rel_id = self.harness.add_relation("metrics-endpoint", "prometheus")
+        self.harness.add_relation_unit(metrics_rel_id, "prometheus/0")
+        dashboard_rel_id = self.harness.add_relation("grafana-dashboard", "grafana")
+        self.harness.add_relation_unit(dashboard_rel_id, "grafana/0")
+
+        alert_rules = json.loads(
+            self.harness.get_relation_data(metrics_rel_id, self.charm.app)["alert_rules"]
+        )
+        alerts = {rule.get("alert") for group in alert_rules["groups"] for rule in group["rules"]}
+        assert {
+            "PgBouncerClientsWaiting",
+            "PgBouncerClientMaxWaitHigh",
+            "PgBouncerClientMaxWaitCritical",
+            "PgBouncerPoolAtMaxDbConnections",
+            "PgBouncerInstanceSkew",
+        } <= alerts
+        records = {
+            rule.get("record") for group in alert_rules["groups"] for rule in group["rules"]
+        }
+        assert "pgbouncer_relation:client_active_connections" in records
+        scrape_jobs = json.loads(
+            self.harness.get_relation_data(metrics_rel_id, self.charm.app)["scrape_jobs"]
+        )
+        # The charm metrics are only scraped once the workload is known to serve them
+        assert len(scrape_jobs) == 1
+
+        dashboards = json.loads(
+            self.harness.get_relation_data(dashboard_rel_id, self.charm.app)["dashboards"]
+        )
+        assert sorted(dashboards["templates"]) == [
+            "file:pgbouncer-metrics",
+            "file:pgbouncer-saturation",
+        ]
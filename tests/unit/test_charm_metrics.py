@@ -0,0 +1,195 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import time
+import unittest
+from unittest.mock import patch
+
+from ops.testing import Harness
+
+from charm import PgBouncerK8sCharm
+from charm_metrics import HOOK_METRICS_INTERVAL, PYTHON
+from constants import (
+    CHARM_METRICS_DIR,
+    CHARM_METRICS_FILE,
+    CLIENT_RELATION_NAME,
+    PEER_RELATION_NAME,
+    PGB,
+)
+
+
+class TestCharmMetrics(unittest.TestCase):
+    def setUp(self):
+        self.harness = Harness(PgBouncerK8sCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.set_model_name("test-model")
+        self.harness.begin()
+        self.charm_metrics = self.harness.charm.charm_metrics
+
+    def test_render(self):
+        self.charm_metrics.record_hook("update-status", 0.5)
+        self.charm_metrics.record_hook("update-status", 0.25)
+        self.charm_metrics.record_hook("config-changed", 2.0)
+        self.charm_metrics.record_reload()
+        self.charm_metrics.record_reload()
+        self.charm_metrics.record_restart()
+        self.charm_metrics.record_deferral()
+
+        metrics = self.charm_metrics.render()
+
+        assert 'pgbouncer_charm_hook_runs_total{hook="update-status"} 2\n' in metrics
+        assert (
+            'pgbouncer_charm_hook_duration_seconds_total{hook="update-status"} 0.75\n' in metrics
+        )
+        assert 'pgbouncer_charm_last_hook_duration_seconds{hook="update-status"} 0.25\n' in metrics
+        assert 'pgbouncer_charm_hook_runs_total{hook="config-changed"} 1\n' in metrics
+        assert "pgbouncer_charm_reloads_total 2\n" in metrics
+        assert "pgbouncer_charm_restarts_total 1\n" in metrics
+        assert "pgbouncer_charm_deferrals_total 1\n" in metrics
+        assert "# TYPE pgbouncer_charm_reloads_total counter\n" in metrics
+
+    def test_config_apply_latency(self):
+        with patch("charm_metrics.time.time", side_effect=[100.0, 104.5, 110.0]):
+            self.charm_metrics.record_endpoints_change()
+            # Only the first change since the config was applied counts
+            self.charm_metrics.record_endpoints_change()
+            self.charm_metrics.record_config_applied()
+            # Applying a config without an endpoints change keeps the latency
+            self.charm_metrics.record_config_applied()
+
+        metrics = self.charm_metrics.render()
+        assert "pgbouncer_charm_endpoints_changed_timestamp_seconds 100.0\n" in metrics
+        assert "pgbouncer_charm_config_applied_timestamp_seconds 110.0\n" in metrics
+        assert "pgbouncer_charm_config_apply_latency_seconds 4.5\n" in metrics
+
+    def test_check_server(self):
+        container = self.harness.charm.unit.get_container(PGB)
+        self.harness.set_can_connect(PGB, True)
+
+        assert not self.charm_metrics.check_server(container)
+        assert not self.charm_metrics.server_available
+        assert [job.get("job_name") for job in self.harness.charm._scrape_jobs()] == [None]
+
+        container.push(PYTHON, "", make_dirs=True)
+        assert self.charm_metrics.check_server(container)
+        assert self.charm_metrics.server_available
+        assert [job.get("job_name") for job in self.harness.charm._scrape_jobs()] == [
+            None,
+            "charm",
+        ]
+        assert not self.charm_metrics.check_server(container)
+
+    def test_write(self):
+        path = self.harness.get_filesystem_root(PGB) / CHARM_METRICS_DIR[1:] / CHARM_METRICS_FILE
+        container = self.harness.charm.unit.get_container(PGB)
+
+        # Without python in the workload image, there is no server for the file
+        self.harness.set_can_connect(PGB, True)
+        self.charm_metrics.check_server(container)
+        self.charm_metrics.write("update-status", time.perf_counter())
+        assert not path.exists()
+
+        container.push(PYTHON, "", make_dirs=True)
+        self.charm_metrics.check_server(container)
+        self.harness.set_can_connect(PGB, False)
+        self.charm_metrics.write("update-status", time.perf_counter())
+        assert not path.exists()
+
+        self.harness.set_can_connect(PGB, True)
+        with patch("charm_metrics.time.time", return_value=1000.0):
+            self.charm_metrics.write("update-status", time.perf_counter())
+        assert 'pgbouncer_charm_hook_runs_total{hook="update-status"} 3' in path.read_text()
+
+        # Only the hook counters changed, so they are pushed once the interval elapsed
+        with patch("charm_metrics.time.time", return_value=1001.0):
+            self.charm_metrics.write("update-status", time.perf_counter())
+        assert 'pgbouncer_charm_hook_runs_total{hook="update-status"} 3' in path.read_text()
+        with patch("charm_metrics.time.time", return_value=1000.0 + HOOK_METRICS_INTERVAL):
+            self.charm_metrics.write("update-status", time.perf_counter())
+        assert 'pgbouncer_charm_hook_runs_total{hook="update-status"} 5' in path.read_text()
+
+        # The state metrics are pushed as soon as they change
+        self.charm_metrics.record_reload()
+        with patch("charm_metrics.time.time", return_value=1001.0 + HOOK_METRICS_INTERVAL):
+            self.charm_metrics.write(None, time.perf_counter())
+        assert "pgbouncer_charm_reloads_total 1" in path.read_text()
+
+        # Hooks are not counted outside of a dispatch
+        assert 'pgbouncer_charm_hook_runs_total{hook="update-status"} 5' in path.read_text()
+
+    def test_deferrals(self):
+        # The container isn't ready, so the charm defers config-changed
+        self.harness.set_can_connect(PGB, False)
+        self.harness.update_config({"pool_mode": "transaction"})
+        assert "pgbouncer_charm_deferrals_total 1\n" in self.charm_metrics.render()
+
+        # The deferred event runs again at the start of the next hook, and is deferred again
+        self.harness.framework.reemit()
+        assert "pgbouncer_charm_deferrals_total 2\n" in self.charm_metrics.render()
+
+    def test_server_in_layer(self):
+        charm = self.harness.charm
+
+        assert "charm_metrics_server" not in charm._pgbouncer_layer().services
+        service = charm._pgbouncer_layer(charm_metrics_server=True).services[
+            "charm_metrics_server"
+        ]
+        assert service.command.endswith(f"--directory {CHARM_METRICS_DIR} 9128")
+
+    def test_relation_info(self):
+        peer_rel_id = self.harness.add_relation(PEER_RELATION_NAME, "pgbouncer-k8s")
+        client_rel_id = self.harness.add_relation(CLIENT_RELATION_NAME, "client-app")
+        legacy_rel_id = self.harness.add_relation("db-admin", "legacy-app")
+        self.harness.update_relation_data(
+            peer_rel_id,
+            "pgbouncer-k8s",
+            {
+                "pgb_dbs_config": json.dumps({
+                    str(client_rel_id): {"name": "client_db", "legacy": False},
+                    str(legacy_rel_id): {"name": "legacy_db", "legacy": True},
+                    # Relation already gone
+                    "99": {"name": "gone_db", "legacy": False},
+                })
+            },
+        )
+
+        self.charm_metrics.update_relation_info()
+        metrics = self.charm_metrics.render()
+
+        assert (
+            f'pgbouncer_charm_relation_info{{application="client-app",database="client_db",'
+            f'endpoint="database",relation_id="{client_rel_id}",'
+            f'user="relation_id_{client_rel_id}"}} 1\n'
+        ) in metrics
+        assert (
+            f'pgbouncer_charm_relation_info{{application="legacy-app",database="legacy_db",'
+            f'endpoint="db-admin",relation_id="{legacy_rel_id}",'
+            f'user="pgbouncer_k8s_user_{legacy_rel_id}_test_model"}} 1\n'
+        ) in metrics
+        assert "gone_db" not in metrics
+
+        # The relations are only looked up again once the config changes
+        with patch.object(type(self.harness.charm), "get_relation_databases") as _get_dbs:
+            self.charm_metrics.update_relation_info()
+        _get_dbs.assert_not_called()
+
+        # Known relations aren't looked up again
+        self.harness.update_relation_data(
+            peer_rel_id,
+            "pgbouncer-k8s",
+            {
+                "pgb_dbs_config": json.dumps({
+                    str(legacy_rel_id): {"name": "legacy_db", "legacy": True},
+                })
+            },
+        )
+        relations = type(self.charm_metrics.model.relations)
+        with patch.object(
+            relations, "__getitem__", autospec=True, side_effect=relations.__getitem__
+        ) as _get:
+            self.charm_metrics.update_relation_info()
+        assert {call.args[1] for call in _get.call_args_list} == {PEER_RELATION_NAME}
+        metrics = self.charm_metrics.render()
+        assert 'application="legacy-app"' in metrics
+        assert "client_db" not in metrics
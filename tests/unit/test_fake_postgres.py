@@ -0,0 +1,115 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import unittest
+
+import psycopg2
+
+from .fake_postgres import FakePostgres, failover, lagging_replica, saturation, single_value
+
+
+class TestFakePostgres(unittest.TestCase):
+    def setUp(self):
+        self.server = FakePostgres()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.server.add_database("db_1")
+        self.server.add_database("db_2", pool_mode="transaction", pool_size=5)
+
+    def connect(self, dbname: str):
+        connection = psycopg2.connect(
+            host=self.server.host, port=self.server.port, dbname=dbname, user="pgbouncer_k8s"
+        )
+        self.addCleanup(connection.close)
+        return connection
+
+    def show(self, command: str) -> list[dict]:
+        connection = self.connect("pgbouncer")
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f"SHOW {command};")
+            columns = [column.name for column in cursor.description]
+            return [dict(zip(columns, row, strict=True)) for row in cursor.fetchall()]
+
+    def test_show_pools(self):
+        pools = self.show("POOLS")
+
+        assert [(pool["database"], pool["pool_mode"]) for pool in pools] == [
+            ("db_1", "session"),
+            ("db_2", "transaction"),
+        ]
+        assert pools[0]["cl_waiting"] == 0
+        assert pools[0]["sv_idle"] == 1
+
+    def test_saturation(self):
+        self.server.apply(saturation("db_2", waiting=7, maxwait=3))
+
+        pools = {pool["database"]: pool for pool in self.show("POOLS")}
+        assert pools["db_1"]["cl_waiting"] == 0
+        assert pools["db_2"]["cl_waiting"] == 7
+        assert pools["db_2"]["sv_active"] == 5
+        assert pools["db_2"]["sv_idle"] == 0
+        assert pools["db_2"]["maxwait"] == 3
+        stats = {row["database"]: row for row in self.show("STATS")}
+        assert stats["db_2"]["avg_wait_time"] == 3_000_000
+
+    def test_admin_commands(self):
+        connection = self.connect("pgbouncer")
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute("PAUSE db_1;")
+            cursor.execute("RECONNECT;")
+            cursor.execute("RELOAD;")
+
+        assert self.server.state.paused == {"db_1"}
+        assert self.server.state.reconnects == {"db_1": 1, "db_2": 1}
+        assert self.server.state.reloads == 1
+        databases = {row["name"]: row for row in self.show("DATABASES")}
+        assert databases["db_1"]["paused"] == 1
+        assert databases["db_2"]["paused"] == 0
+
+        with connection.cursor() as cursor:
+            cursor.execute("RESUME db_1;")
+            with self.assertRaises(psycopg2.Error):
+                cursor.execute("SELECT 1;")
+        assert self.server.state.paused == set()
+        assert self.server.queries[-2:] == ["RESUME db_1", "SELECT 1"]
+
+    def test_catalog_queries(self):
+        connection = self.connect("postgres")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT version();")
+            assert cursor.fetchone()[0].startswith("PostgreSQL 16.4")
+            cursor.execute("SELECT pg_is_in_recovery();")
+            assert cursor.fetchone()[0] is False
+            cursor.execute("SELECT current_setting('max_connections');")
+            assert cursor.fetchone()[0] == "100"
+        connection.commit()
+
+        self.server.apply(lagging_replica(12.5))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_is_in_recovery();")
+            assert cursor.fetchone()[0] is True
+            cursor.execute("SELECT EXTRACT(EPOCH FROM (now() - pg_last_xact_replay_timestamp()));")
+            assert cursor.fetchone()[0] == 12.5
+            with self.assertRaises(psycopg2.errors.FeatureNotSupported):
+                cursor.execute("SELECT * FROM pg_stat_activity;")
+        connection.rollback()
+
+    def test_failover(self):
+        self.server.state.servers.append({"database": "db_1", "state": "active"})
+        self.server.apply(failover())
+
+        assert self.show("SERVERS") == []
+        assert all(pool["sv_idle"] == 0 for pool in self.show("POOLS"))
+        assert self.server.state.in_recovery
+
+    def test_custom_handler(self):
+        self.server.add_handler(
+            r"select count\(\*\) from pg_stat_activity",
+            lambda: single_value("count", 42),
+        )
+        connection = self.connect("postgres")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_stat_activity;")
+            assert cursor.fetchone()[0] == 42
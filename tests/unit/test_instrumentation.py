@@ -0,0 +1,111 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import time
+import unittest
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
+import psycopg2
+from ops.model import _ModelBackend
+
+from instrumentation import (
+    HOOK_TOOLS,
+    K8S,
+    PEBBLE,
+    POSTGRESQL,
+    emit_hook_summary,
+    instrument_hook_tools,
+    reset_hook_summary,
+    trace_connections,
+    trace_io,
+)
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        reset_hook_summary()
+        self.addCleanup(reset_hook_summary)
+
+    def test_hook_summary(self):
+        started = time.perf_counter()
+        with trace_io(PEBBLE, "push", **{"file.path": "/tmp/file", "bytes": 3}) as span:
+            span.set_attribute("extra", True)
+        with trace_io(PEBBLE, "replan"):
+            pass
+        with self.assertRaises(RuntimeError), trace_io(K8S, "get", **{"k8s.name": None}):
+            raise RuntimeError
+
+        with self.assertLogs("instrumentation", "DEBUG") as logs:
+            summary = emit_hook_summary("config-changed", started)
+
+        assert summary[PEBBLE]["calls"] == 2
+        assert summary[K8S]["calls"] == 1
+        assert summary[POSTGRESQL] == {"calls": 0, "duration_ms": 0}
+        assert "config-changed took" in logs.output[0]
+        assert "pebble" in logs.output[0]
+        assert "postgresql" not in logs.output[0]
+
+        reset_hook_summary()
+        assert emit_hook_summary("update-status", time.perf_counter())[PEBBLE]["calls"] == 0
+
+    def test_trace_connections(self):
+        postgres = MagicMock()
+        postgres.database = "pgbouncer"
+        postgres.primary_host = "postgresql-k8s-primary"
+        connect = postgres._connect_to_database
+        connect.side_effect = [MagicMock(), psycopg2.OperationalError]
+
+        assert trace_connections(postgres) is postgres
+        postgres._connect_to_database("db", "replica")
+        with self.assertRaises(psycopg2.OperationalError):
+            postgres._connect_to_database()
+
+        connect.assert_any_call("db", "replica")
+        connect.assert_any_call(None, None)
+        assert emit_hook_summary("hook", time.perf_counter())[POSTGRESQL]["calls"] == 2
+
+    def test_instrument_hook_tools(self):
+        calls = []
+
+        class Backend:
+            @contextmanager
+            def _wrap_hookcmd(self, cmd, *args, **trace):
+                calls.append((cmd, args, trace))
+                yield
+
+        backend = Backend()
+        instrument_hook_tools(backend)
+        with backend._wrap_hookcmd("relation-get", relation_id=1):
+            pass
+        with backend._wrap_hookcmd("config-get", "--all"):
+            pass
+
+        assert calls == [("relation-get", (), {"relation_id": 1}), ("config-get", ("--all",), {})]
+        assert emit_hook_summary("hook", time.perf_counter())[HOOK_TOOLS]["calls"] == 2
+
+        # Testing backends are left alone
+        testing_backend = object()
+        with patch("instrumentation._record") as _record, self.assertNoLogs("instrumentation"):
+            instrument_hook_tools(testing_backend)
+        _record.assert_not_called()
+
+        # The backend of ops lost the private method the hook tools are timed with
+        with (
+            patch.object(_ModelBackend, "_wrap_hookcmd", None),
+            self.assertLogs("instrumentation", "WARNING"),
+        ):
+            instrument_hook_tools(_ModelBackend(unit_name="pgbouncer-k8s/0"))
+
+    def test_ops_backend_wraps_hook_tools(self):
+        # instrument_hook_tools relies on a private method of ops: if this fails, ops changed how
+        # it runs hook tools, and the pinned ops version must not be bumped until it's updated
+        backend = _ModelBackend(unit_name="pgbouncer-k8s/0")
+        assert callable(getattr(backend, "_wrap_hookcmd", None)), (
+            "ops no longer has _ModelBackend._wrap_hookcmd"
+        )
+
+        instrument_hook_tools(backend)
+        with backend._wrap_hookcmd("relation-get", relation_id=1):
+            pass
+        assert emit_hook_summary("hook", time.perf_counter())[HOOK_TOOLS]["calls"] == 1
@@ -0,0 +1,50 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import unittest
+
+from quotas import compute_quotas, usage_changed
+
+
+class TestQuotas(unittest.TestCase):
+    def test_compute_quotas_even(self):
+        assert compute_quotas(["b", "a"], 100, {}) == {
+            "a": {"guaranteed": 25, "burst": 50},
+            "b": {"guaranteed": 25, "burst": 50},
+        }
+        assert compute_quotas(["a"], 100, {"a": 80}) == {"a": {"guaranteed": 50, "burst": 100}}
+
+        # Unlimited budget, or no users
+        assert compute_quotas(["a"], 0, {}) == {}
+        assert compute_quotas([], 100, {}) == {}
+
+    def test_compute_quotas_demand(self):
+        quotas = compute_quotas(["busy", "idle", "other"], 120, {"busy": 60, "other": 30})
+
+        # Every user keeps its guaranteed share and the even headroom
+        assert {quota["guaranteed"] for quota in quotas.values()} == {20}
+        assert quotas["idle"]["burst"] == 20 + 10
+        # The rest goes by the demand above the guaranteed shares
+        assert quotas["busy"]["burst"] == 20 + 10 + 24
+        assert quotas["other"]["burst"] == 20 + 10 + 6
+        assert sum(quota["burst"] for quota in quotas.values()) <= 120
+
+    def test_compute_quotas_more_users_than_budget(self):
+        quotas = compute_quotas([f"user_{i}" for i in range(5)], 4, {})
+
+        # The guaranteed shares fit in the budget, and every user can still connect
+        assert sum(quota["guaranteed"] for quota in quotas.values()) == 4
+        assert quotas["user_4"] == {"guaranteed": 0, "burst": 1}
+        assert all(quota["burst"] == 1 for quota in quotas.values())
+
+        # Up to one user per connection, every user keeps a guaranteed connection
+        quotas = compute_quotas([f"user_{i}" for i in range(4)], 4, {})
+        assert all(quota == {"guaranteed": 1, "burst": 1} for quota in quotas.values())
+
+    def test_usage_changed(self):
+        assert not usage_changed({}, {})
+        assert not usage_changed({"a": 10}, {"a": 11})
+        assert usage_changed({"a": 10}, {"a": 12})
+        assert not usage_changed({"a": 100}, {"a": 119})
+        assert usage_changed({"a": 100}, {"a": 80})
+        assert usage_changed({"a": 10}, {"a": 10, "b": 0})
@@ -25,7 +25,7 @@ class TestUpgrade(unittest.TestCase):
         self.charm = self.harness.charm
 
     @patch("charm.PgBouncerK8sCharm.app", new_callable=PropertyMock)
-    @patch("charm.PgbouncerUpgrade._set_rolling_update_partition")
+    @patch("upgrade.PgbouncerUpgrade._set_rolling_update_partition")
     @patch("charm.PgBouncerK8sCharm.check_pgb_running")
     def test_pre_upgrade_check(self, _check_pgb_runnig, _set_partition, _app):
         _app.return_value.planned_units.return_value = 3
@@ -38,7 +38,7 @@ class TestUpgrade(unittest.TestCase):
     @patch("charm.BackendDatabaseRequires.ready", new_callable=PropertyMock, return_value=False)
     @patch("charm.BackendDatabaseRequires.postgres", new_callable=PropertyMock, return_value=True)
     @patch("charm.PgBouncerK8sCharm.app", new_callable=PropertyMock)
-    @patch("charm.PgbouncerUpgrade._set_rolling_update_partition")
+    @patch("upgrade.PgbouncerUpgrade._set_rolling_update_partition")
     @patch("charm.PgBouncerK8sCharm.check_pgb_running", return_value=False)
     def test_pre_upgrade_check_cluster_not_ready(
         self, _check_pgb_runnig: Mock, _set_partition: Mock, _app: Mock, _, _backend_ready: Mock
@@ -69,9 +69,9 @@ class TestUpgrade(unittest.TestCase):
         return_value="scram-hash",
     )
     @patch("charm.PgBouncerK8sCharm.reconcile_k8s_service")
-    @patch("charm.PgbouncerUpgrade.set_unit_completed")
-    @patch("charm.PgbouncerUpgrade._cluster_checks")
-    @patch("charm.PgbouncerUpgrade.peer_relation", new_callable=PropertyMock, return_value=None)
+    @patch("upgrade.PgbouncerUpgrade.set_unit_completed")
+    @patch("upgrade.PgbouncerUpgrade._cluster_checks")
+    @patch("upgrade.PgbouncerUpgrade.peer_relation", new_callable=PropertyMock, return_value=None)
     def test_on_pgbouncer_pebble_ready(
         self,
         _peer_relation: Mock,
@@ -120,10 +120,13 @@ class TestUpgrade(unittest.TestCase):
 
         _reconcile_k8s_service.assert_called_once_with()
 
+    @patch("charm.PgBouncerK8sCharm.drop_legacy_relation_databases")
     @patch("charm.PgBouncerK8sCharm.check_pgb_running", return_value=True)
     @patch("charm.PgBouncerK8sCharm.update_config")
-    @patch("charm.PgbouncerUpgrade.peer_relation", new_callable=PropertyMock, return_value=None)
-    def test_on_upgrade_changed(self, _peer_relation: Mock, _update_config: Mock, _):
+    @patch("upgrade.PgbouncerUpgrade.peer_relation", new_callable=PropertyMock, return_value=None)
+    def test_on_upgrade_changed(
+        self, _peer_relation: Mock, _update_config: Mock, _, _drop_legacy: Mock
+    ):
         # Early exit when no peer
         self.charm.upgrade._on_upgrade_changed(None)
 
@@ -132,10 +135,19 @@ class TestUpgrade(unittest.TestCase):
         # update_config called
         _peer_relation.return_value = Mock()
         _peer_relation.return_value.data = {self.charm.unit: {"state": "testing"}}
+        _peer_relation.return_value.units = []
 
         self.charm.upgrade._on_upgrade_changed(None)
 
         _update_config.assert_called_once_with()
+        _drop_legacy.assert_not_called()
+
+        # The upgrade finished
+        _peer_relation.return_value.data = {self.charm.unit: {"state": "idle"}}
+
+        self.charm.upgrade._on_upgrade_changed(None)
+
+        _drop_legacy.assert_called_once_with()
 
     @patch("upgrade.logger.info")
     def test_log_rollback_instructions(self, _logger: Mock):